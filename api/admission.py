@@ -0,0 +1,171 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+from api.config import LLM_MAX_CONCURRENT, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT
+
+class AdmissionRejected(Exception):
+    """Hàng đợi LLM đầy hoặc request chờ quá hạn, kèm số giây nên thử lại"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"LLM quá tải ({reason}), thử lại sau {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Giới hạn số lần sinh câu trả lời chạy đồng thời trên Ollama
+
+    Tối đa max_concurrent request được gọi LLM cùng lúc; tối đa max_queue
+    request khác chờ theo thứ tự đến (FIFO). Hàng đợi đầy thì từ chối ngay;
+    request chờ quá queue_timeout thì bỏ. Slot được trao thẳng cho request
+    chờ lâu nhất khi một request xong, không ai chen ngang được.
+
+    Việc nền (dựng FAQ index) xin slot với low_priority=True: xếp hàng
+    riêng, không giới hạn thời gian chờ, và chỉ được slot khi không còn
+    request của người dùng nào đang chờ.
+    """
+
+    FULL = "queue_full"
+    TIMEOUT = "queue_timeout"
+
+    def __init__(self, max_concurrent: int = LLM_MAX_CONCURRENT, max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT, window: int = 1000):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: deque = deque()
+        self._background: deque = deque()  # waiter ưu tiên thấp
+        self._wait_ms = deque(maxlen=window)
+        self._service_seconds: Optional[float] = None  # EWMA thời gian giữ slot
+        self.admitted = 0
+        self.queued = 0
+        self.background_admitted = 0
+        self.rejected = {self.FULL: 0, self.TIMEOUT: 0}
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Ước lượng số giây tới khi hàng đợi hiện tại chạy hết"""
+        service_seconds = self._service_seconds or self.queue_timeout
+        return max(1, math.ceil(service_seconds * (self.depth + 1) / self.max_concurrent))
+
+    async def acquire(self, low_priority: bool = False):
+        """Chờ tới lượt gọi LLM, raise AdmissionRejected nếu đầy hoặc quá hạn"""
+        if low_priority:
+            await self._acquire_background()
+            return
+
+        start_time = time.monotonic()
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self._admit(start_time)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected[self.FULL] += 1
+            raise AdmissionRejected(self.FULL, self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.max_depth = max(self.max_depth, len(self._waiters))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Slot vừa được trao đúng lúc hết hạn / bị hủy: trả lại cho người sau
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected[self.TIMEOUT] += 1
+            raise AdmissionRejected(self.TIMEOUT, self.retry_after()) from None
+
+        # release() đã giữ slot (active) cho request này
+        self._admit(start_time)
+
+    async def _acquire_background(self):
+        if self.active < self.max_concurrent and not self._waiters and not self._background:
+            self.active += 1
+            self.background_admitted += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._background.append(waiter)
+        try:
+            await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+                self._background.remove(waiter)
+            raise
+        self.background_admitted += 1
+
+    def _admit(self, start_time: float):
+        self.admitted += 1
+        self._wait_ms.append((time.monotonic() - start_time) * 1000)
+
+    def release(self, acquired_at: Optional[float] = None):
+        """Trả slot, trao cho request chờ lâu nhất nếu có (request người dùng trước việc nền)"""
+        if acquired_at is not None:
+            elapsed = time.monotonic() - acquired_at
+            self._service_seconds = elapsed if self._service_seconds is None else (
+                0.8 * self._service_seconds + 0.2 * elapsed
+            )
+
+        self.active -= 1
+        for waiters in (self._waiters, self._background):
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    self.active += 1
+                    waiter.set_result(None)
+                    return
+
+    @asynccontextmanager
+    async def slot(self, low_priority: bool = False):
+        """Giữ một slot LLM trong suốt khối lệnh (kể cả khi stream)"""
+        await self.acquire(low_priority)
+        acquired_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
+
+    def get_stats(self) -> Dict[str, Any]:
+        wait_ms = sorted(self._wait_ms)
+        stats = {
+            'active': self.active,
+            'max_concurrent': self.max_concurrent,
+            'queue_depth': self.depth,
+            'max_queue': self.max_queue,
+            'max_depth_seen': self.max_depth,
+            'queue_timeout': self.queue_timeout,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'background_queue_depth': len(self._background),
+            'background_admitted': self.background_admitted,
+            'rejected_full': self.rejected[self.FULL],
+            'rejected_timeout': self.rejected[self.TIMEOUT],
+            'service_seconds': round(self._service_seconds, 3) if self._service_seconds is not None else None,
+            'retry_after': self.retry_after()
+        }
+        if wait_ms:
+            stats.update({
+                'wait_ms_mean': round(sum(wait_ms) / len(wait_ms), 1),
+                'wait_ms_p95': round(wait_ms[min(len(wait_ms) - 1, int(len(wait_ms) * 0.95))], 1),
+                'wait_ms_max': round(wait_ms[-1], 1)
+            })
+        return stats
@@ -0,0 +1,508 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+
+from api.config import (
+    RESPONSE_CACHE_BACKEND,
+    RESPONSE_CACHE_SQLITE_PATH,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_FLUSH_EVERY,
+    RESPONSE_CACHE_FLUSH_INTERVAL,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL
+)
+
+class BaseResponseCache:
+    """Interface chung của response cache, dùng được như dict"""
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def __getitem__(self, key: str) -> str:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: str):
+        self.set(key, value)
+
+class ResponseCache(BaseResponseCache):
+    """
+    Cache câu trả lời có giới hạn
+
+    LRU theo số entry và dung lượng ước tính, mỗi entry có TTL riêng.
+    Giữ interface giống dict (len, in, keys, clear) để code cũ vẫn chạy.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 ttl: Optional[float] = RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (value, expires_at, size)
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Lấy value và cập nhật thứ tự LRU, đếm hit/miss"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        """Thêm entry, evict entry cũ nhất nếu vượt giới hạn"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        size = _estimate_size(key, value)
+
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+            # Entry lớn hơn cả cache: không lưu
+            if self.max_bytes and size > self.max_bytes:
+                return
+
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+
+            while self._data and (
+                len(self._data) > self.max_entries
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                oldest_key = next(iter(self._data))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._data.keys())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'memory',
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+class SQLiteResponseCache(BaseResponseCache):
+    """
+    Response cache dùng chung giữa các uvicorn worker
+
+    Lưu trong một file SQLite ở chế độ WAL: nhiều process đọc song song,
+    ghi được tuần tự hóa bởi SQLite. Insert và eviction chạy trong cùng một
+    transaction nên không có worker nào thấy cache vượt giới hạn.
+    Counter hit/miss/eviction cũng nằm trong file nên là số liệu toàn cục.
+
+    get() chỉ đọc (SELECT, không giữ write lock) nên các worker đọc song
+    song; counter hit/miss và thời điểm truy cập (cho LRU) được gom trong
+    process và ghi theo lô, cùng transaction với set() hoặc sau mỗi
+    RESPONSE_CACHE_FLUSH_EVERY lượt / RESPONSE_CACHE_FLUSH_INTERVAL giây.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            expires_at REAL,
+            last_access REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access);
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_SQLITE_PATH,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 ttl: Optional[float] = RESPONSE_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # sqlite3 connection không chia sẻ được giữa các thread
+        self._local = threading.local()
+        # Counter và last_access chờ ghi xuống file
+        self._pending_lock = threading.Lock()
+        self._pending_counters: Dict[str, int] = {}
+        self._pending_access: Dict[str, float] = {}
+        self._pending_count = 0
+        self._last_flush = time.monotonic()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._connection().executescript(self._SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Transaction ghi (BEGIN IMMEDIATE giữ write lock ngay từ đầu)"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _incr(conn: sqlite3.Connection, name: str, amount: int = 1):
+        conn.execute(
+            "INSERT INTO counters(name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        now = time.time()
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM responses WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Response cache error: {e}")
+            return default
+
+        # Entry hết hạn được xóa (và đếm expirations) ở lần set() kế tiếp
+        if row is None:
+            self._record("misses")
+            return default
+        self._record("hits", key, now)
+        return row[0]
+
+    def _record(self, counter: str, key: Optional[str] = None, accessed_at: Optional[float] = None):
+        with self._pending_lock:
+            self._pending_counters[counter] = self._pending_counters.get(counter, 0) + 1
+            if key is not None:
+                self._pending_access[key] = accessed_at
+            self._pending_count += 1
+            due = (self._pending_count >= RESPONSE_CACHE_FLUSH_EVERY
+                   or time.monotonic() - self._last_flush >= RESPONSE_CACHE_FLUSH_INTERVAL)
+        if due:
+            self.flush()
+
+    def _take_pending(self):
+        with self._pending_lock:
+            counters, access = self._pending_counters, self._pending_access
+            self._pending_counters, self._pending_access = {}, {}
+            self._pending_count = 0
+            self._last_flush = time.monotonic()
+        return counters, access
+
+    def _restore_pending(self, counters: Dict[str, int], access: Dict[str, float]):
+        # Ghi lỗi (vd. lock timeout): giữ lại để lần sau ghi tiếp
+        with self._pending_lock:
+            for name, amount in counters.items():
+                self._pending_counters[name] = self._pending_counters.get(name, 0) + amount
+            for key, accessed_at in access.items():
+                self._pending_access[key] = max(accessed_at, self._pending_access.get(key, accessed_at))
+            self._pending_count += sum(counters.values())
+
+    def _write_pending(self, conn: sqlite3.Connection, counters: Dict[str, int], access: Dict[str, float]):
+        for name, amount in counters.items():
+            self._incr(conn, name, amount)
+        if access:
+            conn.executemany(
+                "UPDATE responses SET last_access = MAX(last_access, ?) WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in access.items()]
+            )
+
+    def flush(self):
+        """Ghi counter hit/miss và thời điểm truy cập đang gom xuống file"""
+        counters, access = self._take_pending()
+        if not counters and not access:
+            return
+        try:
+            with self._transaction() as conn:
+                self._write_pending(conn, counters, access)
+        except sqlite3.Error as e:
+            print(f"Response cache error: {e}")
+            self._restore_pending(counters, access)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        size = len(key.encode("utf-8")) + len(value.encode("utf-8"))
+
+        if self.max_bytes and size > self.max_bytes:
+            return
+
+        counters, access = self._take_pending()
+        try:
+            with self._transaction() as conn:
+                # Ghi luôn phần đang gom trước khi evict theo last_access
+                self._write_pending(conn, counters, access)
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses(key, value, size, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, expires_at, now)
+                )
+
+                # Dọn entry hết hạn trước, sau đó evict theo LRU
+                expired = conn.execute(
+                    "DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+                ).rowcount
+                if expired:
+                    self._incr(conn, "expirations", expired)
+
+                count, total_bytes = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+
+                evicted = 0
+                while count > self.max_entries or (self.max_bytes and total_bytes > self.max_bytes):
+                    oldest = conn.execute(
+                        "SELECT key, size FROM responses ORDER BY last_access LIMIT 1"
+                    ).fetchone()
+                    conn.execute("DELETE FROM responses WHERE key = ?", (oldest[0],))
+                    count -= 1
+                    total_bytes -= oldest[1]
+                    evicted += 1
+
+                if evicted:
+                    self._incr(conn, "evictions", evicted)
+        except sqlite3.Error as e:
+            print(f"Response cache error: {e}")
+            self._restore_pending(counters, access)
+
+    def __contains__(self, key: str) -> bool:
+        row = self._connection().execute(
+            "SELECT 1 FROM responses WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def keys(self) -> List[str]:
+        rows = self._connection().execute(
+            "SELECT key FROM responses ORDER BY last_access"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def clear(self):
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM responses")
+        except sqlite3.Error as e:
+            print(f"Response cache error: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        self.flush()
+        conn = self._connection()
+        count, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'entries': count,
+            'max_entries': self.max_entries,
+            'bytes': total_bytes,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'evictions': counters.get("evictions", 0),
+            'expirations': counters.get("expirations", 0)
+        }
+
+def create_response_cache(backend: str = RESPONSE_CACHE_BACKEND) -> BaseResponseCache:
+    """Tạo response cache theo backend trong config ("memory" hoặc "sqlite")"""
+    if backend == "sqlite":
+        return SQLiteResponseCache()
+    if backend != "memory":
+        print(f"⚠️ Response cache backend không hợp lệ: {backend}, dùng 'memory'")
+    return ResponseCache()
+
+class SemanticCache:
+    """
+    Cache câu trả lời theo embedding của câu hỏi
+
+    Câu hỏi diễn đạt khác nhưng cùng ý (cosine >= threshold) dùng lại
+    câu trả lời trước đó. Embedding được giữ trong một ma trận cấp phát
+    sẵn nên bộ nhớ cố định theo max_entries; khi đầy thì evict entry
+    ít được dùng gần đây nhất.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl: Optional[float] = SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None  # (max_entries, dim), float32
+        self._answers: List[Optional[str]] = [None] * max_entries
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, embedding) -> Optional[str]:
+        """Tìm câu trả lời có câu hỏi gần nhất, None nếu không đủ giống"""
+        query = _normalize(embedding)
+
+        with self._lock:
+            if self._size == 0 or self._matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            now = time.monotonic()
+            similarities = self._matrix[:self._size] @ query
+            # Entry hết hạn không được tính
+            if self.ttl:
+                similarities[self._expires_at[:self._size] <= now] = -1.0
+
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._last_used[best] = now
+            self.hits += 1
+            return self._answers[best]
+
+    def set(self, embedding, answer: str):
+        """Lưu câu trả lời cho embedding của câu hỏi"""
+        vector = _normalize(embedding)
+
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._size = 0
+
+            now = time.monotonic()
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                # Ưu tiên ghi đè entry đã hết hạn, nếu không thì entry LRU
+                expired = np.flatnonzero(self._expires_at <= now) if self.ttl else []
+                slot = int(expired[0]) if len(expired) else int(np.argmin(self._last_used))
+                self.evictions += 1
+
+            self._matrix[slot] = vector
+            self._answers[slot] = answer
+            self._expires_at[slot] = now + self.ttl if self.ttl else np.inf
+            self._last_used[slot] = now
+
+    def __len__(self) -> int:
+        return self._size
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._answers = [None] * self.max_entries
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            matrix_bytes = self._matrix.nbytes if self._matrix is not None else 0
+            answer_bytes = sum(sys.getsizeof(a) for a in self._answers[:self._size])
+            return {
+                'entries': self._size,
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'ttl_seconds': self.ttl,
+                'bytes': matrix_bytes + answer_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+def _normalize(embedding) -> np.ndarray:
+    """Chuẩn hóa vector về độ dài 1 (float32)"""
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+def _estimate_size(key: str, value: str) -> int:
+    """Ước tính bộ nhớ của một entry (bytes)"""
+    return sys.getsizeof(key) + sys.getsizeof(value)
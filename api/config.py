@@ -1,3 +1,5 @@
+import os
+
 # API Configuration
 API_TITLE = "ZiZi AI API"
 API_DESCRIPTION = "API Trợ Lý AI Thông Minh với Qwen2.5 và Streaming SSE"
@@ -12,6 +14,38 @@ RELOAD = True
 DEFAULT_MODEL = "zizi-ai"
 MODEL_OWNER = "zizi-team"
 
+# Ollama Configuration
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+QWEN_MODEL_NAME = os.getenv("QWEN_MODEL_NAME", "qwen2.5:7b")
+
+# Ollama Client Configuration (connection pool + circuit breaker)
+OLLAMA_POOL_MAX_CONNECTIONS = 10
+OLLAMA_POOL_MAX_KEEPALIVE = 5
+OLLAMA_KEEPALIVE_EXPIRY = 60.0  # seconds
+OLLAMA_CONNECT_TIMEOUT = 2.0  # seconds
+OLLAMA_READ_TIMEOUT = 15.0  # seconds, giữa 2 lần nhận dữ liệu
+OLLAMA_HEALTH_CHECK_INTERVAL = 10.0  # seconds
+OLLAMA_BREAKER_FAILURE_THRESHOLD = 3  # lỗi liên tiếp trước khi mở breaker
+OLLAMA_BREAKER_RECOVERY_TIMEOUT = 30.0  # seconds trước khi thử lại
+
+# Giữ Qwen2.5 trong RAM/VRAM: keep_alive gửi kèm mỗi request ("30m", "24h",
+# "-1m" = không bao giờ unload) và ping định kỳ khi server rảnh; interval phải
+# ngắn hơn keep_alive (0 = tắt ping)
+OLLAMA_MODEL_KEEP_ALIVE = os.getenv("OLLAMA_MODEL_KEEP_ALIVE", "30m")
+OLLAMA_MODEL_PING_INTERVAL = 240.0  # seconds
+OLLAMA_MODEL_LOAD_TIMEOUT = 120.0  # seconds, nạp model từ đĩa có thể lâu
+OLLAMA_COLD_LOAD_THRESHOLD = 1.0  # seconds load_duration để tính là một lần nạp model
+
+# Admission Control (giới hạn số lần sinh câu trả lời đồng thời trên Ollama)
+# LLM_MAX_CONCURRENT nên bằng OLLAMA_NUM_PARALLEL của Ollama; request vượt quá
+# xếp hàng tối đa LLM_MAX_QUEUE và LLM_QUEUE_TIMEOUT giây
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", 2))
+LLM_MAX_QUEUE = 16
+LLM_QUEUE_TIMEOUT = 10.0  # seconds, ngắn hơn OLLAMA_READ_TIMEOUT để còn kịp trả lời
+# Khi quá tải: "fallback" trả câu trả lời dự phòng (HTTP 200), "reject" trả
+# HTTP 429 kèm Retry-After để client tự thử lại
+LLM_OVERLOAD_ACTION = os.getenv("LLM_OVERLOAD_ACTION", "fallback")
+
 # CORS Configuration
 CORS_ORIGINS = ["*"]
 CORS_CREDENTIALS = True
@@ -20,7 +54,42 @@ CORS_HEADERS = ["*"]
 
 # Streaming Configuration
 DEFAULT_CHUNK_SIZE = 10
-STREAM_DELAY = 0.05  # seconds
+
+# Response Cache Configuration
+# "memory": dict LRU riêng từng worker (mặc định)
+# "sqlite": file SQLite (WAL) dùng chung giữa các worker của --workers N
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_SQLITE_PATH = os.getenv("RESPONSE_CACHE_SQLITE_PATH", "./cache/response_cache.sqlite3")
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+RESPONSE_CACHE_MAX_BYTES = 16 * 1024 * 1024  # 16 MB
+RESPONSE_CACHE_TTL = 3600  # seconds, None = không hết hạn
+# SQLite: counter hit/miss + thời điểm truy cập (LRU) ghi theo lô, đọc không cần write lock
+RESPONSE_CACHE_FLUSH_EVERY = 64  # số lượt get gom lại mỗi lần ghi
+RESPONSE_CACHE_FLUSH_INTERVAL = 5.0  # seconds
+
+# Semantic Cache Configuration (cache theo embedding câu hỏi)
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_THRESHOLD = 0.92  # cosine similarity tối thiểu để dùng lại câu trả lời
+SEMANTIC_CACHE_MAX_ENTRIES = 500
+SEMANTIC_CACHE_TTL = 3600  # seconds
+
+# Generation Configuration (options gửi Ollama)
+OLLAMA_NUM_CTX = 1024  # cửa sổ context của Qwen2.5 trong Ollama
+OLLAMA_NUM_PREDICT = 150  # số token sinh tối đa, được giữ chỗ trong num_ctx
+
+# Context Configuration (ghép passage vào prompt RAG theo ngân sách token)
+# Đặt CONTEXT_TOKENIZER (vd "Qwen/Qwen2.5-7B-Instruct") để đếm đúng token của
+# Qwen2.5; mặc định ước lượng nhanh (đếm dư một chút, không cần tải tokenizer)
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER") or None
+CONTEXT_MAX_TOKENS = 600  # trần token cho context, ngoài giới hạn còn lại của num_ctx
+CONTEXT_CANDIDATES = 5  # số passage lấy từ search để chọn
+CONTEXT_MIN_PASSAGE_TOKENS = 40  # phần ngân sách còn lại nhỏ hơn thì không cắt passage để nhét vào
+CONTEXT_OVERLAP_THRESHOLD = 0.6  # tỉ lệ cụm từ trùng để coi passage là bản lặp
+CHAT_TEMPLATE_OVERHEAD_TOKENS = 16  # token đánh dấu role của chat template Qwen2.5
+
+# Single-flight: các request cùng câu hỏi (sau chuẩn hóa như cache key) tới khi
+# câu trả lời đầu tiên chưa xong sẽ chờ / nhận chung stream của nó
+SINGLE_FLIGHT_ENABLED = True
 
 # Response Configuration
 DEFAULT_MAX_TOKENS = 200
@@ -29,9 +98,76 @@ DEFAULT_TOP_P = 0.9
 
 # Knowledge Base Configuration
 SEARCH_RESULTS_LIMIT = 3
-CONTEXT_MAX_LENGTH = 300
+KB_PERSIST_DIRECTORY = "./chroma_db"
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# "torch": SentenceTransformer trên PyTorch; "onnx": ONNX Runtime, khởi động và
+# encode trên CPU nhanh hơn (export: python onnx_embedder.py export)
+EMBEDDING_RUNTIME = os.getenv("EMBEDDING_RUNTIME", "torch")
+EMBEDDING_ONNX_DIRECTORY = "./onnx_models"
+EMBEDDING_ONNX_QUANTIZE = True  # lượng tử hóa động int8 các lớp MatMul
+# Cosine tối thiểu giữa embedding ONNX và SentenceTransformer (PyTorch) trên
+# CHECK_SENTENCES; "python onnx_embedder.py check" và tests/test_onnx_embedder.py
+# thất bại nếu thấp hơn (int8 thường đạt ~0.99+, float32 ~1.0)
+EMBEDDING_ONNX_MIN_COSINE = 0.99
+QUERY_EMBEDDING_CACHE_SIZE = 2048  # số query embedding giữ trong LRU
+
+# "numpy": exact search trên ma trận mmap, nhanh hơn Chroma tới khoảng 20k chunks
+# (xem: python benchmark.py vector-store); "chroma": HNSW cho kho lớn hơn
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# Kiểu lưu ma trận của backend numpy: "float32", "float16" (1/2 bộ nhớ, nhưng
+# đổi float16 trên CPU chậm) hoặc "int8" (~1/4, scale theo từng vector, tốc độ
+# gần như float32). Với float16/int8, VECTOR_RESCORE_CANDIDATES > 0 chấm lại
+# bằng bản float32 lưu thêm trên đĩa: đĩa lớn hơn cả float32 (1.5x / 1.25x), nên
+# mặc định tắt (recall@10 không rescore: float16 ~1.0, int8 ~0.99);
+# recall đo bằng: python benchmark.py quantization
+VECTOR_PRECISION = os.getenv("VECTOR_PRECISION", "float32")
+VECTOR_RESCORE_CANDIDATES = 0
+
+# Hybrid Search (BM25 + vector, gộp bằng reciprocal-rank fusion)
+HYBRID_SEARCH_ENABLED = True
+HYBRID_CANDIDATES = 20  # số ứng viên lấy từ mỗi nguồn trước khi gộp
+RRF_K = 60
+
+# FAQ Index (câu trả lời dựng sẵn cho câu hỏi phổ biến: python build_faq_index.py)
+FAQ_INDEX_ENABLED = True
+FAQ_INDEX_DIRECTORY = "./faq_index"
+FAQ_QUESTIONS_PATH = "./faq_questions.txt"
+FAQ_MATCH_THRESHOLD = 0.92  # cosine tối thiểu giữa câu hỏi và câu hỏi FAQ
+FAQ_AUTO_REBUILD = True  # dựng lại ở nền khi version knowledge base đổi
+FAQ_SLOT_TIMEOUT = 120.0  # seconds chờ slot LLM ưu tiên thấp cho một câu hỏi, quá hạn thì bỏ qua câu đó
+FAQ_SHUTDOWN_TIMEOUT = 5.0  # seconds chờ thread dựng FAQ dừng trước khi đóng engine
+
+# Embedding Batching (gom encode query của các request đồng thời)
+EMBEDDING_BATCHING_ENABLED = True
+EMBEDDING_BATCH_MAX_SIZE = 32  # số câu tối đa mỗi batch
+EMBEDDING_BATCH_MAX_WAIT_MS = 5.0  # thời gian chờ gom batch
+
+# Ingestion Configuration
+INGEST_BATCH_SIZE = 64  # số chunk encode + ghi vào Chroma mỗi lần
+# Số process đọc một PDF upload song song trong API server; để nhỏ vì server
+# còn phục vụ search / chat. CLI ingest_documents.py dùng --workers (mặc định
+# os.cpu_count()) process, mỗi process một file
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", 2))
+PDF_PAGES_PER_SHARD = 32  # số trang mỗi process đọc một lần
+
+# Chunking: mặc định đo theo ký tự; đặt CHUNK_TOKENIZER (vd "sentence-transformers/all-MiniLM-L6-v2")
+# để đo theo token của embedding model với CHUNK_SIZE_TOKENS / CHUNK_OVERLAP_TOKENS
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER") or None
+CHUNK_SIZE_CHARS = 1000
+CHUNK_OVERLAP_CHARS = 200
+CHUNK_SIZE_TOKENS = 200  # all-MiniLM-L6-v2 chỉ nhận tối đa 256 token
+CHUNK_OVERLAP_TOKENS = 40
+CHUNK_SIZE = CHUNK_SIZE_TOKENS if CHUNK_TOKENIZER else CHUNK_SIZE_CHARS
+CHUNK_OVERLAP = CHUNK_OVERLAP_TOKENS if CHUNK_TOKENIZER else CHUNK_OVERLAP_CHARS
+
+# Upload Configuration
+UPLOAD_DIRECTORY = os.getenv("UPLOAD_DIRECTORY", "./uploads")
+UPLOAD_MAX_BYTES = 50 * 1024 * 1024  # kích thước file upload tối đa
+INGEST_JOB_HISTORY_SIZE = 100  # số job ingest giữ lại để tra cứu trạng thái
+
+# Startup Configuration
+STARTUP_WARMUP_ENABLED = True  # encode giả + dựng BM25 trước khi báo /health/ready
 
 # System Configuration
-UPTIME = "100%"
 RESPONSE_TIME = "< 1s"
 ACCURACY = "95%" 
\ No newline at end of file
@@ -0,0 +1,216 @@
+import math
+import re
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+from api.config import (
+    CONTEXT_TOKENIZER,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_MIN_PASSAGE_TOKENS,
+    CONTEXT_OVERLAP_THRESHOLD,
+    OLLAMA_NUM_CTX,
+    OLLAMA_NUM_PREDICT,
+    CHAT_TEMPLATE_OVERHEAD_TOKENS
+)
+
+# Mảnh token ước lượng: một từ (chữ/số) hoặc một ký tự không phải khoảng trắng
+_WORD_PIECE = re.compile(r'\w+|[^\w\s]|\n')
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…])\s+|\n+')
+_WORD = re.compile(r'\w+')
+
+PASSAGE_SEPARATOR = "\n\n"
+
+@lru_cache(maxsize=2)
+def _load_tokenizer(tokenizer_name: str):
+    """Tokenizer HuggingFace của LLM (tải một lần mỗi process) để đếm token prompt"""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(tokenizer_name)
+
+class TokenCounter:
+    """
+    Đếm token theo tokenizer của Qwen2.5, hoặc ước lượng nhanh khi không có
+
+    Ước lượng: từ ASCII ~4 ký tự/token, từ có dấu tiếng Việt ~3 byte UTF-8
+    /token, mỗi dấu câu / xuống dòng 1 token. Cách tính cố ý đếm dư so với
+    BPE của Qwen2.5 để prompt không vượt num_ctx.
+    """
+
+    def __init__(self, tokenizer_name: Optional[str] = CONTEXT_TOKENIZER):
+        self.tokenizer_name = tokenizer_name
+
+    @property
+    def name(self) -> str:
+        return self.tokenizer_name or "approx"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer_name:
+            return len(_load_tokenizer(self.tokenizer_name).encode(text, add_special_tokens=False))
+        return sum(self._approximate(piece) for piece in _WORD_PIECE.findall(text))
+
+    @staticmethod
+    def _approximate(piece: str) -> int:
+        if piece.isascii():
+            return math.ceil(len(piece) / 4)
+        return math.ceil(len(piece.encode('utf-8')) / 3)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cắt text còn tối đa max_tokens, ưu tiên cắt ở ranh giới câu rồi mới tới từ"""
+        if self.count(text) <= max_tokens:
+            return text
+
+        kept = []
+        used = 0
+        for sentence in _split_sentences(text):
+            length = self.count(sentence)
+            if used + length > max_tokens:
+                if not kept:
+                    # Câu đầu đã quá dài: cắt theo từ
+                    kept.append(self._truncate_words(sentence, max_tokens))
+                break
+            kept.append(sentence)
+            used += length
+        return " ".join(kept)
+
+    def _truncate_words(self, text: str, max_tokens: int) -> str:
+        words = text.split()
+        low, high = 0, len(words)
+        # Tìm nhị phân số từ dài nhất còn vừa max_tokens
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count(" ".join(words[:middle])) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return " ".join(words[:low])
+
+def _split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    """Các cụm `size` từ liên tiếp (chữ thường), dùng để phát hiện đoạn trùng"""
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+class ContextBuilder:
+    """
+    Ghép context cho prompt RAG theo ngân sách token
+
+    Passage được xét theo thứ tự điểm của search (cao trước). Câu đã có
+    trong các passage chọn trước (phần overlap giữa các chunk liền nhau)
+    bị bỏ; passage trùng gần hết bị loại. Passage không vừa ngân sách còn
+    lại được cắt theo câu nếu phần còn lại đủ CONTEXT_MIN_PASSAGE_TOKENS,
+    không thì bỏ qua để thử passage sau ngắn hơn.
+    """
+
+    def __init__(self, counter: Optional[TokenCounter] = None, max_tokens: int = CONTEXT_MAX_TOKENS,
+                 num_ctx: int = OLLAMA_NUM_CTX, num_predict: int = OLLAMA_NUM_PREDICT,
+                 min_passage_tokens: int = CONTEXT_MIN_PASSAGE_TOKENS,
+                 overlap_threshold: float = CONTEXT_OVERLAP_THRESHOLD):
+        self.counter = counter or TokenCounter()
+        self.max_tokens = max_tokens
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.min_passage_tokens = min_passage_tokens
+        self.overlap_threshold = overlap_threshold
+
+    def budget(self, fixed_tokens: int) -> int:
+        """Số token còn cho context khi phần cố định của prompt dài fixed_tokens"""
+        available = self.num_ctx - self.num_predict - fixed_tokens - CHAT_TEMPLATE_OVERHEAD_TOKENS
+        return max(0, min(self.max_tokens, available))
+
+    def build(self, passages: List[str], budget: int) -> Dict[str, Any]:
+        """
+        Returns:
+            dict: text (context đã ghép), tokens, budget, passages (số passage
+            dùng), duplicates (số passage trùng bị loại), dropped (bỏ vì hết
+            ngân sách), truncated (số passage bị cắt)
+        """
+        selected = []
+        seen: Set[Tuple[str, ...]] = set()
+        used = 0
+        summary = {'duplicates': 0, 'dropped': 0, 'truncated': 0}
+        separator_tokens = self.counter.count(PASSAGE_SEPARATOR)
+
+        for passage in passages:
+            shingles = _shingles(passage)
+            if not shingles:
+                continue
+            if len(shingles & seen) / len(shingles) >= self.overlap_threshold:
+                summary['duplicates'] += 1
+                continue
+
+            # Bỏ các câu đã xuất hiện trọn vẹn trong passage đã chọn (giữ
+            # nguyên định dạng xuống dòng nếu không câu nào bị bỏ)
+            all_sentences = _split_sentences(passage)
+            sentences = [s for s in all_sentences if not _shingles(s) <= seen]
+            text = passage.strip() if len(sentences) == len(all_sentences) else " ".join(sentences)
+            if not text:
+                summary['duplicates'] += 1
+                continue
+
+            remaining = budget - used - (separator_tokens if selected else 0)
+            length = self.counter.count(text)
+            if length > remaining:
+                if remaining < self.min_passage_tokens:
+                    summary['dropped'] += 1
+                    continue
+                text = self.counter.truncate(text, remaining)
+                if not text:
+                    summary['dropped'] += 1
+                    continue
+                length = self.counter.count(text)
+                summary['truncated'] += 1
+
+            selected.append(text)
+            seen |= _shingles(text)
+            used += length + (separator_tokens if len(selected) > 1 else 0)
+
+        return {
+            'text': PASSAGE_SEPARATOR.join(selected),
+            'tokens': used,
+            'budget': budget,
+            'passages': len(selected),
+            **summary
+        }
+
+class PromptStats:
+    """Thống kê số token prompt của các request gần đây (thread-safe)"""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.requests = 0
+        self.truncated = 0
+        self.over_context = 0
+
+    def record(self, usage: Dict[str, Any]):
+        with self._lock:
+            self.requests += 1
+            self.truncated += 1 if usage.get('truncated') else 0
+            self.over_context += 1 if usage['prompt_tokens'] > usage['prompt_limit'] else 0
+            self._recent.append((usage['prompt_tokens'], usage['context_tokens']))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = list(self._recent)
+            stats = {
+                'requests': self.requests,
+                'truncated': self.truncated,
+                'over_context': self.over_context,
+                'window': len(recent)
+            }
+        if recent:
+            prompt_tokens = sorted(tokens for tokens, _ in recent)
+            stats.update({
+                'prompt_tokens_mean': round(sum(prompt_tokens) / len(prompt_tokens), 1),
+                'prompt_tokens_p95': prompt_tokens[min(len(prompt_tokens) - 1, int(len(prompt_tokens) * 0.95))],
+                'prompt_tokens_max': prompt_tokens[-1],
+                'context_tokens_mean': round(sum(tokens for _, tokens in recent) / len(recent), 1)
+            })
+        return stats
@@ -0,0 +1,224 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional
+
+from api.config import (
+    KB_PERSIST_DIRECTORY,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_RUNTIME,
+    EMBEDDING_ONNX_DIRECTORY,
+    EMBEDDING_ONNX_QUANTIZE,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    EMBEDDING_BATCHING_ENABLED,
+    EMBEDDING_BATCH_MAX_SIZE,
+    EMBEDDING_BATCH_MAX_WAIT_MS,
+    INGEST_BATCH_SIZE,
+    PDF_EXTRACT_WORKERS,
+    PDF_PAGES_PER_SHARD,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNK_TOKENIZER,
+    HYBRID_SEARCH_ENABLED,
+    HYBRID_CANDIDATES,
+    RRF_K,
+    VECTOR_BACKEND,
+    VECTOR_PRECISION,
+    VECTOR_RESCORE_CANDIDATES
+)
+from api.utils import get_memory_usage_mb
+
+class ReadWriteLock:
+    """Lock cho phép nhiều reader chạy song song, writer chạy độc quyền"""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read_lock(self):
+        with self._cond:
+            # Ưu tiên writer đang chờ để tránh writer bị đói
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write_lock(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+class RetrievalEngine:
+    """
+    KnowledgeBase dùng chung cho cả process
+
+    Chroma client, collection và embedding model chỉ được khởi tạo một lần,
+    sau đó được chia sẻ giữa các request. Đọc (search/stats) chạy song song,
+    ghi (add/delete/clear) được khóa độc quyền.
+    
+    Với nhiều worker (--workers N) mỗi process có bản KB riêng trong bộ nhớ:
+    trước mỗi lần đọc / ghi, engine kiểm tra metadata.json và nạp lại nếu
+    process khác vừa ghi, rồi gọi on_external_change (bỏ cache, FAQ index).
+    """
+
+    def __init__(self, persist_directory: str = KB_PERSIST_DIRECTORY):
+        # Import tại đây để module có thể import mà không cần chromadb/torch
+        from knowledge_base import KnowledgeBase
+
+        self._lock = ReadWriteLock()
+        # Gọi (ngoài lock, trên thread đang đọc) sau khi nạp lại thay đổi của process khác
+        self.on_external_change: Optional[Callable[[], None]] = None
+
+        memory_before = get_memory_usage_mb()
+        start_time = time.perf_counter()
+
+        self.knowledge_base = KnowledgeBase(
+            persist_directory,
+            embedding_model_name=EMBEDDING_MODEL_NAME,
+            embedding_runtime=EMBEDDING_RUNTIME,
+            onnx_directory=EMBEDDING_ONNX_DIRECTORY,
+            onnx_quantize=EMBEDDING_ONNX_QUANTIZE,
+            query_cache_size=QUERY_EMBEDDING_CACHE_SIZE,
+            batch_queries=EMBEDDING_BATCHING_ENABLED,
+            batch_max_size=EMBEDDING_BATCH_MAX_SIZE,
+            batch_max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS,
+            ingest_batch_size=INGEST_BATCH_SIZE,
+            pdf_extract_workers=PDF_EXTRACT_WORKERS,
+            pdf_pages_per_shard=PDF_PAGES_PER_SHARD,
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            chunk_tokenizer=CHUNK_TOKENIZER,
+            hybrid_search=HYBRID_SEARCH_ENABLED,
+            hybrid_candidates=HYBRID_CANDIDATES,
+            rrf_k=RRF_K,
+            vector_backend=VECTOR_BACKEND,
+            vector_precision=VECTOR_PRECISION,
+            vector_rescore_candidates=VECTOR_RESCORE_CANDIDATES
+        )
+
+        self.init_time = time.perf_counter() - start_time
+        self.memory_mb = round(get_memory_usage_mb() - memory_before, 2)
+        self.created_at = datetime.now()
+
+    def _sync_external_changes(self):
+        """Nạp lại KB nếu process khác đã ghi (chỉ tốn một lần stat khi không đổi)"""
+        kb = self.knowledge_base
+        if not kb.has_external_changes():
+            return
+        with self._lock.write_lock():
+            if not kb.has_external_changes():
+                return
+            kb.reload()
+        if self.on_external_change is not None:
+            try:
+                self.on_external_change()
+            except Exception as e:
+                print(f"⚠️ Lỗi xử lý thay đổi KB từ process khác: {e}")
+
+    @contextmanager
+    def reading(self):
+        """Truy cập KnowledgeBase ở chế độ đọc"""
+        self._sync_external_changes()
+        with self._lock.read_lock():
+            yield self.knowledge_base
+
+    @contextmanager
+    def writing(self):
+        """Truy cập KnowledgeBase ở chế độ ghi (độc quyền)"""
+        self._sync_external_changes()
+        with self._lock.write_lock():
+            yield self.knowledge_base
+
+    def warmup(self) -> Dict[str, float]:
+        with self.reading() as kb:
+            return kb.warmup()
+
+    def encode_query(self, query: str):
+        # Chỉ dùng embedding model, không chạm tới Chroma nên không cần lock
+        return self.knowledge_base.encode_query(query)
+
+    def search(self, query: str, k: int = 5, query_embedding=None) -> List[Dict[str, Any]]:
+        with self.reading() as kb:
+            return kb.search(query, k=k, query_embedding=query_embedding)
+
+    def search_many(self, queries: List[str], k: int = 5, **kwargs) -> List[List[Dict[str, Any]]]:
+        with self.reading() as kb:
+            return kb.search_many(queries, k=k, **kwargs)
+
+    def get_kb_version(self) -> str:
+        with self.reading() as kb:
+            return kb.get_version()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self.reading() as kb:
+            return kb.get_statistics()
+
+    def get_engine_info(self) -> Dict[str, Any]:
+        """Chi phí khởi tạo và bộ nhớ của engine"""
+        return {
+            'init_time_seconds': round(self.init_time, 3),
+            'memory_delta_mb': self.memory_mb,
+            'embedding_runtime': self.knowledge_base.embedding_runtime,
+            'embedding_model_mb': _get_model_size_mb(self.knowledge_base.embedding_model),
+            'process_memory_mb': get_memory_usage_mb(),
+            'created_at': self.created_at.isoformat(),
+            'age_seconds': round((datetime.now() - self.created_at).total_seconds(), 1),
+            'query_embedding_cache': self.knowledge_base.get_query_cache_stats(),
+            'embedding_batcher': self.knowledge_base.get_batcher_stats(),
+            'lexical_index': self.knowledge_base.get_lexical_index_stats()
+        }
+
+def _get_model_size_mb(model) -> Optional[float]:
+    """Tính kích thước tham số của model (MB)"""
+    if hasattr(model, 'model_size_mb'):
+        return model.model_size_mb  # OnnxEmbedder: kích thước file .onnx
+    try:
+        total_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+        return round(total_bytes / (1024 * 1024), 2)
+    except Exception:
+        return None
+
+# Engine duy nhất của process
+_engine: Optional[RetrievalEngine] = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> RetrievalEngine:
+    """Lấy (hoặc khởi tạo lần đầu) engine dùng chung"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RetrievalEngine()
+    return _engine
+
+def get_engine_if_ready() -> Optional[RetrievalEngine]:
+    """Engine hiện tại, hoặc None nếu chưa khởi tạo"""
+    return _engine
+
+def shutdown_engine():
+    """Giải phóng engine khi app tắt"""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.knowledge_base.close()
+        _engine = None
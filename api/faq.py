@@ -0,0 +1,321 @@
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable
+
+import numpy as np
+
+from api.config import FAQ_INDEX_DIRECTORY, FAQ_MATCH_THRESHOLD
+
+try:
+    import fcntl
+except ImportError:  # Windows: không khóa giữa các process
+    fcntl = None
+
+def load_questions(path: str) -> List[Dict[str, str]]:
+    """
+    Đọc danh sách câu hỏi FAQ
+
+    - .txt: mỗi dòng một câu hỏi (bỏ dòng trống và dòng bắt đầu bằng #)
+    - .json: list câu hỏi, hoặc list {"question", "answer"} với answer là
+      câu trả lời đã duyệt tay (dùng nguyên văn, không gọi LLM)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith('.json'):
+            items = json.load(f)
+        else:
+            items = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+    questions = []
+    for item in items:
+        if isinstance(item, str):
+            item = {'question': item}
+        questions.append({key: item[key] for key in ('question', 'answer') if item.get(key)})
+    return questions
+
+class FAQIndex:
+    """
+    Câu trả lời dựng sẵn cho các câu hỏi phổ biến, tra theo embedding
+
+    Mỗi câu hỏi được chạy qua đúng pipeline retrieval + Qwen2.5 lúc dựng;
+    câu trả lời lưu cùng embedding câu hỏi (float16, đã chuẩn hóa) và
+    version của knowledge base. Khi version KB đổi, index bị coi là cũ và
+    không được dùng cho tới khi dựng lại.
+
+    Các worker của server (--workers N) dùng chung thư mục index:
+    <directory>.build.lock cho một process sinh câu trả lời tại một thời
+    điểm (process khác chờ rồi nạp bản vừa dựng), <directory>.lock chỉ giữ
+    trong lúc kiểm tra lại version và thay thư mục. Thư mục mới được ghi
+    riêng rồi đổi tên vào chỗ cũ nên đọc index không cần khóa.
+    """
+
+    def __init__(self, directory: str = FAQ_INDEX_DIRECTORY, threshold: float = FAQ_MATCH_THRESHOLD):
+        self.directory = os.path.normpath(directory)
+        self.threshold = threshold
+        self.lock_path = self.directory + ".lock"
+        self.build_lock_path = self.directory + ".build.lock"
+        self.index_path = os.path.join(self.directory, "index.json")
+        self.embeddings_path = os.path.join(self.directory, "embeddings.npy")
+
+        # (ma trận embedding, entries) thay cùng lúc khi dựng lại
+        self._snapshot = (None, [])
+        self.questions: List[Dict[str, str]] = []
+        self.kb_version: Optional[str] = None
+        self.embedding_model: Optional[str] = None
+        self.built_at: Optional[str] = None
+        self.stale = True
+
+        self._build_lock = threading.Lock()
+        self._refresh_pending = False
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+        self.load()
+
+    @contextmanager
+    def _file_lock(self, path: str, stop: Optional[threading.Event] = None):
+        """
+        Khóa độc quyền giữa các process (flock trên path), chờ tới khi có
+
+        Có stop: thử lại định kỳ thay vì chặn, yield False nếu stop được đặt trước khi có khóa.
+        """
+        if fcntl is None:
+            yield True
+            return
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        with open(path, 'a') as f:
+            if stop is None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if stop.wait(0.5):
+                            yield False
+                            return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self) -> bool:
+        """
+        Nạp index đã lưu, không khóa (không chặn khi process khác đang dựng)
+
+        Thư mục chỉ bị thay bằng rename: mở cả hai file rồi kiểm tra thư mục
+        vẫn là thư mục lúc bắt đầu, nếu vừa bị thay thì đọc lại.
+        """
+        for _ in range(3):
+            try:
+                directory_inode = os.stat(self.directory).st_ino
+                with open(self.index_path, 'rb') as index_file, open(self.embeddings_path, 'rb') as embeddings_file:
+                    if os.stat(self.directory).st_ino != directory_inode:
+                        continue
+                    index = json.load(index_file)
+                    matrix = np.load(embeddings_file)
+            except FileNotFoundError:
+                # Chưa có index, hoặc process khác đang đổi tên thư mục
+                continue
+            self.questions = index['questions']
+            self.kb_version = index['kb_version']
+            self.embedding_model = index['embedding_model']
+            self.built_at = index['built_at']
+            self._snapshot = (matrix, index['entries'])
+            return True
+        return False
+
+    def _save(self):
+        """Ghi index vào thư mục tạm rồi đổi tên thay thư mục cũ (gọi khi giữ <directory>.lock)"""
+        matrix, entries = self._snapshot
+        temp_directory = f"{self.directory}.tmp-{os.getpid()}"
+        old_directory = f"{self.directory}.old-{os.getpid()}"
+        shutil.rmtree(temp_directory, ignore_errors=True)
+        os.makedirs(temp_directory)
+
+        np.save(os.path.join(temp_directory, "embeddings.npy"), matrix)
+        with open(os.path.join(temp_directory, "index.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                'kb_version': self.kb_version,
+                'embedding_model': self.embedding_model,
+                'built_at': self.built_at,
+                'questions': self.questions,
+                'entries': entries
+            }, f, ensure_ascii=False, indent=2)
+
+        # Không đổi tên đè được thư mục khác rỗng: chuyển bản cũ sang bên rồi mới xóa
+        if os.path.exists(self.directory):
+            os.replace(self.directory, old_directory)
+        os.replace(temp_directory, self.directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+
+    def __len__(self) -> int:
+        return len(self._snapshot[1])
+
+    def validate(self, kb_version: str, embedding_model: str) -> bool:
+        """Đánh dấu index còn dùng được hay không theo version KB hiện tại"""
+        self.stale = not (self._snapshot[0] is not None
+                          and self.kb_version == kb_version
+                          and self.embedding_model == embedding_model)
+        return not self.stale
+
+    def invalidate(self):
+        """Knowledge base vừa thay đổi: ngừng dùng index cho tới khi dựng lại"""
+        self.stale = True
+
+    def match(self, embedding) -> Optional[str]:
+        """Câu trả lời của câu hỏi FAQ gần nhất, None nếu không đủ giống hoặc index cũ"""
+        matrix, entries = self._snapshot
+        if self.stale or matrix is None or not entries or matrix.shape[1] != len(embedding):
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        similarities = matrix @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entries[best]['answer']
+
+    def build(self, questions: List[Dict[str, str]], encode: Callable[[List[str]], np.ndarray],
+              answer: Callable[[str], Optional[str]], kb_version: str,
+              embedding_model: str) -> Dict[str, int]:
+        """
+        Dựng lại index từ danh sách câu hỏi và lưu xuống đĩa
+
+        Câu hỏi có answer sẵn (đã duyệt) được dùng nguyên văn; các câu khác
+        gọi answer(question). Câu không có câu trả lời (LLM lỗi, không tìm
+        được context) bị bỏ qua thay vì lưu câu trả lời dự phòng.
+        """
+        with self._file_lock(self.build_lock_path):
+            matrix, entries, summary = self._build(questions, encode, answer)
+            with self._file_lock(self.lock_path):
+                self._install(matrix, entries, questions, kb_version, embedding_model)
+        return summary
+
+    def _build(self, questions: List[Dict[str, str]], encode: Callable[[List[str]], np.ndarray],
+               answer: Callable[[str], Optional[str]], stop: Optional[threading.Event] = None):
+        """
+        Sinh câu trả lời và embedding, không giữ khóa thư mục: (ma trận, entries, summary)
+
+        Trả về None nếu stop được đặt (kiểm tra giữa các câu hỏi).
+        """
+        entries = []
+        summary = {'vetted': 0, 'generated': 0, 'skipped': 0}
+        for item in questions:
+            if stop is not None and stop.is_set():
+                return None
+            if item.get('answer'):
+                source = 'vetted'
+                text = item['answer']
+            else:
+                source = 'generated'
+                text = answer(item['question'])
+            if not text:
+                summary['skipped'] += 1
+                continue
+            entries.append({'question': item['question'], 'answer': text, 'source': source})
+            summary[source] += 1
+
+        if stop is not None and stop.is_set():
+            return None
+        if entries:
+            embeddings = np.asarray(encode([entry['question'] for entry in entries]), dtype=np.float32)
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+            matrix = embeddings.astype(np.float16)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float16)
+        return matrix, entries, summary
+
+    def _install(self, matrix: np.ndarray, entries: List[Dict[str, str]], questions: List[Dict[str, str]],
+                 kb_version: str, embedding_model: str):
+        """Dùng index vừa dựng và lưu xuống đĩa (gọi khi giữ <directory>.lock)"""
+        self._snapshot = (matrix, entries)
+        self.questions = list(questions)
+        self.kb_version = kb_version
+        self.embedding_model = embedding_model
+        self.built_at = datetime.now().isoformat()
+        self.stale = False
+        self.rebuilds += 1
+        self._save()
+
+    def refresh(self, engine, answer: Callable[[str], Optional[str]], rebuild: bool = True,
+                stop: Optional[threading.Event] = None) -> Optional[Dict[str, int]]:
+        """
+        Kiểm tra index theo version KB hiện tại, dựng lại nếu đã cũ và
+        rebuild=True (gọi từ thread nền vì mỗi câu hỏi là một lần gọi LLM)
+
+        Chỉ một lần dựng chạy tại một thời điểm; lệnh refresh đến trong lúc
+        đang dựng được gộp thành một lần kiểm tra lại sau khi dựng xong.
+        Nếu process khác đang dựng thì chờ nó xong và dùng lại kết quả.
+        Câu trả lời được sinh ngoài <directory>.lock; khóa chỉ giữ để kiểm
+        tra lại version KB rồi thay thư mục. Đặt stop (server tắt) thì dừng
+        giữa các câu hỏi và không lưu kết quả dở.
+        """
+        self._refresh_pending = True
+        if not self._build_lock.acquire(blocking=False):
+            return None
+
+        summary = None
+        try:
+            while self._refresh_pending and not (stop is not None and stop.is_set()):
+                self._refresh_pending = False
+                kb_version = engine.get_kb_version()
+                embedding_model = engine.knowledge_base.embedding_model_name
+                # Index trên đĩa có thể đã được process khác dựng cho version này
+                if self.validate(kb_version, embedding_model) or (self.load() and self.validate(kb_version, embedding_model)):
+                    continue
+                if not self.questions or not rebuild:
+                    continue
+                with self._file_lock(self.build_lock_path, stop) as locked:
+                    if not locked:
+                        break
+                    # Worker khác có thể vừa dựng xong cho đúng version này
+                    self.load()
+                    if self.validate(kb_version, embedding_model):
+                        print(f"❓ FAQ index cho KB version {kb_version} đã được process khác dựng")
+                        continue
+                    questions = self.questions
+                    print(f"❓ Dựng lại FAQ index ({len(questions)} câu hỏi) cho KB version {kb_version}...")
+                    built = self._build(questions, engine.knowledge_base.encode_queries, answer, stop)
+                    if built is None:
+                        print("❓ Server đang tắt, dừng dựng FAQ index")
+                        summary = None
+                        break
+                    matrix, entries, summary = built
+                    with self._file_lock(self.lock_path):
+                        if engine.get_kb_version() != kb_version:
+                            # KB đổi trong lúc sinh câu trả lời: bỏ kết quả, kiểm tra lại
+                            print("❓ KB đổi trong lúc dựng FAQ index, dựng lại")
+                            self._refresh_pending = True
+                            summary = None
+                            continue
+                        self._install(matrix, entries, questions, kb_version, embedding_model)
+                print(f"❓ FAQ index: {summary}")
+        finally:
+            self._build_lock.release()
+        return summary
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'stale': self.stale,
+            'kb_version': self.kb_version,
+            'built_at': self.built_at,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'rebuilds': self.rebuilds,
+            'rebuilding': self._build_lock.locked()
+        }
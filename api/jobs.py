@@ -0,0 +1,216 @@
+import asyncio
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable, BinaryIO
+
+from api.config import UPLOAD_DIRECTORY, UPLOAD_MAX_BYTES, INGEST_JOB_HISTORY_SIZE
+
+SUPPORTED_UPLOAD_EXTENSIONS = ('.pdf', '.txt')
+
+class UploadTooLargeError(Exception):
+    """File upload vượt quá UPLOAD_MAX_BYTES"""
+    pass
+
+def store_upload(file: BinaryIO, filename: str, upload_directory: str = UPLOAD_DIRECTORY,
+                 max_bytes: int = UPLOAD_MAX_BYTES) -> str:
+    """
+    Lưu file upload vào thư mục riêng (giữ nguyên tên file để làm tên tài liệu)
+
+    Chép theo từng khối, dừng và xóa file nếu vượt max_bytes.
+    """
+    directory = os.path.join(upload_directory, uuid.uuid4().hex)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, filename)
+
+    written = 0
+    with open(path, 'wb') as f:
+        while True:
+            block = file.read(1024 * 1024)
+            if not block:
+                break
+            written += len(block)
+            if written > max_bytes:
+                f.close()
+                shutil.rmtree(directory, ignore_errors=True)
+                raise UploadTooLargeError(f"File vượt quá {max_bytes // (1024 * 1024)} MB")
+            f.write(block)
+    return path
+
+def remove_upload(path: str, upload_directory: str = UPLOAD_DIRECTORY) -> bool:
+    """
+    Xóa thư mục riêng của file upload sau khi ingest xong
+
+    Nội dung đã nằm trong knowledge base nên không cần giữ file gốc; chỉ xóa
+    thư mục do store_upload tạo (con trực tiếp của upload_directory).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if os.path.dirname(directory) != os.path.abspath(upload_directory):
+        return False
+    shutil.rmtree(directory, ignore_errors=True)
+    return True
+
+class IngestJob:
+    """Trạng thái một lần nạp tài liệu"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+    def __init__(self, path: str, filename: str):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.filename = filename
+        self.status = self.QUEUED
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.progress: Dict[str, Any] = {}
+        self.summary: Optional[Dict[str, int]] = None
+        self.error: Optional[str] = None
+
+    def update_progress(self, stats: Dict[str, Any]):
+        # Gọi từ thread ingest; gán cả dict nên reader luôn thấy snapshot trọn vẹn
+        self.progress = stats
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'progress': self.progress,
+            'summary': self.summary,
+            'error': self.error
+        }
+
+class IngestionQueue:
+    """
+    Hàng đợi ingest chạy nền trong API server
+
+    Một worker asyncio lấy job theo thứ tự. Trích xuất, chunk và embedding
+    chạy trên một thread riêng (không chiếm event loop hay threadpool của
+    request); mỗi batch ghi Chroma giữ write lock của engine trong thời gian
+    ngắn nên search vẫn chạy xen kẽ trong lúc ingest file lớn. File upload
+    trong upload_directory bị xóa khi job kết thúc (kể cả khi lỗi).
+    """
+
+    def __init__(self, engine, on_complete: Optional[Callable[[], None]] = None,
+                 history_size: int = INGEST_JOB_HISTORY_SIZE,
+                 upload_directory: str = UPLOAD_DIRECTORY):
+        self.engine = engine
+        self.on_complete = on_complete
+        self.history_size = history_size
+        self.upload_directory = upload_directory
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+        self._worker = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Dừng worker; job đang chạy được để chạy nốt trên thread của nó"""
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def submit(self, path: str, filename: str) -> IngestJob:
+        """Đưa file đã lưu vào hàng đợi ingest"""
+        job = IngestJob(path, filename)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim_history()
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _trim_history(self):
+        # Chỉ bỏ các job đã kết thúc, job đang chờ/chạy luôn tra cứu được
+        finished = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status not in (IngestJob.QUEUED, IngestJob.RUNNING)
+        ]
+        for job_id in finished[:max(0, len(self._jobs) - self.history_size)]:
+            del self._jobs[job_id]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            job.status = IngestJob.RUNNING
+            job.started_at = datetime.now()
+
+            try:
+                summary = await loop.run_in_executor(self._executor, self._ingest, job)
+            except Exception as e:
+                job.status = IngestJob.FAILED
+                job.error = str(e)
+            else:
+                job.summary = summary
+                job.status = IngestJob.COMPLETED if summary is not None else IngestJob.SKIPPED
+                if summary and (summary['added'] or summary['moved'] or summary['removed']) and self.on_complete:
+                    # Câu trả lời đã cache có thể dựa trên nội dung cũ; lỗi ở
+                    # callback không được làm dừng worker (job sau sẽ kẹt trong hàng đợi)
+                    try:
+                        self.on_complete()
+                    except Exception as e:
+                        print(f"Ingest on_complete error ({job.filename}): {e}")
+            finally:
+                job.finished_at = datetime.now()
+                remove_upload(job.path, self.upload_directory)
+
+    def _ingest(self, job: IngestJob) -> Optional[Dict[str, int]]:
+        """Chạy trên thread ingest: extract → chunk → embed → ghi theo batch"""
+        kb = self.engine.knowledge_base
+        document_name, source_hash = kb.get_source_info(job.path)
+        # Metadata có thể đang được ghi (hoặc nạp lại từ worker khác): kiểm tra dưới read lock
+        with self.engine.reading():
+            if kb.is_document_current(document_name, source_hash):
+                return None
+
+        if job.path.lower().endswith('.pdf'):
+            text_chunks = kb.pdf_processor.iter_pdf_chunks(job.path)
+        else:
+            text_chunks = kb.pdf_processor.iter_txt_chunks(job.path)
+
+        return kb.add_documents(
+            text_chunks,
+            document_name,
+            source_hash=source_hash,
+            progress_callback=job.update_progress,
+            write_guard=self.engine.writing
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            **{status: statuses.count(status) for status in (
+                IngestJob.QUEUED, IngestJob.RUNNING, IngestJob.COMPLETED,
+                IngestJob.SKIPPED, IngestJob.FAILED
+            )}
+        }
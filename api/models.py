@@ -31,6 +31,13 @@ class HealthResponse(BaseModel):
     timestamp: str
     uptime: str
 
+class ReadinessResponse(BaseModel):
+    status: str
+    timestamp: str
+    uptime: str
+    checks: Dict[str, Any]
+    startup: Dict[str, Any] = {}
+
 class StatsResponse(BaseModel):
     total_documents: int
     total_chunks: int
@@ -38,6 +45,28 @@ class StatsResponse(BaseModel):
     uptime: str
     response_time: str
     accuracy: str
+    engine: Optional[Dict[str, Any]] = None
+    ollama: Optional[Dict[str, Any]] = None
+    ingestion: Optional[Dict[str, Any]] = None
+    prompt: Optional[Dict[str, Any]] = None
+    admission: Optional[Dict[str, Any]] = None
+
+class CacheStatsResponse(BaseModel):
+    response_cache: Dict[str, Any]
+    semantic_cache: Dict[str, Any]
+    faq_index: Optional[Dict[str, Any]] = None
+    single_flight: Optional[Dict[str, Any]] = None
+
+class JobResponse(BaseModel):
+    id: str
+    filename: str
+    status: str
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    progress: Dict[str, Any] = {}
+    summary: Optional[Dict[str, int]] = None
+    error: Optional[str] = None
 
 class ModelInfo(BaseModel):
     id: str
@@ -0,0 +1,375 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, Any, AsyncGenerator
+
+import httpx
+
+from api.config import (
+    OLLAMA_BASE_URL,
+    QWEN_MODEL_NAME,
+    OLLAMA_POOL_MAX_CONNECTIONS,
+    OLLAMA_POOL_MAX_KEEPALIVE,
+    OLLAMA_KEEPALIVE_EXPIRY,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_READ_TIMEOUT,
+    OLLAMA_HEALTH_CHECK_INTERVAL,
+    OLLAMA_BREAKER_FAILURE_THRESHOLD,
+    OLLAMA_BREAKER_RECOVERY_TIMEOUT,
+    OLLAMA_MODEL_KEEP_ALIVE,
+    OLLAMA_MODEL_PING_INTERVAL,
+    OLLAMA_MODEL_LOAD_TIMEOUT,
+    OLLAMA_COLD_LOAD_THRESHOLD
+)
+
+class OllamaError(Exception):
+    """Lỗi khi gọi Ollama (không kết nối được, HTTP lỗi, stream đứt)"""
+    pass
+
+class CircuitBreaker:
+    """
+    Circuit breaker cho Ollama
+
+    - closed: gọi bình thường
+    - open: bỏ qua Ollama, trả fallback ngay cho tới khi hết recovery_timeout
+    - half_open: cho đúng một request thử, thành công thì đóng lại
+
+    Health check (/api/tags) chỉ đóng lại được breaker mở vì lỗi kết nối;
+    breaker mở vì /api/chat lỗi (thiếu model, HTTP 500...) phải chờ request thử.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = OLLAMA_BREAKER_FAILURE_THRESHOLD,
+                 recovery_timeout: float = OLLAMA_BREAKER_RECOVERY_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._connection_failures_only = True  # các lỗi liên tiếp đều là lỗi kết nối
+        self.total_failures = 0
+        self.total_rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        """True nếu được phép gọi Ollama"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.total_rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        self._state = self.CLOSED
+        self._failures = 0
+        self._trial_in_flight = False
+        self._connection_failures_only = True
+
+    def record_recovery(self):
+        """Ollama lại nhận kết nối (health check OK): chỉ xóa các lỗi kết nối"""
+        with self._lock:
+            if self._failures and self._connection_failures_only:
+                self._close()
+
+    def record_failure(self, connection: bool = False):
+        with self._lock:
+            self._failures += 1
+            self._connection_failures_only = self._connection_failures_only and connection
+            self.total_failures += 1
+            state = self._current_state()
+            if state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if state != self.OPEN:
+                    self.times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self._current_state(),
+                'consecutive_failures': self._failures,
+                'total_failures': self.total_failures,
+                'total_rejected': self.total_rejected,
+                'times_opened': self.times_opened
+            }
+
+# Breaker dùng chung cho cả client async và đường gọi đồng bộ trong scripts
+ollama_breaker = CircuitBreaker()
+
+def _percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+class GenerationMetrics:
+    """
+    Thời gian prefill / decode / nạp model theo số liệu Ollama trả về
+
+    Lấy từ response cuối (done) của /api/chat: prompt_eval_count,
+    prompt_eval_duration (prefill), eval_count, eval_duration (decode),
+    load_duration (nạp model; lớn nghĩa là model đã bị unload). Thời gian
+    của Ollama tính bằng nanosecond.
+    """
+
+    def __init__(self, window: int = 1000, cold_load_threshold: float = OLLAMA_COLD_LOAD_THRESHOLD):
+        self.cold_load_threshold = cold_load_threshold
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.generations = 0
+        self.cold_loads = 0
+
+    def record(self, result: Dict[str, Any]):
+        if "prompt_eval_duration" not in result and "eval_duration" not in result:
+            return
+        sample = (
+            result.get("prompt_eval_count", 0),
+            result.get("prompt_eval_duration", 0) / 1e6,
+            result.get("eval_count", 0),
+            result.get("eval_duration", 0) / 1e6,
+            result.get("load_duration", 0) / 1e6
+        )
+        with self._lock:
+            self.generations += 1
+            if sample[4] >= self.cold_load_threshold * 1000:
+                self.cold_loads += 1
+            self._recent.append(sample)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = list(self._recent)
+            stats = {'generations': self.generations, 'cold_loads': self.cold_loads, 'window': len(recent)}
+        if not recent:
+            return stats
+
+        prompt_tokens = [sample[0] for sample in recent]
+        prefill_ms = [sample[1] for sample in recent]
+        eval_tokens = sum(sample[2] for sample in recent)
+        eval_ms = sum(sample[3] for sample in recent)
+        stats.update({
+            'prompt_eval_count_mean': round(sum(prompt_tokens) / len(recent), 1),
+            'prefill_ms_mean': round(sum(prefill_ms) / len(recent), 1),
+            'prefill_ms_p95': round(_percentile(prefill_ms, 0.95), 1),
+            'prefill_tokens_per_second': round(sum(prompt_tokens) / (sum(prefill_ms) / 1000), 1) if sum(prefill_ms) else None,
+            'decode_tokens_per_second': round(eval_tokens / (eval_ms / 1000), 1) if eval_ms else None,
+            'load_ms_max': round(max(sample[4] for sample in recent), 1)
+        })
+        return stats
+
+# Số liệu prefill dùng chung cho client async và đường gọi đồng bộ
+ollama_metrics = GenerationMetrics()
+
+class OllamaClient:
+    """
+    Client async tới Ollama với connection pool keep-alive
+
+    Sức khỏe Ollama được kiểm tra định kỳ ở background thay vì gọi
+    /api/tags trước mỗi lần sinh câu trả lời. Khi server rảnh quá
+    OLLAMA_MODEL_PING_INTERVAL, một request rỗng tới /api/generate giữ
+    model trong bộ nhớ để request sau không phải chờ nạp lại model.
+    """
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, breaker: CircuitBreaker = None,
+                 model: str = QWEN_MODEL_NAME, keep_alive: str = OLLAMA_MODEL_KEEP_ALIVE,
+                 ping_interval: float = OLLAMA_MODEL_PING_INTERVAL):
+        self.base_url = base_url
+        self.breaker = breaker or ollama_breaker
+        self.metrics = ollama_metrics
+        self.model = model
+        self.keep_alive = keep_alive
+        self.ping_interval = ping_interval
+        self.healthy: Optional[bool] = None
+        self.last_health_check: Optional[float] = None
+        self.last_model_ping: Optional[float] = None
+        self.model_pings = 0
+        self._last_request: Optional[float] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Mở connection pool và chạy health check nền"""
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(
+                max_connections=OLLAMA_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                OLLAMA_READ_TIMEOUT,
+                connect=OLLAMA_CONNECT_TIMEOUT
+            )
+        )
+        await self.check_health()
+        self._health_task = asyncio.create_task(self._health_loop())
+        if self.ping_interval:
+            # Lần ping đầu chạy ngay: nạp model trước request đầu tiên
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+
+    async def close(self):
+        """Dừng health check, ping giữ model và đóng pool"""
+        for task in (self._health_task, self._keepalive_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._health_task = None
+        self._keepalive_task = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(OLLAMA_HEALTH_CHECK_INTERVAL)
+            await self.check_health()
+
+    async def _keepalive_loop(self):
+        while True:
+            idle = self._last_request is None or time.monotonic() - self._last_request >= self.ping_interval
+            if self.healthy and idle:
+                await self.keep_model_loaded()
+            await asyncio.sleep(self.ping_interval)
+
+    async def keep_model_loaded(self) -> bool:
+        """
+        Gửi /api/generate không có prompt: Ollama nạp model (nếu chưa) và
+        đặt lại thời hạn keep_alive, không sinh token nào
+        """
+        try:
+            response = await self._client.post(
+                "/api/generate",
+                json={"model": self.model, "keep_alive": self.keep_alive},
+                timeout=httpx.Timeout(OLLAMA_MODEL_LOAD_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT)
+            )
+        except httpx.HTTPError as e:
+            print(f"Ollama keep-alive ping error: {e}")
+            return False
+
+        self._last_request = time.monotonic()
+        self.last_model_ping = time.time()
+        self.model_pings += 1
+        return response.status_code == 200
+
+    async def check_health(self) -> bool:
+        """Ping /api/tags và cập nhật trạng thái breaker"""
+        try:
+            response = await self._client.get("/api/tags", timeout=OLLAMA_CONNECT_TIMEOUT)
+            self.healthy = response.status_code == 200
+        except httpx.HTTPError:
+            self.healthy = False
+
+        self.last_health_check = time.time()
+        if self.healthy:
+            self.breaker.record_recovery()
+        else:
+            self.breaker.record_failure(connection=True)
+        return self.healthy
+
+    def is_available(self) -> bool:
+        """True nếu pool đã mở và breaker cho phép gọi Ollama"""
+        return self._client is not None and self.breaker.allow_request()
+
+    async def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Gọi /api/chat (không stream) và trả về JSON kết quả"""
+        self._last_request = time.monotonic()
+        try:
+            response = await self._client.post("/api/chat", json={**payload, "stream": False})
+            if response.status_code != 200:
+                raise OllamaError(f"HTTP {response.status_code}")
+            result = response.json()
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            self.breaker.record_failure(connection=True)
+            raise OllamaError(str(e)) from e
+        except (httpx.HTTPError, ValueError) as e:
+            self.breaker.record_failure()
+            raise OllamaError(str(e)) from e
+        except OllamaError:
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success()
+        self.metrics.record(result)
+        return result
+
+    async def stream_chat(self, payload: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Gọi /api/chat ở chế độ stream, yield từng dòng NDJSON đã parse
+
+        Raise OllamaError nếu kết nối lỗi hoặc stream đứt trước khi "done".
+        """
+        self._last_request = time.monotonic()
+        try:
+            async with self._client.stream("POST", "/api/chat", json={**payload, "stream": True}) as response:
+                if response.status_code != 200:
+                    raise OllamaError(f"HTTP {response.status_code}")
+
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise OllamaError(data["error"])
+
+                    if data.get("done"):
+                        self.breaker.record_success()
+                        self.metrics.record(data)
+                        yield data
+                        return
+
+                    yield data
+
+            # Kết nối đóng trước khi nhận được "done"
+            raise OllamaError("Stream kết thúc bất thường")
+
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            self.breaker.record_failure(connection=True)
+            raise OllamaError(str(e)) from e
+        except (httpx.HTTPError, ValueError) as e:
+            self.breaker.record_failure()
+            raise OllamaError(str(e)) from e
+        except OllamaError:
+            self.breaker.record_failure()
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'base_url': self.base_url,
+            'healthy': self.healthy,
+            'last_health_check': self.last_health_check,
+            'model': self.model,
+            'keep_alive': self.keep_alive,
+            'model_pings': self.model_pings,
+            'last_model_ping': self.last_model_ping,
+            'breaker': self.breaker.get_stats(),
+            'generation': self.metrics.get_stats()
+        }
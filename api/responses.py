@@ -1,16 +1,63 @@
 # Import logic từ app hiện tại
-from knowledge_base import KnowledgeBase
+from api.engine import get_engine
+from api.config import (
+    OLLAMA_BASE_URL,
+    QWEN_MODEL_NAME,
+    OLLAMA_POOL_MAX_CONNECTIONS,
+    OLLAMA_POOL_MAX_KEEPALIVE,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_READ_TIMEOUT,
+    SEMANTIC_CACHE_ENABLED,
+    FAQ_INDEX_ENABLED,
+    FAQ_QUESTIONS_PATH,
+    FAQ_AUTO_REBUILD,
+    FAQ_SLOT_TIMEOUT,
+    OLLAMA_NUM_CTX,
+    OLLAMA_NUM_PREDICT,
+    OLLAMA_MODEL_KEEP_ALIVE,
+    CONTEXT_CANDIDATES,
+    LLM_OVERLOAD_ACTION,
+    SINGLE_FLIGHT_ENABLED
+)
+from api.admission import AdmissionController, AdmissionRejected
+from api.singleflight import SingleFlight
+from api.context import ContextBuilder, PromptStats
+from api.ollama_client import OllamaClient, OllamaError, ollama_breaker, ollama_metrics
+from api.cache import create_response_cache, SemanticCache
+from api.faq import FAQIndex, load_questions
+import asyncio
+import concurrent.futures
 import os
+import threading
+import time
 import requests
-import json
-from typing import Optional
+from contextlib import asynccontextmanager, contextmanager
+from requests.adapters import HTTPAdapter
+from typing import Optional, AsyncGenerator
 
-# Cấu hình Ollama - Tối ưu tốc độ
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-QWEN_MODEL_NAME = os.getenv("QWEN_MODEL_NAME", "qwen2.5:7b")
+# Session keep-alive cho đường gọi đồng bộ (scripts, test_speed.py)
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(
+    pool_connections=OLLAMA_POOL_MAX_KEEPALIVE,
+    pool_maxsize=OLLAMA_POOL_MAX_CONNECTIONS
+))
 
-# Cache cho responses phổ biến (tăng tốc độ)
-RESPONSE_CACHE = {}
+# Cache cho responses phổ biến (tăng tốc độ) - LRU có giới hạn + TTL,
+# backend chọn trong config (memory hoặc sqlite dùng chung giữa workers)
+RESPONSE_CACHE = create_response_cache()
+
+# Cache theo embedding câu hỏi cho các câu diễn đạt khác nhưng cùng ý
+SEMANTIC_CACHE = SemanticCache()
+
+# Câu trả lời dựng sẵn cho câu hỏi phổ biến, chỉ dùng khi khớp version KB
+FAQ_INDEX = FAQIndex() if FAQ_INDEX_ENABLED else None
+
+# Gộp các request cùng câu hỏi đang chạy: chỉ một lần retrieval + gọi LLM
+INFLIGHT = SingleFlight() if SINGLE_FLIGHT_ENABLED else None
+
+# Ghép context theo ngân sách token của num_ctx + thống kê token prompt
+CONTEXT_BUILDER = ContextBuilder()
+PROMPT_STATS = PromptStats()
 
 # SMART_RESPONSES dictionary (để tương thích với import cũ)
 SMART_RESPONSES = {
@@ -20,35 +67,54 @@ SMART_RESPONSES = {
     "register": "📝 Đăng ký tài khoản siêu dễ với 5 bước đơn giản!"
 }
 
-# System prompt ngắn gọn hơn - Tối ưu tốc độ
+# System prompt dùng chung cho mọi đường gọi (có/không context, FAQ) và không
+# chứa gì thay đổi theo request: Ollama dùng lại KV cache của phần prefix
+# giống hệt từng byte này, chỉ phải prefill phần context + câu hỏi phía sau
 SYSTEM_PROMPT = """Bạn là AI Assistant của KOC Support.
 
-NHIỆM VỤ: Trả lời ngắn gọn, thân thiện về hỗ trợ khách hàng
+NHIỆM VỤ: Trả lời ngắn gọn, chính xác, thân thiện về hỗ trợ khách hàng
 
 PHONG CÁCH:
 - Dùng "mình" thay "tôi"
-- Emoji phù hợp 
-- Tối đa 350 từ
+- Emoji phù hợp
+- Tối đa 100 từ
 - Hướng dẫn cụ thể
 
+CÁCH TRẢ LỜI:
+- Nếu có phần "Context", dựa vào context để trả lời
+- Chỉ trả lời đúng câu hỏi được hỏi, không đưa thông tin thừa
+
 CHỦ ĐỀ: đăng ký, đăng nhập, thanh toán, lỗi app, bảo mật."""
 
+# User message của đường RAG: phần thay đổi theo request nằm sau system prompt
+CONTEXT_PROMPT_TEMPLATE = """Context:
+{context}
+
+Câu hỏi: {question}"""
+
 def check_ollama_connection() -> bool:
     """Kiểm tra kết nối Ollama - Timeout ngắn hơn"""
     try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=2)  # Giảm từ 5s xuống 2s
+        response = _session.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=OLLAMA_CONNECT_TIMEOUT)
         return response.status_code == 200
     except:
         return False
 
-def get_smart_response(question: str) -> str:
-    """AI thông minh với cache và tối ưu tốc độ"""
+def get_smart_response(question: str, knowledge_base=None) -> str:
+    """
+    AI thông minh với cache và tối ưu tốc độ
+    
+    Args:
+        question: Câu hỏi của user
+        knowledge_base: Retrieval engine dùng chung (mặc định lấy engine của process)
+    """
     question_lower = question.lower()
     
     # 1. Kiểm tra cache trước (siêu nhanh)
     cache_key = question_lower.strip()
-    if cache_key in RESPONSE_CACHE:
-        return RESPONSE_CACHE[cache_key]
+    cached_response = RESPONSE_CACHE.get(cache_key)
+    if cached_response is not None:
+        return cached_response
     
     # 2. Quick pattern matching cho câu hỏi phổ biến
     quick_response = get_quick_pattern_response(question_lower)
@@ -56,61 +122,263 @@ def get_smart_response(question: str) -> str:
         RESPONSE_CACHE[cache_key] = quick_response
         return quick_response
     
-    # 3. Tìm kiếm trong knowledge base với multiple search terms
+    # 3. Semantic cache, nếu miss thì tìm context trong knowledge base
+    semantic_response, prompt, query_embedding = _prepare_generation(question, knowledge_base)
+    if semantic_response is not None:
+        RESPONSE_CACHE[cache_key] = semantic_response
+        return semantic_response
+    
+    # 4. Gọi Qwen2.5 qua Ollama
+    response = _generate(prompt)
+    if response is None:
+        return get_fallback_response(question)
+    
+    _remember_response(cache_key, query_embedding, response)
+    return response
+
+async def get_smart_response_async(question: str, knowledge_base=None,
+                                   client: Optional[OllamaClient] = None,
+                                   admission: Optional[AdmissionController] = None) -> str:
+    """
+    Phiên bản async của get_smart_response dùng connection pool của OllamaClient
+    
+    Chỉ bước gọi LLM phải xếp hàng qua admission; cache / FAQ trả lời ngay.
+    """
+    question_lower = question.lower()
+    
+    # 1. Cache và quick pattern
+    cache_key = question_lower.strip()
+    cached_response = RESPONSE_CACHE.get(cache_key)
+    if cached_response is not None:
+        return cached_response
+    
+    quick_response = get_quick_pattern_response(question_lower)
+    if quick_response:
+        RESPONSE_CACHE[cache_key] = quick_response
+        return quick_response
+    
+    # 2. Cùng câu hỏi đang được trả lời: chờ kết quả đó thay vì retrieval + gọi LLM lần nữa
+    if INFLIGHT is not None:
+        parts = [delta async for delta in INFLIGHT.subscribe(
+            cache_key, lambda: _answer_once(question, cache_key, knowledge_base, client, admission)
+        )]
+        return "".join(parts)
+    return await _answer_async(question, cache_key, knowledge_base, client, admission)
+
+async def _answer_async(question: str, cache_key: str, knowledge_base=None,
+                        client: Optional[OllamaClient] = None,
+                        admission: Optional[AdmissionController] = None) -> str:
+    """Retrieval + gọi Qwen2.5 cho câu hỏi chưa có trong exact cache"""
+    # Encode + retrieval là CPU-bound nên chạy trong thread pool
+    semantic_response, prompt, query_embedding = await _run_in_thread(
+        _prepare_generation, question, knowledge_base
+    )
+    if semantic_response is not None:
+        RESPONSE_CACHE[cache_key] = semantic_response
+        return semantic_response
+    
+    # Gọi Qwen2.5 qua connection pool async, chờ slot nếu LLM đang bận
     try:
-        knowledge_base = KnowledgeBase()
-        context_docs = []
-        
-        # Thử nhiều search terms cho câu hỏi về chiến dịch
-        if any(word in question_lower for word in ["chiến dịch", "campaign"]):
-            search_terms = [
-                question,  # Original question
-                "chiến dịch review sản phẩm",  # Specific campaign type
-                "loại chiến dịch",  # Types of campaigns
-                "CÁC LOẠI CHIẾN DỊCH"  # Exact heading
-            ]
-            
-            for term in search_terms:
-                docs = knowledge_base.search(term, k=2)
-                context_docs.extend(docs)
-                # Nếu tìm được kết quả tốt (distance < 0.82), dừng tìm kiếm
-                if docs and docs[0].get('distance', 1.0) < 0.82:
-                    break
-        else:
-            # Search thông thường cho các câu hỏi khác
-            context_docs = knowledge_base.search(question, k=2)
-        
-        if context_docs:
-            # Loại bỏ duplicate và lấy unique content
-            unique_contents = []
-            seen_contents = set()
-            for doc in context_docs:
-                content_key = doc['content'][:100]  # First 100 chars as key
-                if content_key not in seen_contents:
-                    unique_contents.append(doc['content'][:800])  # Tăng lên 800 để thấy đủ 3 loại
-                    seen_contents.add(content_key)
-            
-            context_text = "\n".join(unique_contents)
+        async with _llm_slot(admission):
+            response = await _generate_async(prompt, client)
+    except AdmissionRejected as e:
+        return _overloaded(question, e)
+    if response is None:
+        return get_fallback_response(question)
+    
+    _remember_response(cache_key, query_embedding, response)
+    return response
+
+async def _answer_once(question: str, cache_key: str, knowledge_base=None,
+                       client: Optional[OllamaClient] = None,
+                       admission: Optional[AdmissionController] = None) -> AsyncGenerator[str, None]:
+    """_answer_async dạng stream một đoạn, để request streaming cũng nhận chung được"""
+    yield await _answer_async(question, cache_key, knowledge_base, client, admission)
+
+async def stream_smart_response(question: str, knowledge_base=None,
+                                client: Optional[OllamaClient] = None,
+                                admission: Optional[AdmissionController] = None) -> AsyncGenerator[str, None]:
+    """
+    Phiên bản streaming của get_smart_response
+    
+    Yield từng đoạn text ngay khi Ollama sinh ra. Response chỉ được cache
+    khi stream hoàn tất trọn vẹn.
+    """
+    question_lower = question.lower()
+    
+    # 1. Cache và quick pattern trả về nguyên văn
+    cache_key = question_lower.strip()
+    cached_response = RESPONSE_CACHE.get(cache_key)
+    if cached_response is not None:
+        yield cached_response
+        return
+    
+    quick_response = get_quick_pattern_response(question_lower)
+    if quick_response:
+        RESPONSE_CACHE[cache_key] = quick_response
+        yield quick_response
+        return
+    
+    # 2. Cùng câu hỏi đang được trả lời: nhận chung stream token (phát lại phần đã sinh)
+    produce = lambda: _stream_answer(question, cache_key, knowledge_base, client, admission)
+    deltas = INFLIGHT.subscribe(cache_key, produce) if INFLIGHT is not None else produce()
+    async for delta in deltas:
+        yield delta
+
+async def _stream_answer(question: str, cache_key: str, knowledge_base=None,
+                         client: Optional[OllamaClient] = None,
+                         admission: Optional[AdmissionController] = None) -> AsyncGenerator[str, None]:
+    """Retrieval + stream token từ Qwen2.5 cho câu hỏi chưa có trong exact cache"""
+    # 1. Semantic cache + retrieval
+    semantic_response, prompt, query_embedding = await _run_in_thread(
+        _prepare_generation, question, knowledge_base
+    )
+    if semantic_response is not None:
+        RESPONSE_CACHE[cache_key] = semantic_response
+        yield semantic_response
+        return
+    
+    # 2. Stream token từ Ollama; slot LLM (xếp hàng nếu đang bận) giữ tới khi stream xong
+    try:
+        async with _llm_slot(admission):
+            # Breaker có thể đã mở trong lúc xếp hàng: kiểm tra sau khi có slot,
+            # trả fallback ngay, không chạm tới Ollama
+            if client is None or not client.is_available():
+                yield get_fallback_response(question)
+                return
             
-            enhanced_prompt = f"""Bạn là AI Assistant của KOC Support. Trả lời ngắn gọn và chính xác.
+            parts = []
+            try:
+                async for data in client.stream_chat(_build_ollama_payload(prompt, stream=True)):
+                    delta = data.get("message", {}).get("content", "")
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            except OllamaError as e:
+                print(f"Ollama stream error: {e}")
+                if not parts:
+                    # Chưa gửi gì cho client: trả lời bằng fallback
+                    yield get_fallback_response(question)
+                else:
+                    # Đã gửi một phần: kết thúc gọn, không cache câu trả lời dở dang
+                    yield "\n\n😅 Kết nối tới AI bị gián đoạn, bạn thử hỏi lại giúp mình nhé!"
+                return
+    
+            response = "".join(parts).strip()
+            if response:
+                _remember_response(cache_key, query_embedding, response)
+            else:
+                yield get_fallback_response(question)
+    except AdmissionRejected as e:
+        yield _overloaded(question, e)
 
-Context: {context_text}
+@asynccontextmanager
+async def _llm_slot(admission: Optional[AdmissionController]):
+    """Giữ một slot của admission controller (không giới hạn nếu không có)"""
+    if admission is None:
+        yield
+        return
+    async with admission.slot():
+        yield
 
-Câu hỏi: {question}
+def _overloaded(question: str, error: AdmissionRejected) -> str:
+    """LLM quá tải: câu trả lời dự phòng, hoặc raise để endpoint trả HTTP 429"""
+    print(f"LLM admission: {error}")
+    if LLM_OVERLOAD_ACTION == "reject":
+        raise error
+    return get_fallback_response(question)
 
-Trả lời chỉ về câu hỏi được hỏi, không đưa thông tin thừa. Tối đa 100 từ."""
+async def _run_in_thread(func, *args):
+    """Chạy hàm đồng bộ trong default executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, func, *args)
 
-            response = get_ollama_response(enhanced_prompt)
-            RESPONSE_CACHE[cache_key] = response
-            return response
-            
+def _prepare_generation(question: str, knowledge_base=None):
+    """
+    Chuẩn bị trước khi gọi LLM: encode câu hỏi, tra FAQ index và semantic cache, build prompt
+    
+    Returns:
+        (câu trả lời từ FAQ index / semantic cache hoặc None, prompt, embedding của câu hỏi)
+    """
+    try:
+        if knowledge_base is None:
+            knowledge_base = get_engine()
     except Exception as e:
         print(f"Knowledge base error: {e}")
+        return None, question, None
+    
+    query_embedding = None
+    if SEMANTIC_CACHE_ENABLED or FAQ_INDEX is not None:
+        try:
+            # Embedding này được dùng lại cho search, không encode 2 lần
+            query_embedding = knowledge_base.encode_query(question)
+            
+            faq_response = FAQ_INDEX.match(query_embedding) if FAQ_INDEX is not None else None
+            if faq_response is not None:
+                return faq_response, None, query_embedding
+            
+            cached_response = SEMANTIC_CACHE.get(query_embedding) if SEMANTIC_CACHE_ENABLED else None
+            if cached_response is not None:
+                return cached_response, None, query_embedding
+        except Exception as e:
+            print(f"FAQ index / semantic cache error: {e}")
     
-    # 4. Dùng Qwen2.5 qua Ollama
-    response = get_ollama_response(question)
+    return None, build_prompt(question, knowledge_base, query_embedding), query_embedding
+
+def _remember_response(cache_key: str, query_embedding, response: str):
+    """Lưu câu trả lời của LLM vào exact cache và semantic cache"""
     RESPONSE_CACHE[cache_key] = response
-    return response
+    if query_embedding is not None:
+        SEMANTIC_CACHE.set(query_embedding, response)
+
+def build_prompt(question: str, knowledge_base=None, query_embedding=None) -> str:
+    """
+    Tìm context trong knowledge base và ghép thành prompt cho Qwen2.5
+    
+    Context được ghép từ các passage điểm cao nhất, không trùng lặp, vừa
+    phần num_ctx còn lại sau system prompt, câu hỏi và num_predict.
+    """
+    counter = CONTEXT_BUILDER.counter
+    # Tìm kiếm trong knowledge base: một lần hybrid search (BM25 + vector)
+    # bắt được cả từ khóa tiếng Việt như "chiến dịch" mà embedding bỏ sót
+    try:
+        if knowledge_base is None:
+            knowledge_base = get_engine()
+        
+        context_docs = knowledge_base.search(question, k=CONTEXT_CANDIDATES, query_embedding=query_embedding)
+        
+        if context_docs:
+            fixed_tokens = counter.count(SYSTEM_PROMPT) + counter.count(
+                CONTEXT_PROMPT_TEMPLATE.format(context="", question=question)
+            )
+            context = CONTEXT_BUILDER.build(
+                [doc['content'] for doc in context_docs], CONTEXT_BUILDER.budget(fixed_tokens)
+            )
+            
+            if context['text']:
+                _record_prompt_usage(fixed_tokens + context['tokens'], context)
+                return CONTEXT_PROMPT_TEMPLATE.format(context=context['text'], question=question)
+            
+    except Exception as e:
+        print(f"Knowledge base error: {e}")
+    
+    # Không có context: hỏi thẳng Qwen2.5
+    _record_prompt_usage(counter.count(SYSTEM_PROMPT) + counter.count(question))
+    return question
+
+def _record_prompt_usage(prompt_tokens: int, context: Optional[dict] = None):
+    """Ghi nhận số token prompt (system + user, chưa tính chat template) của một request"""
+    usage = {
+        'prompt_tokens': prompt_tokens,
+        'context_tokens': context['tokens'] if context else 0,
+        'truncated': context['truncated'] if context else 0,
+        'prompt_limit': OLLAMA_NUM_CTX - OLLAMA_NUM_PREDICT
+    }
+    PROMPT_STATS.record(usage)
+    if context:
+        print(f"🧮 Prompt {prompt_tokens} tokens ({CONTEXT_BUILDER.counter.name}): context "
+              f"{context['tokens']}/{context['budget']}, {context['passages']} passages, "
+              f"{context['duplicates']} trùng, {context['truncated']} cắt, {context['dropped']} bỏ")
 
 def get_quick_pattern_response(question_lower: str) -> Optional[str]:
     """Pattern matching nhanh cho câu hỏi phổ biến"""
@@ -122,53 +390,77 @@ def get_quick_pattern_response(question_lower: str) -> Optional[str]:
     # Loại bỏ tất cả hardcode patterns khác - để AI tự trả lời
     return None
 
+def _build_ollama_payload(user_message: str, stream: bool) -> dict:
+    """Payload tối ưu tốc độ cho Ollama /api/chat"""
+    return {
+        "model": QWEN_MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_message}
+        ],
+        "stream": stream,
+        "keep_alive": OLLAMA_MODEL_KEEP_ALIVE,
+        "options": {
+            "temperature": 0.3,      # Giảm từ 0.7 - ít ngẫu nhiên hơn
+            "num_predict": OLLAMA_NUM_PREDICT,
+            "top_p": 0.8,           # Giảm từ 0.9 - tập trung hơn
+            "num_ctx": OLLAMA_NUM_CTX,  # Context được ghép vừa cửa sổ này
+            "repeat_penalty": 1.1    # Tránh lặp từ
+        }
+    }
+
 def get_ollama_response(user_message: str) -> str:
-    """Gọi Qwen2.5 qua Ollama API - Tối ưu tốc độ"""
+    """Gọi Qwen2.5 qua Ollama API - Tối ưu tốc độ (đồng bộ, dùng cho scripts)"""
+    return _generate(user_message) or get_fallback_response(user_message)
+
+async def get_ollama_response_async(user_message: str, client: Optional[OllamaClient]) -> str:
+    """Gọi Qwen2.5 qua connection pool async của OllamaClient"""
+    return await _generate_async(user_message, client) or get_fallback_response(user_message)
+
+def _generate(user_message: str) -> Optional[str]:
+    """Sinh câu trả lời qua session keep-alive, None nếu Ollama lỗi"""
     
-    # Kiểm tra kết nối Ollama nhanh
-    if not check_ollama_connection():
-        return get_fallback_response(user_message)
+    # Breaker đang mở: bỏ qua Ollama, không cần probe /api/tags
+    if not ollama_breaker.allow_request():
+        return None
     
     try:
-        # Payload tối ưu tốc độ
-        payload = {
-            "model": QWEN_MODEL_NAME,
-            "messages": [
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_message}
-            ],
-            "stream": False,
-            "options": {
-                "temperature": 0.3,      # Giảm từ 0.7 - ít ngẫu nhiên hơn
-                "num_predict": 150,      # Tăng từ 80 lên 150 để đủ content
-                "top_p": 0.8,           # Giảm từ 0.9 - tập trung hơn
-                "num_ctx": 1024,        # Giới hạn context
-                "repeat_penalty": 1.1    # Tránh lặp từ
-            }
-        }
-        
-        # Gọi Ollama API với timeout ngắn
-        response = requests.post(
+        response = _session.post(
             f"{OLLAMA_BASE_URL}/api/chat",
-            json=payload,
-            timeout=15  # Giảm từ 30s xuống 15s
+            json=_build_ollama_payload(user_message, stream=False),
+            timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
         )
         
-        if response.status_code == 200:
-            result = response.json()
-            ai_response = result.get("message", {}).get("content", "").strip()
-            
-            if ai_response:
-                return ai_response
-            else:
-                return get_fallback_response(user_message)
-        else:
-            return get_fallback_response(user_message)
-            
-    except requests.RequestException:
-        return get_fallback_response(user_message)
-    except Exception:
-        return get_fallback_response(user_message)
+        if response.status_code != 200:
+            ollama_breaker.record_failure()
+            return None
+        
+        result = response.json()
+        ollama_breaker.record_success()
+        ollama_metrics.record(result)
+        
+    except requests.ConnectionError:
+        ollama_breaker.record_failure(connection=True)
+        return None
+    except (requests.RequestException, ValueError):
+        ollama_breaker.record_failure()
+        return None
+    
+    return result.get("message", {}).get("content", "").strip() or None
+
+async def _generate_async(user_message: str, client: Optional[OllamaClient]) -> Optional[str]:
+    """Sinh câu trả lời qua OllamaClient, None nếu Ollama lỗi hoặc breaker mở"""
+    
+    # Breaker đang mở hoặc chưa có client: không gọi Ollama
+    if client is None or not client.is_available():
+        return None
+    
+    try:
+        result = await client.chat(_build_ollama_payload(user_message, stream=False))
+    except OllamaError:
+        return None
+    
+    return result.get("message", {}).get("content", "").strip() or None
 
 def get_fallback_response(question: str) -> str:
     """Fallback responses khi Ollama không khả dụng"""
@@ -284,11 +576,104 @@ def test_ollama_connection():
         print("   • ollama list")
         return False
 
+def generate_faq_answer(question: str, knowledge_base=None,
+                        admission: Optional[AdmissionController] = None,
+                        loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[str]:
+    """
+    Chạy pipeline retrieval + Qwen2.5 cho một câu hỏi FAQ (không qua cache)
+    
+    Trả về None nếu không tìm được context hoặc Ollama lỗi, để FAQ index
+    không lưu câu trả lời không có căn cứ hay câu trả lời dự phòng. Trong
+    server, lần gọi LLM giữ một slot ưu tiên thấp của admission (loop là
+    event loop sở hữu admission, hàm này chạy trên thread nền); chờ slot
+    quá FAQ_SLOT_TIMEOUT thì bỏ qua câu hỏi.
+    """
+    prompt = build_prompt(question, knowledge_base)
+    if prompt == question:
+        return None
+    with _background_llm_slot(admission, loop) as acquired:
+        if not acquired:
+            print(f"⚠️ FAQ: hết {FAQ_SLOT_TIMEOUT:.0f}s chờ slot LLM, bỏ qua: {question}")
+            return None
+        return _generate(prompt)
+
+async def _acquire_background(admission: AdmissionController, timeout: float):
+    # Hết hạn trên loop: acquire bị hủy, slot vừa được trao đúng lúc đó được trả lại
+    await asyncio.wait_for(admission.acquire(low_priority=True), timeout)
+
+@contextmanager
+def _background_llm_slot(admission: Optional[AdmissionController],
+                         loop: Optional[asyncio.AbstractEventLoop],
+                         timeout: float = FAQ_SLOT_TIMEOUT):
+    """Giữ slot ưu tiên thấp của admission từ một thread ngoài event loop, yield False nếu quá hạn"""
+    if admission is None or loop is None:
+        yield True
+        return
+    # AdmissionController không thread-safe: acquire / release chạy trên loop của nó
+    try:
+        future = asyncio.run_coroutine_threadsafe(_acquire_background(admission, timeout), loop)
+        # Thêm thời gian dự phòng khi loop đã dừng và không còn ai hoàn tất future
+        future.result(timeout=timeout + 5)
+    except (asyncio.TimeoutError, concurrent.futures.TimeoutError, concurrent.futures.CancelledError, RuntimeError):
+        yield False
+        return
+    acquired_at = time.monotonic()
+    try:
+        yield True
+    finally:
+        try:
+            loop.call_soon_threadsafe(admission.release, acquired_at)
+        except RuntimeError:
+            pass  # Server đã tắt, loop đóng cùng admission
+
+def refresh_faq_index(knowledge_base=None, rebuild: bool = FAQ_AUTO_REBUILD,
+                      admission: Optional[AdmissionController] = None,
+                      loop: Optional[asyncio.AbstractEventLoop] = None,
+                      stop: Optional[threading.Event] = None) -> Optional[dict]:
+    """
+    Kiểm tra FAQ index theo version knowledge base, dựng lại nếu đã cũ
+    
+    Chạy đồng bộ (mỗi câu hỏi một lần gọi Ollama) nên server gọi từ thread nền,
+    truyền admission + loop để việc dựng nhường slot LLM cho request người dùng
+    và stop để dừng giữa các câu hỏi khi server tắt.
+    """
+    if FAQ_INDEX is None:
+        return None
+    if knowledge_base is None:
+        knowledge_base = get_engine()
+    if not FAQ_INDEX.questions and os.path.exists(FAQ_QUESTIONS_PATH):
+        FAQ_INDEX.questions = load_questions(FAQ_QUESTIONS_PATH)
+    return FAQ_INDEX.refresh(
+        knowledge_base,
+        lambda question: generate_faq_answer(question, knowledge_base, admission, loop),
+        rebuild=rebuild,
+        stop=stop
+    )
+
 def clear_cache():
     """Xóa cache để làm mới responses"""
-    global RESPONSE_CACHE
     RESPONSE_CACHE.clear()
+    SEMANTIC_CACHE.clear()
     print("🗑️ Cache đã được xóa!")
 
+def get_cache_stats() -> dict:
+    """Thống kê hit/miss/eviction của exact cache, semantic cache, FAQ index và số request được gộp"""
+    return {
+        'response_cache': RESPONSE_CACHE.get_stats(),
+        'semantic_cache': SEMANTIC_CACHE.get_stats(),
+        'faq_index': FAQ_INDEX.get_stats() if FAQ_INDEX is not None else None,
+        'single_flight': INFLIGHT.get_stats() if INFLIGHT is not None else None
+    }
+
+def get_prompt_stats() -> dict:
+    """Số token prompt (trung bình, p95, max) của các request gần đây"""
+    return {
+        **PROMPT_STATS.get_stats(),
+        'tokenizer': CONTEXT_BUILDER.counter.name,
+        'num_ctx': OLLAMA_NUM_CTX,
+        'num_predict': OLLAMA_NUM_PREDICT,
+        'context_max_tokens': CONTEXT_BUILDER.max_tokens
+    }
+
 if __name__ == "__main__":
     test_ollama_connection() 
\ No newline at end of file
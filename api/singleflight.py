@@ -0,0 +1,103 @@
+import asyncio
+from typing import Dict, Any, List, Optional, Callable, AsyncIterator, AsyncGenerator
+
+class Flight:
+    """
+    Một lần trả lời đang chạy cho một câu hỏi
+
+    Các đoạn text đã sinh được giữ lại để người đến sau phát lại từ đầu
+    rồi nhận tiếp token mới cùng lúc với người đến trước.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._updated = asyncio.Event()
+
+    def _notify(self):
+        # Event dùng một lần: đánh thức mọi subscriber đang chờ rồi thay event mới
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def run(self, producer: AsyncIterator[str]):
+        try:
+            async for delta in producer:
+                self.parts.append(delta)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = RuntimeError("Lượt trả lời bị hủy")
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        """Phát lại các đoạn đã có rồi chờ đoạn mới tới khi xong; raise lỗi của producer"""
+        index = 0
+        while True:
+            updated = self._updated
+            while index < len(self.parts):
+                yield self.parts[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await updated.wait()
+
+class SingleFlight:
+    """
+    Gộp các request cùng câu hỏi (cùng cache key) đang chạy đồng thời
+
+    Request đầu tiên (leader) chạy producer trong một task riêng; các
+    request đến sau (follower) chỉ đăng ký nhận kết quả, không tự retrieval
+    hay gọi LLM. Producer chạy tiếp dù client của leader ngắt kết nối, để
+    follower vẫn nhận đủ câu trả lời và câu trả lời vẫn được cache.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.max_followers = 0
+
+    def subscribe(self, key: str, producer: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        """Stream các đoạn câu trả lời của key, chỉ gọi producer() nếu chưa có flight nào đang chạy"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight()
+            self._flights[key] = flight
+            self.leaders += 1
+            flight.task = asyncio.ensure_future(flight.run(producer()))
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+        else:
+            flight.followers += 1
+            self.followers += 1
+            self.max_followers = max(self.max_followers, flight.followers)
+        return flight.subscribe()
+
+    def _finish(self, key: str, flight: Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def close(self):
+        """Hủy các lượt trả lời còn chạy (khi tắt server)"""
+        tasks = [flight.task for flight in self._flights.values() if flight.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.leaders + self.followers
+        return {
+            'in_flight': len(self._flights),
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'coalesced_rate': round(self.followers / total, 4) if total else 0.0,
+            'max_followers': self.max_followers
+        }
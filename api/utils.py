@@ -1,18 +1,19 @@
 import json
 import time
 import uuid
-from typing import Generator
+from typing import Generator, Iterable, AsyncGenerator, AsyncIterable
 
-def create_sse_chunk(content: str, is_final: bool = False) -> str:
+def create_sse_chunk(content: str, is_final: bool = False, chat_id: str = None,
+                     model: str = "koc-assistant") -> str:
     """Tạo SSE chunk theo format OpenAI"""
-    chunk_id = f"chatcmpl-{uuid.uuid4().hex[:8]}"
+    chunk_id = chat_id or f"chatcmpl-{uuid.uuid4().hex[:8]}"
     
     if is_final:
         chunk = {
             "id": chunk_id,
             "object": "chat.completion.chunk",
             "created": int(time.time()),
-            "model": "koc-assistant",
+            "model": model,
             "choices": [{
                 "index": 0,
                 "delta": {},
@@ -24,7 +25,7 @@ def create_sse_chunk(content: str, is_final: bool = False) -> str:
             "id": chunk_id,
             "object": "chat.completion.chunk", 
             "created": int(time.time()),
-            "model": "koc-assistant",
+            "model": model,
             "choices": [{
                 "index": 0,
                 "delta": {"content": content},
@@ -34,29 +35,66 @@ def create_sse_chunk(content: str, is_final: bool = False) -> str:
     
     return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
 
-def stream_response(text: str, chunk_size: int = 10) -> Generator[str, None, None]:
-    """Stream response theo chunks như OpenAI"""
+def stream_deltas(deltas: Iterable[str], model: str = "koc-assistant") -> Generator[str, None, None]:
+    """Chuyển từng delta text thành SSE chunk ngay khi nhận được"""
+    chat_id = generate_chat_id()
     
     # Start chunk
-    yield create_sse_chunk("")
-    
-    # Stream content by chunks
-    words = text.split()
-    current_chunk = ""
+    yield create_sse_chunk("", chat_id=chat_id, model=model)
     
-    for i, word in enumerate(words):
-        current_chunk += word + " "
-        
-        # Send chunk when reaching chunk_size words or at end
-        if (i + 1) % chunk_size == 0 or i == len(words) - 1:
-            yield create_sse_chunk(current_chunk)
-            current_chunk = ""
-            time.sleep(0.05)  # Simulate realistic streaming delay
+    for delta in deltas:
+        if delta:
+            yield create_sse_chunk(delta, chat_id=chat_id, model=model)
     
     # Final chunk
-    yield create_sse_chunk("", is_final=True)
+    yield create_sse_chunk("", is_final=True, chat_id=chat_id, model=model)
+    yield "data: [DONE]\n\n"
+
+async def stream_deltas_async(deltas: AsyncIterable[str], model: str = "koc-assistant") -> AsyncGenerator[str, None]:
+    """Phiên bản async của stream_deltas cho các nguồn token bất đồng bộ"""
+    chat_id = generate_chat_id()
+    
+    yield create_sse_chunk("", chat_id=chat_id, model=model)
+    
+    async for delta in deltas:
+        if delta:
+            yield create_sse_chunk(delta, chat_id=chat_id, model=model)
+    
+    yield create_sse_chunk("", is_final=True, chat_id=chat_id, model=model)
     yield "data: [DONE]\n\n"
 
+async def prefetch_first(deltas: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    """
+    Chạy generator tới phần tử đầu tiên trước khi trả về
+    
+    Lỗi xảy ra trước token đầu (vd. LLM quá tải) được raise ở đây, khi
+    endpoint còn đổi được HTTP status, thay vì sau khi đã gửi header 200.
+    """
+    try:
+        first = await deltas.__anext__()
+    except StopAsyncIteration:
+        first = None
+    
+    async def chained():
+        try:
+            if first is not None:
+                yield first
+            async for delta in deltas:
+                yield delta
+        finally:
+            await deltas.aclose()
+    
+    return chained()
+
+def stream_response(text: str, chunk_size: int = 10) -> Generator[str, None, None]:
+    """Stream response đã có sẵn theo chunks như OpenAI"""
+    words = text.split()
+    chunks = (
+        " ".join(words[i:i + chunk_size]) + " "
+        for i in range(0, len(words), chunk_size)
+    )
+    yield from stream_deltas(chunks)
+
 def generate_chat_id() -> str:
     """Generate unique chat completion ID"""
     return f"chatcmpl-{uuid.uuid4().hex[:8]}"
@@ -70,4 +108,39 @@ def extract_user_message(messages: list) -> str:
     for msg in reversed(messages):
         if msg.role == "user":
             return msg.content
-    return None 
\ No newline at end of file
+    return None 
+
+def get_memory_usage_mb() -> float:
+    """Lấy RSS hiện tại của process (MB)"""
+    try:
+        # Linux: đọc trực tiếp /proc, không cần thư viện ngoài
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 2)
+    except OSError:
+        pass
+    
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().rss / (1024 * 1024), 2)
+    except ImportError:
+        pass
+    
+    try:
+        import resource
+        # ru_maxrss là peak RSS (KB trên Linux, bytes trên macOS)
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+    except Exception:
+        return 0.0
+
+def format_uptime(seconds: float) -> str:
+    """Thời gian chạy dạng "2d 3h 4m 5s" (bỏ các đơn vị lớn bằng 0)"""
+    seconds = int(seconds)
+    parts = []
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size or parts:
+            parts.append(f"{seconds // size}{unit}")
+            seconds %= size
+    parts.append(f"{seconds}s")
+    return " ".join(parts)
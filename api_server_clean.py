@@ -1,7 +1,14 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Request, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Optional
+import asyncio
+import os
+import threading
+import time
 
 # Import từ các module đã tách
 from api.models import (
@@ -10,27 +17,181 @@ from api.models import (
     ChatCompletionChoice,
     ChatMessage,
     HealthResponse,
+    ReadinessResponse,
     StatsResponse,
+    CacheStatsResponse,
+    JobResponse,
     ModelsResponse,
     ModelInfo
 )
-from api.responses import get_smart_response, SMART_RESPONSES
+from api.responses import (
+    get_smart_response_async,
+    stream_smart_response,
+    get_cache_stats,
+    get_prompt_stats,
+    clear_cache,
+    refresh_faq_index,
+    FAQ_INDEX,
+    INFLIGHT,
+    SMART_RESPONSES
+)
 from api.utils import (
-    stream_response, 
+    stream_deltas_async, 
     generate_chat_id, 
     get_current_timestamp,
-    extract_user_message
+    extract_user_message,
+    prefetch_first,
+    format_uptime
 )
 from api.config import *
+from api.engine import RetrievalEngine, get_engine, shutdown_engine
+from api.ollama_client import OllamaClient
+from api.admission import AdmissionController, AdmissionRejected
+from api.jobs import (
+    IngestionQueue,
+    UploadTooLargeError,
+    SUPPORTED_UPLOAD_EXTENSIONS,
+    store_upload
+)
+
+async def _start_ollama(app: FastAPI):
+    """Mở connection pool tới Ollama, ping lần đầu và chạy health check nền"""
+    start_time = time.perf_counter()
+    await app.state.ollama.start()
+    app.state.startup['ollama_ping_seconds'] = round(time.perf_counter() - start_time, 3)
+
+async def _start_engine(app: FastAPI):
+    """Khởi tạo retrieval engine, warmup rồi mới mở hàng đợi ingest"""
+    startup = app.state.startup
+    try:
+        engine = await run_in_threadpool(get_engine)
+        info = engine.get_engine_info()
+        startup['engine_seconds'] = info['init_time_seconds']
+        print(f"📚 Retrieval engine loaded in {info['init_time_seconds']}s (+{info['memory_delta_mb']} MB)")
+        
+        if STARTUP_WARMUP_ENABLED:
+            startup.update(await run_in_threadpool(engine.warmup))
+    except Exception as e:
+        print(f"⚠️ Không khởi tạo được retrieval engine: {e}")
+        startup['error'] = str(e)
+        return
+    
+    app.state.engine = engine
+    
+    # Worker khác (--workers N) hoặc ingest_documents.py vừa ghi KB: engine đã
+    # nạp lại trên thread đang đọc, phần còn lại chạy trên event loop
+    loop = asyncio.get_running_loop()
+    engine.on_external_change = lambda: loop.call_soon_threadsafe(_on_knowledge_changed, app, engine)
+    
+    # Worker ingest nền cho /upload (cache câu trả lời bị xóa sau mỗi lần cập nhật)
+    app.state.jobs = IngestionQueue(engine, on_complete=lambda: _on_knowledge_changed(app, engine))
+    await app.state.jobs.start()
+    
+    # FAQ index dựng cho version KB khác: dựng lại ở nền, chưa dùng cho tới khi xong
+    _schedule_faq_refresh(app, engine)
+
+def _schedule_faq_refresh(app: FastAPI, engine: RetrievalEngine):
+    """
+    Dựng lại FAQ index trên thread daemon riêng, gọi LLM qua slot ưu tiên
+    thấp của admission
+
+    Không dùng executor mặc định của loop: việc dựng kéo dài nhiều lần gọi
+    LLM và phải dừng được (app.state.faq_stop) trước khi engine bị đóng.
+    """
+    if FAQ_INDEX is None or app.state.faq_stop.is_set():
+        return
+    thread = threading.Thread(
+        target=refresh_faq_index,
+        args=(engine, FAQ_AUTO_REBUILD, app.state.admission, asyncio.get_running_loop(), app.state.faq_stop),
+        name="faq-refresh",
+        daemon=True
+    )
+    app.state.faq_threads = [t for t in app.state.faq_threads if t.is_alive()] + [thread]
+    thread.start()
+
+async def _stop_faq_refresh(app: FastAPI):
+    """Báo thread dựng FAQ dừng và chờ tối đa FAQ_SHUTDOWN_TIMEOUT giây"""
+    app.state.faq_stop.set()
+    deadline = time.monotonic() + FAQ_SHUTDOWN_TIMEOUT
+    for thread in app.state.faq_threads:
+        await run_in_threadpool(thread.join, max(0.0, deadline - time.monotonic()))
+        if thread.is_alive():
+            print("⚠️ Thread dựng FAQ index chưa dừng kịp (đang chờ Ollama)")
+
+def _on_knowledge_changed(app: FastAPI, engine: RetrievalEngine):
+    """Nội dung KB vừa đổi: bỏ các câu trả lời đã cache, dựng lại FAQ index"""
+    clear_cache()
+    if FAQ_INDEX is not None:
+        FAQ_INDEX.invalidate()
+    _schedule_faq_refresh(app, engine)
+
+async def _startup(app: FastAPI):
+    await asyncio.gather(_start_ollama(app), _start_engine(app))
+    app.state.startup['ready_seconds'] = round(time.monotonic() - app.state.started_at, 3)
+    print(f"✅ Server ready in {app.state.startup['ready_seconds']}s")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Khởi tạo tài nguyên dùng chung cho toàn bộ vòng đời app
+    
+    Nạp engine, warmup và ping Ollama chạy nền để server nhận request ngay:
+    /health/live trả 200 từ đầu, /health/ready trả 503 cho tới khi xong.
+    """
+    app.state.started_at = time.monotonic()
+    app.state.startup = {}
+    app.state.engine = None
+    app.state.jobs = None
+    app.state.ollama = OllamaClient()
+    app.state.admission = AdmissionController()
+    app.state.faq_stop = threading.Event()
+    app.state.faq_threads = []
+    app.state.startup_task = asyncio.create_task(_startup(app))
+    
+    yield
+    
+    if not app.state.startup_task.done():
+        app.state.startup_task.cancel()
+        try:
+            await app.state.startup_task
+        except asyncio.CancelledError:
+            pass
+    if app.state.jobs is not None:
+        await app.state.jobs.close()
+    # Dừng dựng FAQ trước khi đóng engine mà thread đó đang dùng
+    await _stop_faq_refresh(app)
+    if INFLIGHT is not None:
+        await INFLIGHT.close()
+    await app.state.ollama.close()
+    app.state.engine = None
+    shutdown_engine()
+
+def _uptime(app: FastAPI) -> str:
+    started_at = getattr(app.state, "started_at", None)
+    return format_uptime(time.monotonic() - started_at) if started_at is not None else "0s"
+
+def get_retrieval_engine(request: Request) -> Optional[RetrievalEngine]:
+    """Dependency: engine dùng chung được tạo trong lifespan"""
+    return getattr(request.app.state, "engine", None)
 
-# Import logic từ app hiện tại
-from knowledge_base import KnowledgeBase
+def get_ollama_client(request: Request) -> Optional[OllamaClient]:
+    """Dependency: client Ollama dùng chung được tạo trong lifespan"""
+    return getattr(request.app.state, "ollama", None)
+
+def get_admission(request: Request) -> Optional[AdmissionController]:
+    """Dependency: giới hạn số request gọi LLM đồng thời, tạo trong lifespan"""
+    return getattr(request.app.state, "admission", None)
+
+def get_ingestion_queue(request: Request) -> Optional[IngestionQueue]:
+    """Dependency: hàng đợi ingest được tạo trong lifespan"""
+    return getattr(request.app.state, "jobs", None)
 
 # Khởi tạo FastAPI app
 app = FastAPI(
     title=API_TITLE,
     description=API_DESCRIPTION,
-    version=API_VERSION
+    version=API_VERSION,
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -50,17 +211,65 @@ async def root():
         "version": API_VERSION,
         "docs": "/docs",
         "health": "/health",
+        "liveness": "/health/live",
+        "readiness": "/health/ready",
         "models": "/models",
-        "chat": "/chat/completions"
+        "chat": "/chat/completions",
+        "upload": "/upload"
     }
 
 @app.get("/health", response_model=HealthResponse)
-async def health_check():
+async def health_check(request: Request):
     """Health check endpoint"""
+    ready = getattr(request.app.state, "engine", None) is not None
+    return HealthResponse(
+        status="healthy" if ready else "starting",
+        timestamp=datetime.now().isoformat(),
+        uptime=_uptime(request.app)
+    )
+
+@app.get("/health/live", response_model=HealthResponse)
+async def liveness(request: Request):
+    """Liveness: process còn chạy và event loop còn phản hồi"""
     return HealthResponse(
-        status="healthy",
+        status="alive",
+        timestamp=datetime.now().isoformat(),
+        uptime=_uptime(request.app)
+    )
+
+@app.get("/health/ready", response_model=ReadinessResponse)
+async def readiness(
+    request: Request,
+    response: Response,
+    engine: Optional[RetrievalEngine] = Depends(get_retrieval_engine),
+    ollama: Optional[OllamaClient] = Depends(get_ollama_client)
+):
+    """
+    Readiness: engine đã nạp và warmup xong (503 nếu chưa)
+    
+    Ollama không nằm trong điều kiện sẵn sàng vì khi Ollama lỗi server vẫn
+    trả lời bằng câu trả lời dự phòng; trạng thái Ollama chỉ để tham khảo.
+    """
+    startup = dict(getattr(request.app.state, "startup", {}))
+    if engine is not None:
+        status = "ready"
+    elif 'error' in startup:
+        status = "failed"
+    else:
+        status = "starting"
+    
+    if status != "ready":
+        response.status_code = 503
+    
+    return ReadinessResponse(
+        status=status,
         timestamp=datetime.now().isoformat(),
-        uptime=UPTIME
+        uptime=_uptime(request.app),
+        checks={
+            'engine': engine is not None,
+            'ollama': ollama.healthy if ollama else None
+        },
+        startup=startup
     )
 
 @app.get("/models", response_model=ModelsResponse)
@@ -82,7 +291,12 @@ async def list_models():
     )
 
 @app.post("/chat/completions")
-async def chat_completions(request: ChatCompletionRequest):
+async def chat_completions(
+    request: ChatCompletionRequest,
+    engine: Optional[RetrievalEngine] = Depends(get_retrieval_engine),
+    ollama: Optional[OllamaClient] = Depends(get_ollama_client),
+    admission: Optional[AdmissionController] = Depends(get_admission)
+):
     """Main chat completion endpoint với SSE streaming"""
     
     try:
@@ -92,21 +306,25 @@ async def chat_completions(request: ChatCompletionRequest):
         if not user_message:
             raise HTTPException(status_code=400, detail="No user message found")
         
-        # Generate response
-        ai_response = get_smart_response(user_message)
-        
         if request.stream:
-            # Streaming response
+            # Streaming response: forward token từ Ollama ngay khi sinh ra
+            deltas = stream_smart_response(user_message, engine, ollama, admission)
+            if LLM_OVERLOAD_ACTION == "reject":
+                # Chờ tới token đầu để còn trả được 429 nếu hàng đợi LLM đầy
+                deltas = await prefetch_first(deltas)
             return StreamingResponse(
-                stream_response(ai_response, DEFAULT_CHUNK_SIZE),
-                media_type="text/plain",
+                stream_deltas_async(deltas, request.model),
+                media_type="text/event-stream",
                 headers={
                     "Cache-Control": "no-cache",
                     "Connection": "keep-alive",
-                    "Content-Type": "text/plain; charset=utf-8"
+                    "X-Accel-Buffering": "no"
                 }
             )
         else:
+            # Generate response qua connection pool async
+            ai_response = await get_smart_response_async(user_message, engine, ollama, admission)
+            
             # Non-streaming response
             response = ChatCompletionResponse(
                 id=generate_chat_id(),
@@ -123,39 +341,90 @@ async def chat_completions(request: ChatCompletionRequest):
             )
             return response
             
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@app.post("/upload")
-async def upload_documents():
-    """Endpoint để upload tài liệu PDF (có thể implement sau)"""
-    return {"message": "Document upload endpoint - Coming soon"}
+@app.post("/upload", response_model=JobResponse, status_code=202)
+async def upload_documents(
+    file: UploadFile = File(...),
+    jobs: Optional[IngestionQueue] = Depends(get_ingestion_queue)
+):
+    """Upload tài liệu PDF/TXT, nạp vào knowledge base ở background"""
+    if jobs is None:
+        raise HTTPException(status_code=503, detail="Knowledge base is not available")
+    
+    filename = os.path.basename(file.filename or "")
+    if not filename.lower().endswith(SUPPORTED_UPLOAD_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Only PDF and TXT files are supported")
+    
+    try:
+        path = await run_in_threadpool(store_upload, file.file, filename)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    finally:
+        await file.close()
+    
+    job = jobs.submit(path, filename)
+    return JobResponse(**job.to_dict())
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    jobs: Optional[IngestionQueue] = Depends(get_ingestion_queue)
+):
+    """Trạng thái và tiến độ của một job ingest"""
+    job = jobs.get(job_id) if jobs else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResponse(**job.to_dict())
 
 @app.get("/stats", response_model=StatsResponse)
-async def get_stats():
+async def get_stats(
+    request: Request,
+    engine: Optional[RetrievalEngine] = Depends(get_retrieval_engine),
+    ollama: Optional[OllamaClient] = Depends(get_ollama_client),
+    jobs: Optional[IngestionQueue] = Depends(get_ingestion_queue)
+):
     """Get system statistics"""
     try:
-        knowledge_base = KnowledgeBase()
-        stats = knowledge_base.get_statistics()
+        stats = await run_in_threadpool(engine.get_statistics)
         
         return StatsResponse(
             total_documents=stats.get('total_documents', 0),
             total_chunks=stats.get('total_chunks', 0),
             supported_topics=len(SMART_RESPONSES),
-            uptime=UPTIME,
+            uptime=_uptime(request.app),
             response_time=RESPONSE_TIME,
-            accuracy=ACCURACY
+            accuracy=ACCURACY,
+            engine=engine.get_engine_info(),
+            ollama=ollama.get_stats() if ollama else None,
+            ingestion=jobs.get_stats() if jobs else None,
+            prompt=get_prompt_stats(),
+            admission=request.app.state.admission.get_stats()
         )
     except:
         return StatsResponse(
             total_documents=0,
             total_chunks=0,
             supported_topics=len(SMART_RESPONSES),
-            uptime=UPTIME,
+            uptime=_uptime(request.app),
             response_time=RESPONSE_TIME,
             accuracy=ACCURACY
         )
 
+@app.get("/cache/stats", response_model=CacheStatsResponse)
+async def cache_stats():
+    """Thống kê response cache và semantic cache (hit/miss/eviction)"""
+    return CacheStatsResponse(**get_cache_stats())
+
+@app.delete("/cache")
+async def delete_cache():
+    """Xóa toàn bộ response cache"""
+    clear_cache()
+    return {"message": "Cache cleared"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=HOST, port=PORT, reload=RELOAD) 
\ No newline at end of file
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark các thành phần xử lý của ZiZi AI
+
+Ví dụ:
+    python benchmark.py chunker
+    python benchmark.py chunker --size-mb 8 --chunk-sizes 500 1000 4000
+    python benchmark.py bm25 --chunks 20000
+    python benchmark.py vector-store --sizes 1000 10000 100000
+    python benchmark.py quantization --chunks 50000
+    python benchmark.py embedding --batch-sizes 1 8 32
+    python benchmark.py prefill faq_questions.txt   # cần Ollama + knowledge base
+"""
+
+import argparse
+import itertools
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Dict
+
+import numpy as np
+
+from bm25_index import BM25Index
+from pdf_processor import PDFProcessor
+from vector_store import ChromaVectorStore, NumpyVectorStore
+
+class LegacyChunker:
+    """Bản sao chunker cũ (nối chuỗi lặp lại, làm sạch gộp mất \\n) để so sánh"""
+
+    def __init__(self, chunk_size: int = 1000):
+        self.chunk_size = chunk_size
+
+    def chunk(self, text: str) -> List[Dict[str, str]]:
+        return self._create_chunks(self._clean_text(text))
+
+    def _clean_text(self, text: str) -> str:
+        text = re.sub(r'\x00', '', text)
+        text = re.sub(r'\s+', ' ', text)
+        text = re.sub(r'\n\s*\n', '\n\n', text)
+        return text.strip()
+
+    def _create_chunks(self, text: str) -> List[Dict[str, str]]:
+        chunks = []
+        paragraphs = text.split('\n\n')
+        current_chunk = ""
+        chunk_id = 0
+
+        for paragraph in paragraphs:
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+
+            test_chunk = current_chunk + "\n\n" + paragraph if current_chunk else paragraph
+
+            if len(test_chunk) <= self.chunk_size:
+                current_chunk = test_chunk
+            else:
+                if current_chunk:
+                    chunks.append({'id': f"chunk_{chunk_id}", 'content': current_chunk, 'length': len(current_chunk)})
+                    chunk_id += 1
+
+                if len(paragraph) <= self.chunk_size:
+                    current_chunk = paragraph
+                else:
+                    for sub_chunk in self._split_long_paragraph(paragraph):
+                        chunks.append({'id': f"chunk_{chunk_id}", 'content': sub_chunk, 'length': len(sub_chunk)})
+                        chunk_id += 1
+                    current_chunk = ""
+
+        if current_chunk:
+            chunks.append({'id': f"chunk_{chunk_id}", 'content': current_chunk, 'length': len(current_chunk)})
+
+        return chunks
+
+    def _split_long_paragraph(self, paragraph: str) -> List[str]:
+        chunks = []
+        sentences = re.split(r'[.!?]+', paragraph)
+        current_chunk = ""
+
+        for sentence in sentences:
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+
+            test_chunk = current_chunk + ". " + sentence if current_chunk else sentence
+
+            if len(test_chunk) <= self.chunk_size:
+                current_chunk = test_chunk
+            else:
+                if current_chunk:
+                    chunks.append(current_chunk + ".")
+                if len(sentence) > self.chunk_size:
+                    chunks.extend(self._split_by_words(sentence))
+                    current_chunk = ""
+                else:
+                    current_chunk = sentence
+
+        if current_chunk:
+            chunks.append(current_chunk + ".")
+
+        return chunks
+
+    def _split_by_words(self, text: str) -> List[str]:
+        words = text.split()
+        chunks = []
+        current_chunk = ""
+
+        for word in words:
+            test_chunk = current_chunk + " " + word if current_chunk else word
+
+            if len(test_chunk) <= self.chunk_size:
+                current_chunk = test_chunk
+            else:
+                if current_chunk:
+                    chunks.append(current_chunk)
+                current_chunk = word
+
+        if current_chunk:
+            chunks.append(current_chunk)
+
+        return chunks
+
+def make_corpus(size_chars: int, seed: int = 42) -> str:
+    """Văn bản giả lập tài liệu hướng dẫn: đoạn ngắn, đoạn dài, danh sách không dấu câu"""
+    rng = random.Random(seed)
+    vocabulary = ["zizi", "dự", "án", "hướng", "dẫn", "cài", "đặt", "tài", "khoản", "chiến",
+                  "dịch", "koc", "báo", "cáo", "thanh", "toán", "người", "dùng", "quản", "lý"]
+    paragraphs = []
+    total = 0
+    while total < size_chars:
+        kind = rng.random()
+        if kind < 0.6:
+            sentences = rng.randint(1, 4)
+        elif kind < 0.9:
+            sentences = rng.randint(10, 40)
+        else:
+            sentences = 0  # Danh sách dài không có dấu câu
+
+        if sentences:
+            paragraph = " ".join(
+                " ".join(rng.choice(vocabulary) for _ in range(rng.randint(5, 20))).capitalize() + "."
+                for _ in range(sentences)
+            )
+        else:
+            paragraph = "\n".join(
+                " ".join(rng.choice(vocabulary) for _ in range(rng.randint(3, 8)))
+                for _ in range(rng.randint(50, 200))
+            )
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+def _time(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+def _describe(chunks: List[Dict[str, str]]) -> str:
+    lengths = [chunk['length'] for chunk in chunks] or [0]
+    paragraph_breaks = sum('\n\n' in chunk['content'] for chunk in chunks)
+    return (f"{len(chunks)} chunks, avg {sum(lengths) / len(lengths):.0f}, max {max(lengths)}, "
+            f"{paragraph_breaks} giữ ngắt đoạn")
+
+def benchmark_chunker(args):
+    text = make_corpus(int(args.size_mb * 1024 * 1024))
+    size_mb = len(text.encode('utf-8')) / (1024 * 1024)
+    print(f"📄 Corpus: {len(text):,} ký tự ({size_mb:.1f} MB)\n")
+
+    for chunk_size in args.chunk_sizes:
+        overlap = min(args.overlap, chunk_size // 2)
+        legacy = LegacyChunker(chunk_size)
+        processor = PDFProcessor(chunk_size=chunk_size, chunk_overlap=overlap)
+
+        legacy_time = _time(lambda: legacy.chunk(text), args.repeat)
+        new_time = _time(lambda: processor._create_chunks(text), args.repeat)
+
+        print(f"chunk_size={chunk_size} overlap={overlap}")
+        print(f"   legacy: {legacy_time:.3f}s ({size_mb / legacy_time:.1f} MB/s) - {_describe(legacy.chunk(text))}")
+        print(f"   new:    {new_time:.3f}s ({size_mb / new_time:.1f} MB/s) - {_describe(processor._create_chunks(text))}")
+        print(f"   ⚡ {legacy_time / new_time:.2f}x\n")
+
+def benchmark_bm25(args):
+    processor = PDFProcessor(chunk_size=1000, chunk_overlap=0)
+    corpus = make_corpus(args.chunks * 1000)
+    chunks = [chunk['content'] for chunk in processor._create_chunks(corpus)][:args.chunks]
+    chunk_ids = [f"chunk_{i}" for i in range(len(chunks))]
+
+    index = BM25Index()
+    start_time = time.perf_counter()
+    index.add(chunk_ids, chunks)
+    build_time = time.perf_counter() - start_time
+    print(f"📚 {len(index)} chunks, {index.get_stats()['terms']} terms - dựng index {build_time:.2f}s")
+
+    queries = ["chiến dịch koc", "hướng dẫn cài đặt tài khoản", "báo cáo thanh toán", "zizi"]
+    index.search(queries[0], k=20)  # Dựng cache mảng postings
+    for query in queries:
+        latency = _time(lambda: index.search(query, k=20), args.repeat)
+        print(f"   '{query}': {latency * 1000:.3f} ms")
+
+    # Cập nhật tăng dần (như khi ingest lại một tài liệu)
+    update_time = _time(lambda: index.add(chunk_ids[:64], chunks[:64]), 1)
+    print(f"   Cập nhật 64 chunks: {update_time * 1000:.2f} ms")
+
+def _fill_store(store, vectors: np.ndarray, batch_size: int = 5000):
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        ids = [f"chunk_{start + i}" for i in range(len(batch))]
+        store.upsert(
+            ids=ids,
+            embeddings=batch,
+            documents=ids,
+            metadatas=[{'document_name': f"doc_{(start + i) % 20}"} for i in range(len(batch))]
+        )
+    store.flush()
+
+def benchmark_vector_store(args):
+    rng = np.random.default_rng(42)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    print(f"{'chunks':>8} | {'numpy ms':>9} | {'numpy+filter':>12} | {'chroma ms':>9} | {'chroma+filter':>13}")
+
+    for size in args.sizes:
+        vectors = rng.standard_normal((size, args.dim)).astype(np.float32)
+        row = [f"{size:>8}"]
+
+        for backend in ("numpy", "chroma"):
+            directory = tempfile.mkdtemp(prefix=f"bench_{backend}_")
+            try:
+                try:
+                    store = NumpyVectorStore(directory) if backend == "numpy" else ChromaVectorStore(directory)
+                except ImportError:
+                    row.extend([f"{'-':>9}", f"{'-':>12}"])
+                    continue
+                _fill_store(store, vectors)
+
+                def run(where=None):
+                    for query in queries:
+                        store.query(query_embeddings=[query.tolist()], n_results=args.k, where=where)
+
+                run()  # Warm up
+                plain = _time(run, args.repeat) / len(queries)
+                filtered = _time(lambda: run({"document_name": "doc_3"}), args.repeat) / len(queries)
+                row.extend([f"{plain * 1000:>9.3f}", f"{filtered * 1000:>12.3f}"])
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+        print(" | ".join(row))
+
+def _clustered_vectors(rng, size: int, dim: int, clusters: int = 64) -> np.ndarray:
+    """Vector giả lập embedding thật: các cụm chủ đề thay vì nhiễu đều"""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size)
+    return centers[labels] + 0.8 * rng.standard_normal((size, dim)).astype(np.float32)
+
+def _directory_mb(directory: str) -> float:
+    return sum(entry.stat().st_size for entry in os.scandir(directory)) / (1024 * 1024)
+
+def benchmark_quantization(args):
+    rng = np.random.default_rng(42)
+    vectors = _clustered_vectors(rng, args.chunks, args.dim)
+    queries = vectors[rng.integers(0, args.chunks, args.queries)]
+    queries = queries + 0.5 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    configs = [("float32", 0), ("float16", 0), ("float16", args.rescore),
+               ("int8", 0), ("int8", args.rescore)]
+    print(f"📐 {args.chunks} vectors x {args.dim} chiều, {args.queries} queries, recall@{args.k} so với float32\n")
+    print(f"{'precision':>9} | {'rescore':>7} | {'recall':>7} | {'query ms':>8} | {'index MB':>8} | {'disk MB':>7}")
+
+    expected = None
+    for precision, rescore_candidates in configs:
+        directory = tempfile.mkdtemp(prefix=f"bench_{precision}_")
+        try:
+            store = NumpyVectorStore(directory, precision=precision, rescore_candidates=rescore_candidates)
+            _fill_store(store, vectors)
+
+            def run():
+                return [store.query(query_embeddings=query[None, :], n_results=args.k)['ids'][0]
+                        for query in queries]
+
+            found = run()
+            if expected is None:
+                expected = found
+            recall = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, expected)])
+            latency = _time(run, args.repeat) / len(queries)
+            print(f"{precision:>9} | {rescore_candidates:>7} | {recall:>7.4f} | {latency * 1000:>8.3f} | "
+                  f"{store.get_stats()['index_mb']:>8.1f} | {_directory_mb(directory):>7.1f}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+_COLD_START_SCRIPT = """
+import sys, time
+start_time = time.perf_counter()
+from knowledge_base import load_embedding_model
+model = load_embedding_model(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4] == "int8")
+model.encode(["xin chào"])
+print(time.perf_counter() - start_time)
+"""
+
+def benchmark_embedding(args):
+    from knowledge_base import load_embedding_model
+    from onnx_embedder import compare_embeddings
+
+    runtimes = [("torch", "float32"), ("onnx", "float32"), ("onnx", "int8")]
+    texts = [chunk['content'] for chunk in PDFProcessor(chunk_size=500, chunk_overlap=0)._create_chunks(make_corpus(200000))]
+    texts = [text[:length] for text, length in zip(texts, itertools.cycle([40, 120, 500]))]  # Câu hỏi ngắn lẫn chunk dài
+
+    header = f"{'runtime':>13} | {'cold start s':>12} | " + " | ".join(f"{f'batch {size} ms':>12}" for size in args.batch_sizes)
+    print(header + f" | {'min cosine':>10}")
+
+    reference = None
+    for runtime, precision in runtimes:
+        # Cold start đo trong process mới: gồm cả import torch / onnxruntime
+        output = subprocess.run(
+            [sys.executable, "-c", _COLD_START_SCRIPT, args.model, runtime, args.onnx_directory, precision],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if output.returncode != 0:
+            print(f"{runtime + '/' + precision:>13} | không chạy được: {output.stderr.strip().splitlines()[-1:]}")
+            continue
+        cold_start = float(output.stdout.strip().splitlines()[-1])
+
+        model = load_embedding_model(args.model, runtime, args.onnx_directory, precision == "int8")
+        row = [f"{runtime + '/' + precision:>13}", f"{cold_start:>12.2f}"]
+        for size in args.batch_sizes:
+            batch = texts[:size]
+            model.encode(batch)  # Warm up
+            row.append(f"{_time(lambda: model.encode(batch), args.repeat) * 1000:>12.1f}")
+
+        embeddings = np.asarray(model.encode(texts[:args.check_texts]))
+        if reference is None:
+            reference = embeddings
+        row.append(f"{compare_embeddings(reference, embeddings)['min_cosine']:>10.5f}")
+        print(" | ".join(row))
+
+def benchmark_prefill(args):
+    """
+    Thời gian prefill của Qwen2.5 theo prompt_eval_duration của Ollama
+
+    Mỗi câu hỏi được gửi 2 lần với num_predict=1 (chỉ đo prefill): lần đầu
+    chỉ dùng lại được system prompt chung, lần sau dùng lại cả context.
+    """
+    from api.faq import load_questions
+    from api.engine import get_engine, shutdown_engine
+    from api.responses import build_prompt, _build_ollama_payload, _session
+    from api.config import OLLAMA_BASE_URL, OLLAMA_MODEL_LOAD_TIMEOUT
+
+    engine = get_engine()
+    print(f"{'câu hỏi':<40} | {'prompt tok':>10} | {'load ms':>8} | {'prefill ms':>10} | {'lặp lại ms':>10}")
+    try:
+        for item in load_questions(args.questions)[:args.limit]:
+            payload = _build_ollama_payload(build_prompt(item['question'], engine), stream=False)
+            payload['options']['num_predict'] = 1
+
+            runs = []
+            for _ in range(2):
+                response = _session.post(f"{OLLAMA_BASE_URL}/api/chat", json=payload, timeout=OLLAMA_MODEL_LOAD_TIMEOUT)
+                response.raise_for_status()
+                runs.append(response.json())
+
+            first, repeat = runs
+            print(f"{item['question'][:40]:<40} | {first.get('prompt_eval_count', 0):>10} | "
+                  f"{first.get('load_duration', 0) / 1e6:>8.0f} | {first.get('prompt_eval_duration', 0) / 1e6:>10.1f} | "
+                  f"{repeat.get('prompt_eval_duration', 0) / 1e6:>10.1f}")
+    finally:
+        shutdown_engine()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark ZiZi AI')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    chunker_parser = subparsers.add_parser('chunker', help='Chunker mới so với chunker cũ')
+    chunker_parser.add_argument('--size-mb', type=float, default=4.0)
+    chunker_parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[500, 1000, 4000])
+    chunker_parser.add_argument('--overlap', type=int, default=200)
+    chunker_parser.add_argument('--repeat', type=int, default=3)
+    chunker_parser.set_defaults(func=benchmark_chunker)
+
+    bm25_parser = subparsers.add_parser('bm25', help='Độ trễ tìm kiếm từ khóa BM25')
+    bm25_parser.add_argument('--chunks', type=int, default=10000)
+    bm25_parser.add_argument('--repeat', type=int, default=50)
+    bm25_parser.set_defaults(func=benchmark_bm25)
+
+    vector_parser = subparsers.add_parser('vector-store', help='Độ trễ query: NumPy exact so với Chroma HNSW')
+    vector_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000, 50000, 100000])
+    vector_parser.add_argument('--dim', type=int, default=384)
+    vector_parser.add_argument('--k', type=int, default=5)
+    vector_parser.add_argument('--queries', type=int, default=50)
+    vector_parser.add_argument('--repeat', type=int, default=3)
+    vector_parser.set_defaults(func=benchmark_vector_store)
+
+    quantization_parser = subparsers.add_parser('quantization', help='Recall/bộ nhớ của float16/int8 so với float32')
+    quantization_parser.add_argument('--chunks', type=int, default=50000)
+    quantization_parser.add_argument('--dim', type=int, default=384)
+    quantization_parser.add_argument('--k', type=int, default=5)
+    quantization_parser.add_argument('--rescore', type=int, default=50)
+    quantization_parser.add_argument('--queries', type=int, default=200)
+    quantization_parser.add_argument('--repeat', type=int, default=3)
+    quantization_parser.set_defaults(func=benchmark_quantization)
+
+    embedding_parser = subparsers.add_parser('embedding', help='Cold start / độ trễ encode: PyTorch so với ONNX')
+    embedding_parser.add_argument('--model', default="all-MiniLM-L6-v2")
+    embedding_parser.add_argument('--onnx-directory', default="./onnx_models")
+    embedding_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    embedding_parser.add_argument('--check-texts', type=int, default=200)
+    embedding_parser.add_argument('--repeat', type=int, default=10)
+    embedding_parser.set_defaults(func=benchmark_embedding)
+
+    prefill_parser = subparsers.add_parser('prefill', help='Thời gian prefill của Qwen2.5 qua Ollama')
+    prefill_parser.add_argument('questions', nargs='?', default='faq_questions.txt')
+    prefill_parser.add_argument('--limit', type=int, default=10)
+    prefill_parser.set_defaults(func=benchmark_prefill)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,143 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import List, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+class BM25Index:
+    """
+    Inverted index BM25 trong bộ nhớ cho các chunk
+
+    Mỗi chunk có một slot số nguyên; postings của từng term được giữ dạng
+    dict {slot: tf} để thêm/xóa chunk rẻ, và được chuyển sang mảng numpy
+    (cache theo term, hủy khi term thay đổi) để chấm điểm bằng vector hóa.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.clear()
+
+    def clear(self):
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._slots: Dict[str, int] = {}              # chunk_id -> slot
+        self._ids: List[Optional[str]] = []           # slot -> chunk_id
+        self._terms: List[Optional[Dict[str, int]]] = []  # slot -> tf của chunk
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._free: List[int] = []
+        self._total_length = 0
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """Tách từ (âm tiết tiếng Việt) đã chuẩn hóa NFC, chữ thường"""
+        return _TOKEN_PATTERN.findall(unicodedata.normalize("NFC", text).lower())
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._slots
+
+    def add(self, chunk_ids: Iterable[str], texts: Iterable[str]):
+        """Thêm (hoặc thay thế) các chunk"""
+        for chunk_id, text in zip(chunk_ids, texts):
+            if chunk_id in self._slots:
+                self._remove_one(chunk_id)
+
+            term_counts = dict(Counter(self.tokenize(text)))
+            length = sum(term_counts.values())
+
+            if self._free:
+                slot = self._free.pop()
+                self._ids[slot] = chunk_id
+                self._terms[slot] = term_counts
+            else:
+                slot = len(self._ids)
+                self._ids.append(chunk_id)
+                self._terms.append(term_counts)
+                if slot >= len(self._lengths):
+                    self._lengths = np.concatenate([
+                        self._lengths, np.zeros(max(1024, len(self._lengths)), dtype=np.float32)
+                    ])
+
+            self._slots[chunk_id] = slot
+            self._lengths[slot] = length
+            self._total_length += length
+
+            for term, tf in term_counts.items():
+                self._postings.setdefault(term, {})[slot] = tf
+                self._arrays.pop(term, None)
+
+    def remove(self, chunk_ids: Iterable[str]):
+        """Xóa các chunk (bỏ qua ID không có trong index)"""
+        for chunk_id in chunk_ids:
+            if chunk_id in self._slots:
+                self._remove_one(chunk_id)
+
+    def _remove_one(self, chunk_id: str):
+        slot = self._slots.pop(chunk_id)
+        for term in self._terms[slot]:
+            postings = self._postings[term]
+            del postings[slot]
+            if not postings:
+                del self._postings[term]
+            self._arrays.pop(term, None)
+
+        self._total_length -= int(self._lengths[slot])
+        self._lengths[slot] = 0
+        self._ids[slot] = None
+        self._terms[slot] = None
+        self._free.append(slot)
+
+    def _term_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings[term]
+            arrays = (
+                np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            )
+            self._arrays[term] = arrays
+        return arrays
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k chunk theo điểm BM25: list (chunk_id, score) giảm dần"""
+        count = len(self._slots)
+        terms = [term for term in set(self.tokenize(query)) if term in self._postings]
+        if not count or not terms:
+            return []
+
+        average_length = self._total_length / count
+        scores = np.zeros(len(self._ids), dtype=np.float32)
+        for term in terms:
+            slots, tf = self._term_arrays(term)
+            df = len(slots)
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[slots] / average_length)
+            scores[slots] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self._ids[slot], float(scores[slot])) for slot in matched]
+
+    def get_stats(self) -> Dict[str, any]:
+        return {
+            'chunks': len(self._slots),
+            'terms': len(self._postings),
+            'avg_chunk_length': round(self._total_length / len(self._slots), 1) if self._slots else 0
+        }
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Gộp nhiều bảng xếp hạng: score = sum 1 / (k + rank), rank bắt đầu từ 1"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
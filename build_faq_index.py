@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dựng FAQ index: chạy pipeline retrieval + Qwen2.5 cho danh sách câu hỏi
+phổ biến và lưu câu trả lời cùng embedding câu hỏi
+
+API server trả lời các câu hỏi khớp index mà không gọi Ollama, và tự dựng
+lại index (với cùng danh sách câu hỏi) khi knowledge base thay đổi.
+
+Ví dụ:
+    python build_faq_index.py                     # dùng FAQ_QUESTIONS_PATH
+    python build_faq_index.py faq_vetted.json
+    python build_faq_index.py --status
+"""
+
+import argparse
+import time
+
+from api.config import FAQ_QUESTIONS_PATH
+from api.engine import get_engine, shutdown_engine
+from api.faq import FAQIndex, load_questions
+from api.responses import generate_faq_answer, check_ollama_connection
+
+def build(questions_path: str) -> bool:
+    questions = load_questions(questions_path)
+    if not questions:
+        print(f"⚠️ {questions_path} không có câu hỏi nào")
+        return False
+    if any(not item.get('answer') for item in questions) and not check_ollama_connection():
+        print("❌ Ollama không kết nối được, không sinh được câu trả lời")
+        return False
+
+    engine = get_engine()
+    index = FAQIndex()
+
+    def answer(question: str):
+        start_time = time.perf_counter()
+        text = generate_faq_answer(question, engine)
+        status = f"{time.perf_counter() - start_time:.1f}s" if text else "bỏ qua (không có context / Ollama lỗi)"
+        print(f"\n📋 {question} - {status}")
+        if text:
+            print(text)
+        return text
+
+    print(f"❓ Dựng FAQ index cho {len(questions)} câu hỏi...")
+    summary = index.build(
+        questions,
+        engine.knowledge_base.encode_queries,
+        answer,
+        engine.get_kb_version(),
+        engine.knowledge_base.embedding_model_name
+    )
+    print(f"\n✅ {len(index)} câu trả lời (duyệt tay: {summary['vetted']}, "
+          f"sinh tự động: {summary['generated']}, bỏ qua: {summary['skipped']})")
+    print(f"   💾 {index.directory} - KB version {index.kb_version}")
+    return True
+
+def show_status():
+    index = FAQIndex()
+    engine = get_engine()
+    current = index.validate(engine.get_kb_version(), engine.knowledge_base.embedding_model_name)
+    stats = index.get_stats()
+    print(f"📊 FAQ index: {stats['entries']} câu trả lời, dựng lúc {stats['built_at']}")
+    print(f"   KB version: {stats['kb_version']} ({'hiện tại' if current else 'đã cũ, cần dựng lại'})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Dựng FAQ index từ danh sách câu hỏi phổ biến')
+    parser.add_argument('questions', nargs='?', default=FAQ_QUESTIONS_PATH,
+                        help='File .txt (mỗi dòng một câu hỏi) hoặc .json')
+    parser.add_argument('--status', action='store_true', help='Chỉ kiểm tra index còn khớp version KB không')
+    args = parser.parse_args()
+
+    try:
+        if args.status:
+            show_status()
+        elif not build(args.questions):
+            raise SystemExit(1)
+    finally:
+        shutdown_engine()
@@ -0,0 +1,140 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Dict, Optional
+
+import numpy as np
+
+class EmbeddingBatcher:
+    """
+    Gom các lệnh encode đồng thời thành một batch
+
+    Mỗi caller đẩy request vào queue và chờ kết quả. Worker thread lấy
+    request đầu tiên, chờ thêm tối đa max_wait_ms (hoặc tới khi đủ
+    max_batch_size câu) rồi encode tất cả trong một lần gọi model.
+    """
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._close_lock = threading.Lock()  # Kiểm tra _closed và put vào queue như một bước
+        self._closed = False
+
+        # Metrics
+        self.max_queue_depth = 0
+        self.total_requests = 0
+        self.total_texts = 0
+        self.total_batches = 0
+        self.total_wait_time = 0.0
+        self.total_encode_time = 0.0
+
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts (chặn tới khi batch chứa request này chạy xong)"""
+        future: Future = Future()
+        with self._close_lock:
+            # Request vào queue trước marker dừng của close() nên worker luôn xử lý tới
+            closed = self._closed
+            if not closed:
+                self._queue.put((texts, future, time.perf_counter()))
+        if closed:
+            return self.model.encode(texts)
+
+        with self._stats_lock:
+            self.total_requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+        return future.result()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = [first]
+            batch_size = len(first[0])
+            deadline = time.perf_counter() + self.max_wait
+
+            # Gom thêm request cho tới khi hết thời gian chờ hoặc đủ batch
+            while batch_size < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # Để vòng ngoài thoát sau batch này
+                    break
+                batch.append(item)
+                batch_size += len(item[0])
+
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch: List[tuple]):
+        texts = [text for request_texts, _, _ in batch for text in request_texts]
+        start_time = time.perf_counter()
+
+        try:
+            embeddings = self.model.encode(texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        encode_time = time.perf_counter() - start_time
+
+        # Trả về đúng phần embedding của từng caller
+        offset = 0
+        wait_time = 0.0
+        for request_texts, future, enqueued_at in batch:
+            future.set_result(embeddings[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+            wait_time += start_time - enqueued_at
+
+        with self._stats_lock:
+            self.total_batches += 1
+            self.total_texts += len(texts)
+            self.total_wait_time += wait_time
+            self.total_encode_time += encode_time
+
+    def close(self):
+        """Dừng worker (sau khi xử lý hết request đã vào queue), các lệnh encode sau đó chạy trực tiếp"""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join(timeout=5)
+
+        if not self._worker.is_alive():
+            # Worker đã dừng (kể cả do lỗi): request còn sót không được để caller chờ mãi
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None and not item[1].done():
+                    item[1].set_exception(RuntimeError("EmbeddingBatcher đã đóng"))
+
+    def get_stats(self) -> Dict[str, any]:
+        with self._stats_lock:
+            batches = self.total_batches or 1
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'requests': self.total_requests,
+                'texts': self.total_texts,
+                'batches': self.total_batches,
+                'avg_batch_size': round(self.total_texts / batches, 2),
+                'avg_wait_ms': round(self.total_wait_time / max(self.total_requests, 1) * 1000, 2),
+                'avg_encode_ms': round(self.total_encode_time / batches * 1000, 2)
+            }
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Nạp nhiều tài liệu PDF/TXT vào knowledge base song song
+
+Trích xuất + chunk chạy trong process pool (mỗi core một file), embedding
+và ghi Chroma chạy ở process chính theo batch dùng chung cho mọi tài liệu.
+
+Ví dụ:
+    python ingest_documents.py docs/ --recursive
+    python ingest_documents.py "help-center/*.pdf" --workers 8
+"""
+
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, List, Tuple
+
+from api.config import (
+    KB_PERSIST_DIRECTORY,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_RUNTIME,
+    EMBEDDING_ONNX_DIRECTORY,
+    EMBEDDING_ONNX_QUANTIZE,
+    INGEST_BATCH_SIZE,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNK_TOKENIZER,
+    VECTOR_BACKEND,
+    VECTOR_PRECISION,
+    VECTOR_RESCORE_CANDIDATES
+)
+from knowledge_base import KnowledgeBase
+from load_zizi_training import print_ingest_progress
+from pdf_processor import extract_document
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt')
+
+def expand_paths(patterns: Iterable[str], recursive: bool = False) -> List[str]:
+    """Mở rộng file / thư mục / glob thành danh sách file PDF/TXT"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            if recursive:
+                for root, _, files in os.walk(pattern):
+                    paths.extend(os.path.join(root, name) for name in files)
+            else:
+                paths.extend(os.path.join(pattern, name) for name in os.listdir(pattern))
+        else:
+            paths.extend(glob.glob(pattern, recursive=recursive))
+
+    return sorted({
+        os.path.normpath(path) for path in paths
+        if os.path.isfile(path) and path.lower().endswith(SUPPORTED_EXTENSIONS)
+    })
+
+def select_documents(kb: KnowledgeBase, paths: List[str], force: bool = False) -> List[Tuple[str, str, str]]:
+    """Bỏ qua file không đổi kể từ lần nạp trước; trả về (path, document_name, source_hash)"""
+    selected = []
+    names = {}
+    for path in paths:
+        document_name, source_hash = kb.get_source_info(path)
+        if document_name in names:
+            print(f"⚠️ Bỏ qua {path}: trùng tên tài liệu với {names[document_name]}")
+            continue
+        names[document_name] = path
+
+        if not force and kb.is_document_current(document_name, source_hash):
+            print(f"⏭️ {document_name} không thay đổi, bỏ qua")
+            continue
+        selected.append((path, document_name, source_hash))
+    return selected
+
+def iter_extracted(documents: List[Tuple[str, str, str]], workers: int,
+                   stats: Dict[str, float], chunking: Dict[str, any]):
+    """
+    Trích xuất tài liệu trong process pool, yield theo thứ tự hoàn thành
+
+    Chỉ giữ tối đa 2 * workers tài liệu đang xử lý/chờ để bộ nhớ không
+    tăng theo số file.
+    """
+    pending = iter(documents)
+    in_flight = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        def submit_next():
+            for path, document_name, source_hash in pending:
+                future = executor.submit(extract_document, path, **chunking)
+                in_flight[future] = (path, document_name, source_hash)
+                return True
+            return False
+
+        for _ in range(workers * 2):
+            if not submit_next():
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, document_name, source_hash = in_flight.pop(future)
+                submit_next()
+
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"❌ Lỗi khi xử lý {path}: {e}")
+                    stats['failed'] += 1
+                    continue
+
+                stats['extract_seconds'] += result['seconds']
+                print(f"📄 {document_name}: {len(result['chunks'])} chunks "
+                      f"({result['seconds']:.2f}s)")
+                yield document_name, result['chunks'], source_hash
+
+def ingest(patterns: List[str], workers: int = None, force: bool = False,
+           recursive: bool = False) -> Dict[str, Dict[str, int]]:
+    """Nạp các tài liệu khớp patterns và in throughput"""
+    workers = workers or os.cpu_count() or 1
+    paths = expand_paths(patterns, recursive=recursive)
+    if not paths:
+        print("⚠️ Không tìm thấy file PDF/TXT nào")
+        return {}
+
+    kb = KnowledgeBase(
+        KB_PERSIST_DIRECTORY,
+        embedding_model_name=EMBEDDING_MODEL_NAME,
+        embedding_runtime=EMBEDDING_RUNTIME,
+        onnx_directory=EMBEDDING_ONNX_DIRECTORY,
+        onnx_quantize=EMBEDDING_ONNX_QUANTIZE,
+        ingest_batch_size=INGEST_BATCH_SIZE,
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        chunk_tokenizer=CHUNK_TOKENIZER,
+        vector_backend=VECTOR_BACKEND,
+        vector_precision=VECTOR_PRECISION,
+        vector_rescore_candidates=VECTOR_RESCORE_CANDIDATES
+    )
+
+    try:
+        documents = select_documents(kb, paths, force=force)
+        if not documents:
+            print("✅ Tất cả tài liệu đã được cập nhật")
+            return {}
+
+        print(f"🚀 Nạp {len(documents)} tài liệu với {workers} worker...")
+        stats = {'extract_seconds': 0.0, 'failed': 0}
+        start_time = time.perf_counter()
+
+        summaries = kb.add_many_documents(
+            iter_extracted(documents, workers, stats, chunking={
+                'chunk_size': kb.pdf_processor.chunk_size,
+                'chunk_overlap': kb.pdf_processor.chunk_overlap,
+                'tokenizer_name': kb.pdf_processor.tokenizer_name
+            }),
+            progress_callback=print_ingest_progress
+        )
+
+        elapsed = time.perf_counter() - start_time
+        total_chunks = sum(summary['chunks'] for summary in summaries.values())
+        print(f"\n📊 {len(summaries)} tài liệu, {total_chunks} chunks trong {elapsed:.2f}s")
+        print(f"   ⚡ {len(summaries) / elapsed:.2f} docs/s | {total_chunks / elapsed:.1f} chunks/s")
+        print(f"   🧵 Thời gian trích xuất (tổng các worker): {stats['extract_seconds']:.2f}s")
+        if stats['failed']:
+            print(f"   ❌ {stats['failed']} tài liệu lỗi")
+        return summaries
+    finally:
+        kb.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Nạp nhiều tài liệu PDF/TXT vào knowledge base')
+    parser.add_argument('paths', nargs='+', help='File, thư mục hoặc glob (vd: "docs/**/*.pdf")')
+    parser.add_argument('--workers', type=int, default=None, help='Số process trích xuất (mặc định: số CPU)')
+    parser.add_argument('--recursive', action='store_true', help='Duyệt thư mục con / hỗ trợ ** trong glob')
+    parser.add_argument('--force', action='store_true', help='Nạp lại cả các file không thay đổi')
+    args = parser.parse_args()
+
+    ingest(args.paths, workers=args.workers, force=args.force, recursive=args.recursive)
@@ -1,58 +1,228 @@
-import chromadb
+import hashlib
+import itertools
 import json
 import os
-from typing import List, Dict, Optional
-from sentence_transformers import SentenceTransformer
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import List, Dict, Optional, Tuple, Iterable, Callable, Generator, ContextManager
 import numpy as np
 from datetime import datetime
 from pdf_processor import PDFProcessor
+from embedding_batcher import EmbeddingBatcher
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from vector_store import create_vector_store
+
+def load_embedding_model(model_name: str, runtime: str = "torch", onnx_directory: str = "./onnx_models",
+                         onnx_quantize: bool = True):
+    """
+    Tạo embedding model theo runtime: "torch" (SentenceTransformer) hoặc "onnx"
+
+    Import trong hàm để runtime "onnx" không phải nạp torch.
+    """
+    if runtime == "onnx":
+        from onnx_embedder import OnnxEmbedder
+        return OnnxEmbedder(model_name, onnx_directory, quantize=onnx_quantize)
+    if runtime == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    raise ValueError(f"Embedding runtime không hợp lệ: {runtime}")
+
+class QueryEmbeddingCache:
+    """LRU cache embedding của câu query, key theo (model, text đã chuẩn hóa)"""
+    
+    def __init__(self, max_size: int = 2048):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Chuẩn hóa query: Unicode NFC, lowercase, gộp khoảng trắng"""
+        return " ".join(unicodedata.normalize("NFC", text).lower().split())
+    
+    def get(self, key: Tuple[str, str]) -> Optional[np.ndarray]:
+        with self._lock:
+            embedding = self._data.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return embedding
+    
+    def put(self, key: Tuple[str, str], embedding: np.ndarray):
+        # Chặn ghi để caller không làm hỏng embedding đang được cache
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.flags.writeable = False
+        
+        with self._lock:
+            self._data[key] = embedding
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def get_stats(self) -> Dict[str, any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+class IngestProgress:
+    """
+    Đo số lượng và thời gian của từng stage trong pipeline ingest
+    
+    write_guard (nếu có) là context manager bao quanh mỗi lần ghi, ví dụ
+    write lock của RetrievalEngine để search chỉ phải chờ từng batch ghi
+    thay vì cả quá trình ingest.
+    """
+    
+    STAGES = ("chunk", "embed", "write")
+    
+    def __init__(self, callback: Optional[Callable[[Dict[str, any]], None]] = None,
+                 write_guard: Optional[Callable[[], ContextManager]] = None):
+        self.callback = callback
+        self.write_guard = write_guard
+        self.items = {stage: 0 for stage in self.STAGES}
+        self.seconds = {stage: 0.0 for stage in self.STAGES}
+    
+    @contextmanager
+    def stage(self, name: str, items: int):
+        start_time = time.perf_counter()
+        guard = self.write_guard() if name == "write" and self.write_guard else nullcontext()
+        try:
+            with guard:
+                yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start_time
+            self.items[name] += items
+    
+    def batches(self, iterable: Iterable, batch_size: int) -> Generator[List, None, None]:
+        """Gom iterable thành batch, thời gian chờ iterable tính vào stage "chunk"
+        (bao gồm cả đọc file, làm sạch và chia chunk phía trước)"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage("chunk", 0):
+                batch = list(itertools.islice(iterator, batch_size))
+            if not batch:
+                return
+            self.items["chunk"] += len(batch)
+            yield batch
+    
+    def snapshot(self) -> Dict[str, any]:
+        return {
+            stage: {
+                'items': self.items[stage],
+                'seconds': round(self.seconds[stage], 3),
+                'per_second': round(self.items[stage] / self.seconds[stage], 1) if self.seconds[stage] else None
+            }
+            for stage in self.STAGES
+        }
+    
+    def report(self):
+        if self.callback:
+            self.callback(self.snapshot())
 
 class KnowledgeBase:
     """Quản lý knowledge base cho AI Assistant"""
     
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(self, persist_directory: str = "./chroma_db",
+                 embedding_model_name: str = "all-MiniLM-L6-v2",
+                 embedding_runtime: str = "torch",
+                 onnx_directory: str = "./onnx_models",
+                 onnx_quantize: bool = True,
+                 query_cache_size: int = 2048,
+                 batch_queries: bool = False,
+                 batch_max_size: int = 32,
+                 batch_max_wait_ms: float = 5.0,
+                 ingest_batch_size: int = 64,
+                 pdf_extract_workers: int = 1,
+                 pdf_pages_per_shard: int = 32,
+                 chunk_size: int = 1000,
+                 chunk_overlap: int = 200,
+                 chunk_tokenizer: Optional[str] = None,
+                 hybrid_search: bool = True,
+                 hybrid_candidates: int = 20,
+                 rrf_k: int = 60,
+                 vector_backend: str = "chroma",
+                 vector_precision: str = "float32",
+                 vector_rescore_candidates: int = 0):
         self.persist_directory = persist_directory
-        self.client = chromadb.PersistentClient(path=persist_directory)
         
         # Khởi tạo embedding model
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_model_name = embedding_model_name
+        self.embedding_runtime = embedding_runtime
+        self.embedding_model = load_embedding_model(
+            embedding_model_name, embedding_runtime, onnx_directory, onnx_quantize
+        )
+        
+        # Cache embedding cho các query lặp lại
+        self.query_cache = QueryEmbeddingCache(query_cache_size)
+        
+        # Gom encode query từ các request đồng thời thành batch (tùy chọn)
+        self.query_batcher = (
+            EmbeddingBatcher(self.embedding_model, batch_max_size, batch_max_wait_ms)
+            if batch_queries else None
+        )
         
         # Khởi tạo PDF processor
-        self.pdf_processor = PDFProcessor()
+        self.pdf_processor = PDFProcessor(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            tokenizer_name=chunk_tokenizer,
+            extract_workers=pdf_extract_workers,
+            pages_per_shard=pdf_pages_per_shard
+        )
         
-        # Tạo hoặc lấy collection
-        collection_name = "app_guide_knowledge"
-        try:
-            # Thử lấy collection có sẵn
-            self.collection = self.client.get_collection(collection_name)
-        except Exception as e:
-            try:
-                # Nếu không tồn tại, tạo mới
-                self.collection = self.client.create_collection(
-                    name=collection_name,
-                    metadata={"description": "Knowledge base for app guidance"}
-                )
-            except Exception as create_error:
-                # Nếu tạo mới thất bại, thử get_or_create
-                try:
-                    self.collection = self.client.get_or_create_collection(
-                        name=collection_name,
-                        metadata={"description": "Knowledge base for app guidance"}
-                    )
-                except Exception as final_error:
-                    print(f"Lỗi khởi tạo collection: {final_error}")
-                    raise final_error
+        # Số chunk encode + ghi mỗi lần khi ingest
+        self.ingest_batch_size = ingest_batch_size
+        
+        # Vector store ("chroma" hoặc "numpy"), cùng API với collection của Chroma;
+        # backend numpy có thể lưu float16/int8 và rescore ứng viên bằng float32
+        self.vector_backend = vector_backend
+        self.collection = create_vector_store(
+            vector_backend,
+            persist_directory,
+            precision=vector_precision,
+            rescore_candidates=vector_rescore_candidates
+        )
         
-        # File để lưu metadata
-        self.metadata_file = os.path.join(persist_directory, "metadata.json")
+        # Index BM25 cho tìm kiếm từ khóa, dựng lại từ collection ở lần search đầu
+        self.bm25 = BM25Index() if hybrid_search else None
+        self.hybrid_candidates = hybrid_candidates
+        self.rrf_k = rrf_k
+        self._bm25_ready = False
+        self._bm25_lock = threading.Lock()
+        
+        # File để lưu metadata (theo từng backend, vì mỗi backend có dữ liệu riêng)
+        self.metadata_file = os.path.join(self.collection.directory, "metadata.json")
         self.load_metadata()
     
-    def load_txt(self, txt_path: str) -> bool:
+    def load_txt(self, txt_path: str, force: bool = False,
+                 progress_callback: Optional[Callable[[Dict[str, any]], None]] = None) -> bool:
         """
         Load TXT file vào knowledge base
         
         Args:
             txt_path: Đường dẫn đến file TXT
+            force: Nạp lại kể cả khi file không đổi
+            progress_callback: Nhận thống kê throughput từng stage
             
         Returns:
             True nếu thành công, False nếu thất bại
@@ -62,33 +232,36 @@ class KnowledgeBase:
                 print(f"❌ File không tồn tại: {txt_path}")
                 return False
             
-            # Đọc file txt
-            print(f"📄 Processing TXT: {txt_path}")
-            with open(txt_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Chia thành chunks bằng PDF processor (reuse chunking logic)
-            text_chunks = self.pdf_processor._create_chunks(content)
+            # File không đổi kể từ lần nạp trước: bỏ qua
+            document_name, source_hash = self.get_source_info(txt_path)
+            if not force and self.is_document_current(document_name, source_hash):
+                print(f"⏭️ {txt_path} không thay đổi, bỏ qua")
+                return True
             
-            # Lấy tên file làm document name
-            document_name = os.path.basename(txt_path).replace('.txt', '')
+            # Đọc từng dòng → làm sạch → chunk (reuse chunking logic của PDF processor)
+            print(f"📄 Processing TXT: {txt_path}")
+            text_chunks = self.pdf_processor.iter_txt_chunks(txt_path)
             
-            # Thêm vào knowledge base
-            self.add_documents(text_chunks, document_name)
+            # Encode + ghi theo batch (chỉ embed chunk mới/đổi)
+            summary = self.add_documents(text_chunks, document_name, source_hash=source_hash,
+                                         progress_callback=progress_callback)
             
-            print(f"✅ Successfully loaded {len(text_chunks)} chunks from {txt_path}")
+            print(f"✅ Successfully loaded {summary['chunks']} chunks from {txt_path}")
             return True
             
         except Exception as e:
             print(f"❌ Error loading TXT {txt_path}: {e}")
             return False
     
-    def load_pdf(self, pdf_path: str) -> bool:
+    def load_pdf(self, pdf_path: str, force: bool = False,
+                 progress_callback: Optional[Callable[[Dict[str, any]], None]] = None) -> bool:
         """
         Load PDF file vào knowledge base
         
         Args:
             pdf_path: Đường dẫn đến file PDF
+            force: Nạp lại kể cả khi file không đổi
+            progress_callback: Nhận thống kê throughput từng stage
             
         Returns:
             True nếu thành công, False nếu thất bại
@@ -98,25 +271,38 @@ class KnowledgeBase:
                 print(f"❌ File không tồn tại: {pdf_path}")
                 return False
             
-            # Extract và chunk PDF
-            print(f"📄 Processing PDF: {pdf_path}")
-            text_chunks = self.pdf_processor.extract_and_chunk_pdf(pdf_path)
+            # File không đổi kể từ lần nạp trước: bỏ qua
+            document_name, source_hash = self.get_source_info(pdf_path)
+            if not force and self.is_document_current(document_name, source_hash):
+                print(f"⏭️ {pdf_path} không thay đổi, bỏ qua")
+                return True
             
-            # Lấy tên file làm document name
-            document_name = os.path.basename(pdf_path).replace('.pdf', '')
+            # Extract từng trang → làm sạch → chunk
+            print(f"📄 Processing PDF: {pdf_path}")
+            text_chunks = self.pdf_processor.iter_pdf_chunks(pdf_path)
             
-            # Thêm vào knowledge base
-            self.add_documents(text_chunks, document_name)
+            # Encode + ghi theo batch (chỉ embed chunk mới/đổi)
+            summary = self.add_documents(text_chunks, document_name, source_hash=source_hash,
+                                         progress_callback=progress_callback)
             
-            print(f"✅ Successfully loaded {len(text_chunks)} chunks from {pdf_path}")
+            print(f"✅ Successfully loaded {summary['chunks']} chunks from {pdf_path}")
             return True
             
         except Exception as e:
             print(f"❌ Error loading PDF {pdf_path}: {e}")
             return False
     
+    def _stat_metadata(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.metadata_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+    
     def load_metadata(self):
         """Tải metadata từ file"""
+        # Stat trước khi đọc: file bị thay giữa chừng thì lần kiểm tra sau vẫn thấy khác
+        self._metadata_stat = self._stat_metadata()
         try:
             if os.path.exists(self.metadata_file):
                 with open(self.metadata_file, 'r', encoding='utf-8') as f:
@@ -124,117 +310,520 @@ class KnowledgeBase:
             else:
                 self.metadata = {
                     'documents': [],
+                    'versions': {},
                     'total_chunks': 0,
                     'last_updated': None
                 }
         except Exception:
             self.metadata = {
                 'documents': [],
+                'versions': {},
                 'total_chunks': 0,
                 'last_updated': None
             }
     
     def save_metadata(self):
-        """Lưu metadata vào file"""
+        """Lưu metadata vào file (sau khi vector store đã ghi xuống đĩa)"""
         try:
+            self.collection.flush()
             os.makedirs(self.persist_directory, exist_ok=True)
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
+            # Ghi file tạm rồi đổi tên: process khác không đọc phải file ghi dở
+            temp_file = f"{self.metadata_file}.tmp-{os.getpid()}"
+            with open(temp_file, 'w', encoding='utf-8') as f:
                 json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.metadata_file)
+            self._metadata_stat = self._stat_metadata()
         except Exception as e:
             print(f"Lỗi lưu metadata: {e}")
     
-    def add_documents(self, text_chunks: List[Dict[str, str]], document_name: str):
+    def add_documents(self, text_chunks: Iterable[Dict[str, str]], document_name: str,
+                      source_hash: Optional[str] = None,
+                      progress_callback: Optional[Callable[[Dict[str, any]], None]] = None,
+                      write_guard: Optional[Callable[[], ContextManager]] = None) -> Dict[str, int]:
         """
-        Thêm tài liệu vào knowledge base
+        Thêm (hoặc cập nhật) tài liệu trong knowledge base
+        
+        ID của chunk là hash nội dung, nên khi nạp lại một tài liệu chỉ các
+        chunk mới/đổi nội dung mới phải tạo embedding; chunk không còn trong
+        tài liệu bị xóa, chunk đổi vị trí chỉ được cập nhật metadata.
+        
+        text_chunks có thể là generator: chunk được encode và ghi theo từng
+        batch ingest_batch_size nên bộ nhớ không tăng theo kích thước tài liệu.
         
         Args:
-            text_chunks: List các text chunks
+            text_chunks: List hoặc iterator các text chunks
             document_name: Tên tài liệu
+            source_hash: Hash của file nguồn (để bỏ qua lần nạp lại không đổi)
+            progress_callback: Nhận thống kê throughput từng stage sau mỗi batch
+            write_guard: Context manager bao quanh mỗi lần ghi (vd: write lock)
+            
+        Returns:
+            Số chunk added / moved / unchanged / removed
+        """
+        summaries = self.add_many_documents([(document_name, text_chunks, source_hash)],
+                                            progress_callback, write_guard)
+        return summaries[document_name]
+    
+    def add_many_documents(self, documents: Iterable[Tuple[str, Iterable[Dict[str, str]], Optional[str]]],
+                           progress_callback: Optional[Callable[[Dict[str, any]], None]] = None,
+                           write_guard: Optional[Callable[[], ContextManager]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Thêm nhiều tài liệu qua một stage embedding và một writer duy nhất
+        
+        Chunk cần embed của các tài liệu được gom chung vào batch
+        ingest_batch_size, nên nhiều tài liệu nhỏ vẫn được encode theo batch đầy.
+        
+        Args:
+            documents: Iterator (document_name, text_chunks, source_hash)
+            progress_callback: Nhận thống kê throughput từng stage sau mỗi batch
+            write_guard: Context manager bao quanh mỗi lần ghi (vd: write lock)
+            
+        Returns:
+            Dict document_name -> số chunk added / moved / unchanged / removed
         """
-        if not text_chunks:
+        progress = IngestProgress(progress_callback, write_guard)
+        pending = []  # (chunk_id, content, metadata) chờ embed
+        summaries = {}
+        versions = {}
+        
+        for document_name, text_chunks, source_hash in documents:
+            self._rename_legacy_document(document_name, progress)
+            summaries[document_name], versions[document_name] = self._diff_document(
+                document_name, text_chunks, source_hash, pending, progress
+            )
+        
+        self._flush_pending(pending, progress, flush_all=True)
+        progress.report()
+        
+        # Chỉ ghi version sau khi mọi chunk đã nằm trong collection
+        with progress.stage("write", 0):
+            for document_name, version in versions.items():
+                if version['chunks'] and document_name not in self.metadata['documents']:
+                    self.metadata['documents'].append(document_name)
+                elif not version['chunks'] and document_name in self.metadata['documents']:
+                    self.metadata['documents'].remove(document_name)
+                self.metadata.setdefault('versions', {})[document_name] = version
+            
+            if versions:
+                self.metadata['total_chunks'] = self.collection.count()
+                self.metadata['last_updated'] = datetime.now().isoformat()
+                self.save_metadata()
+        
+        for document_name, summary in summaries.items():
+            print(f"Đã cập nhật {document_name}: +{summary['added']} ~{summary['moved']} "
+                  f"={summary['unchanged']} -{summary['removed']} chunks")
+        return summaries
+    
+    def _rename_legacy_document(self, document_name: str, progress: "IngestProgress"):
+        """
+        Đổi tên tài liệu nạp khi tên chưa có phần mở rộng ("guide" thành "guide.pdf")
+        
+        Chunk được ghi lại dưới ID mới cùng embedding cũ, nên lần nạp đầu
+        tiên sau khi đổi cách đặt tên không phải embed lại cả tài liệu.
+        """
+        legacy_name = os.path.splitext(document_name)[0]
+        versions = self.metadata.setdefault('versions', {})
+        if legacy_name == document_name or document_name in versions or legacy_name not in versions:
             return
         
-        # Tạo embeddings cho tất cả chunks
-        texts = [chunk['content'] for chunk in text_chunks]
-        embeddings = self.embedding_model.encode(texts)
-        
-        # Chuẩn bị dữ liệu cho ChromaDB
-        ids = []
-        metadatas = []
-        documents = []
-        
-        for i, chunk in enumerate(text_chunks):
-            chunk_id = f"{document_name}_{chunk['id']}"
-            ids.append(chunk_id)
-            documents.append(chunk['content'])
-            metadatas.append({
-                'document_name': document_name,
-                'chunk_id': chunk['id'],
-                'length': chunk['length'],
-                'timestamp': datetime.now().isoformat()
-            })
-        
-        # Thêm vào collection
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings.tolist(),
-            documents=documents,
-            metadatas=metadatas
+        existing = self.collection.get(
+            where={"document_name": legacy_name},
+            include=["documents", "metadatas", "embeddings"]
         )
+        for start in range(0, len(existing['ids']), self.ingest_batch_size):
+            end = start + self.ingest_batch_size
+            old_ids = existing['ids'][start:end]
+            new_ids = [document_name + chunk_id[len(legacy_name):] for chunk_id in old_ids]
+            contents = existing['documents'][start:end]
+            metadatas = [dict(metadata or {}, document_name=document_name)
+                         for metadata in existing['metadatas'][start:end]]
+            with progress.stage("write", len(old_ids)):
+                self.collection.upsert(
+                    ids=new_ids,
+                    embeddings=existing['embeddings'][start:end],
+                    documents=contents,
+                    metadatas=metadatas
+                )
+                self.collection.delete(ids=old_ids)
+                self._update_lexical_index(new_ids, contents, removed_ids=old_ids)
+        
+        versions[document_name] = versions.pop(legacy_name)
+        if legacy_name in self.metadata['documents']:
+            self.metadata['documents'].remove(legacy_name)
+        print(f"Đã đổi tên tài liệu {legacy_name} thành {document_name}")
+    
+    def _diff_document(self, document_name: str, text_chunks: Iterable[Dict[str, str]],
+                       source_hash: Optional[str], pending: List[tuple],
+                       progress: "IngestProgress") -> Tuple[Dict[str, int], Dict[str, any]]:
+        """So sánh chunk mới với chunk đang có, đưa chunk cần embed vào pending"""
+        # Chunk đang có của tài liệu (chỉ ID + vị trí)
+        existing = self.collection.get(
+            where={"document_name": document_name},
+            include=["metadatas"]
+        )
+        existing_positions = {
+            chunk_id: (metadata or {}).get('position')
+            for chunk_id, metadata in zip(existing['ids'], existing['metadatas'])
+        }
+        
+        timestamp = datetime.now().isoformat()
+        occurrences = {}
+        seen_ids = set()
+        version_digest = hashlib.sha1()
+        summary = {'added': 0, 'moved': 0, 'unchanged': 0, 'removed': 0}
+        position = 0
+        
+        for batch in progress.batches(text_chunks, self.ingest_batch_size):
+            # Chunk ID theo nội dung; nội dung trùng lặp trong tài liệu được đánh số
+            moved = []
+            for chunk in batch:
+                content_hash = _content_hash(chunk['content'])
+                occurrence = occurrences.get(content_hash, 0)
+                occurrences[content_hash] = occurrence + 1
+                chunk_id = f"{document_name}_{content_hash}"
+                if occurrence:
+                    chunk_id += f"_{occurrence}"
+                
+                seen_ids.add(chunk_id)
+                version_digest.update(content_hash.encode('utf-8'))
+                metadata = {
+                    'document_name': document_name,
+                    'chunk_id': chunk['id'],
+                    'position': position,
+                    'content_hash': content_hash,
+                    'length': chunk['length'],
+                    'timestamp': timestamp
+                }
+                
+                if chunk_id not in existing_positions:
+                    # Chỉ tạo embedding cho chunk mới hoặc đã đổi nội dung
+                    pending.append((chunk_id, chunk['content'], metadata))
+                    summary['added'] += 1
+                elif existing_positions[chunk_id] != position:
+                    moved.append((chunk_id, metadata))
+                else:
+                    summary['unchanged'] += 1
+                position += 1
+            
+            if moved:
+                # Nội dung không đổi: giữ nguyên embedding, chỉ cập nhật vị trí
+                with progress.stage("write", len(moved)):
+                    self.collection.update(
+                        ids=[chunk_id for chunk_id, _ in moved],
+                        metadatas=[metadata for _, metadata in moved]
+                    )
+                summary['moved'] += len(moved)
+            
+            self._flush_pending(pending, progress)
+        
+        # Xóa các chunk không còn trong tài liệu
+        removed_ids = [chunk_id for chunk_id in existing_positions if chunk_id not in seen_ids]
+        for start in range(0, len(removed_ids), self.ingest_batch_size):
+            batch_ids = removed_ids[start:start + self.ingest_batch_size]
+            with progress.stage("write", len(batch_ids)):
+                self.collection.delete(ids=batch_ids)
+                self._update_lexical_index(removed_ids=batch_ids)
+        summary['removed'] = len(removed_ids)
+        summary['chunks'] = position
+        
+        version = {
+            'version': version_digest.hexdigest()[:16],
+            'source_hash': source_hash,
+            'chunks': position,
+            'updated': timestamp
+        }
+        return summary, version
+    
+    def _flush_pending(self, pending: List[tuple], progress: "IngestProgress", flush_all: bool = False):
+        """Encode + upsert các batch đầy trong pending (hoặc tất cả nếu flush_all)"""
+        while pending and (flush_all or len(pending) >= self.ingest_batch_size):
+            batch = pending[:self.ingest_batch_size]
+            del pending[:self.ingest_batch_size]
+            
+            with progress.stage("embed", len(batch)):
+                embeddings = self.embedding_model.encode([content for _, content, _ in batch])
+            
+            with progress.stage("write", len(batch)):
+                self.collection.upsert(
+                    ids=[chunk_id for chunk_id, _, _ in batch],
+                    embeddings=embeddings,
+                    documents=[content for _, content, _ in batch],
+                    metadatas=[metadata for _, _, metadata in batch]
+                )
+                self._update_lexical_index(
+                    [chunk_id for chunk_id, _, _ in batch],
+                    [content for _, content, _ in batch]
+                )
+            progress.report()
+    
+    def has_external_changes(self) -> bool:
+        """
+        True nếu process khác (worker khác, ingest_documents.py) đã ghi KB
+        kể từ lần nạp / ghi gần nhất của process này
         
-        # Cập nhật metadata
-        if document_name not in self.metadata['documents']:
-            self.metadata['documents'].append(document_name)
+        metadata.json được ghi sau khi vector store đã commit, nên (inode,
+        mtime) của nó đổi là dấu hiệu dữ liệu mới đã đầy đủ trên đĩa.
+        """
+        return self._stat_metadata() != self._metadata_stat
+    
+    def reload(self):
+        """Nạp lại vector store, metadata và dựng lại BM25 sau khi process khác ghi"""
+        self.collection.refresh()
+        self.load_metadata()
+        if self.bm25 is not None:
+            with self._bm25_lock:
+                self._bm25_ready = False
+        print(f"🔄 Knowledge base được process khác cập nhật, đã nạp lại (version {self.get_version()})")
+    
+    def get_source_info(self, path: str) -> Tuple[str, str]:
+        """
+        Tên tài liệu và hash của file nguồn
+        
+        Hash gồm cả tham số chunking, nên đổi cấu hình chunk thì tài liệu
+        không còn được coi là "không đổi" và sẽ được chunk lại.
+        """
+        source_hash = f"{_file_hash(path)}:{self.pdf_processor.get_signature()}"
+        return document_name_from_path(path), source_hash
+    
+    def get_version(self) -> str:
+        """Version của cả knowledge base: đổi khi có tài liệu được thêm/sửa/xóa hoặc đổi model"""
+        digest = hashlib.sha1(self.embedding_model_name.encode('utf-8'))
+        for document_name, version in sorted(self.metadata.get('versions', {}).items()):
+            digest.update(f"{document_name}:{version.get('version')}\n".encode('utf-8'))
+        return digest.hexdigest()[:16]
+    
+    def is_document_current(self, document_name: str, source_hash: str) -> bool:
+        """True nếu tài liệu đã được nạp từ đúng file nguồn này"""
+        version = self.metadata.get('versions', {}).get(document_name)
+        return bool(version) and version.get('source_hash') == source_hash
+    
+    def encode_query(self, query: str) -> np.ndarray:
+        """Tạo embedding cho một câu hỏi (có cache cho query lặp lại)"""
+        key = (self.embedding_model_name, QueryEmbeddingCache.normalize(query))
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = self._encode_queries([query])[0]
+            self.query_cache.put(key, embedding)
+        return embedding
+    
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Tạo embedding cho nhiều query trong một lần encode
         
-        self.metadata['total_chunks'] += len(text_chunks)
-        self.metadata['last_updated'] = datetime.now().isoformat()
+        Query đã có trong cache không được encode lại; các query còn lại
+        được encode chung một batch.
+        """
+        keys = [(self.embedding_model_name, QueryEmbeddingCache.normalize(q)) for q in queries]
+        embeddings = [self.query_cache.get(key) for key in keys]
         
-        self.save_metadata()
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            encoded = self._encode_queries([queries[i] for i in missing])
+            for i, embedding in zip(missing, encoded):
+                self.query_cache.put(keys[i], embedding)
+                embeddings[i] = embedding
         
-        print(f"Đã thêm {len(text_chunks)} chunks từ {document_name}")
+        return np.vstack(embeddings)
     
-    def search(self, query: str, k: int = 5) -> List[Dict[str, any]]:
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode query qua batcher nếu bật, không thì gọi model trực tiếp"""
+        if self.query_batcher is not None:
+            return self.query_batcher.encode(queries)
+        return self.embedding_model.encode(queries)
+    
+    def search(self, query: str, k: int = 5, query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, any]]:
         """
         Tìm kiếm thông tin liên quan đến câu hỏi
         
+        Khi bật hybrid search, kết quả vector (Chroma) và kết quả từ khóa
+        (BM25) được gộp bằng reciprocal-rank fusion; chunk chỉ khớp từ khóa
+        có distance = None.
+        
         Args:
             query: Câu hỏi tìm kiếm
             k: Số lượng kết quả trả về
+            query_embedding: Embedding đã tính sẵn của query (tránh encode lại)
             
         Returns:
             List các document liên quan
         """
-        if self.collection.count() == 0:
+        total = self.collection.count()
+        if total == 0:
             return []
         
         try:
+            # Tìm kiếm từ khóa trước (rẻ), để biết có cần lấy thêm ứng viên vector
+            lexical = self.lexical_search(query, max(k, self.hybrid_candidates))
+            n_results = min(max(k, self.hybrid_candidates) if lexical else k, total)
+            
             # Tạo embedding cho query
-            query_embedding = self.embedding_model.encode([query])
+            if query_embedding is None:
+                query_embedding = self.encode_query(query)
             
             # Tìm kiếm
             results = self.collection.query(
-                query_embeddings=query_embedding.tolist(),
-                n_results=min(k, self.collection.count())
+                query_embeddings=np.asarray(query_embedding)[None, :],
+                n_results=n_results
             )
+            vector_results = self._parse_query_results(results, 0)
             
-            # Xử lý kết quả
-            search_results = []
+            if not lexical:
+                return vector_results[:k]
+            return self._fuse_results(vector_results, lexical, k)
             
-            if results['documents'] and results['documents'][0]:
-                for i in range(len(results['documents'][0])):
-                    result = {
-                        'content': results['documents'][0][i],
-                        'metadata': results['metadatas'][0][i],
-                        'distance': results['distances'][0][i] if 'distances' in results else 0,
-                        'id': results['ids'][0][i]
-                    }
-                    search_results.append(result)
+        except Exception as e:
+            print(f"Lỗi tìm kiếm: {e}")
+            return []
+    
+    def lexical_search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Tìm kiếm từ khóa BM25: list (chunk_id, score), rỗng nếu tắt hybrid search"""
+        index = self._get_lexical_index()
+        if index is None:
+            return []
+        return index.search(query, k)
+    
+    def _fuse_results(self, vector_results: List[Dict[str, any]],
+                      lexical: List[Tuple[str, float]], k: int) -> List[Dict[str, any]]:
+        """Gộp kết quả vector + BM25 bằng RRF, lấy nội dung chunk còn thiếu từ Chroma"""
+        lexical_scores = dict(lexical)
+        fused = reciprocal_rank_fusion(
+            [[result['id'] for result in vector_results], [chunk_id for chunk_id, _ in lexical]],
+            k=self.rrf_k
+        )[:k]
+        
+        by_id = {result['id']: result for result in vector_results}
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in by_id]
+        if missing:
+            fetched = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id, content, metadata in zip(fetched['ids'], fetched['documents'], fetched['metadatas']):
+                by_id[chunk_id] = {
+                    'content': content,
+                    'metadata': metadata,
+                    'distance': None,
+                    'id': chunk_id
+                }
+        
+        search_results = []
+        for chunk_id, score in fused:
+            if chunk_id in by_id:
+                result = dict(by_id[chunk_id])
+                result['score'] = score
+                result['bm25'] = lexical_scores.get(chunk_id)
+                search_results.append(result)
+        return search_results
+    
+    def warmup(self) -> Dict[str, float]:
+        """
+        Chạy trước các bước khởi tạo lười để request đầu tiên không phải chờ:
+        một lần encode giả (nạp trọng số, cấp phát bộ nhớ runtime) và dựng index BM25
+        """
+        timings = {}
+        start_time = time.perf_counter()
+        self.embedding_model.encode(["warmup"])
+        timings['encode_seconds'] = round(time.perf_counter() - start_time, 3)
+        
+        start_time = time.perf_counter()
+        self._get_lexical_index()
+        timings['lexical_index_seconds'] = round(time.perf_counter() - start_time, 3)
+        return timings
+    
+    def _get_lexical_index(self) -> Optional[BM25Index]:
+        """Index BM25, dựng từ toàn bộ collection ở lần dùng đầu tiên"""
+        if self.bm25 is None or self._bm25_ready:
+            return self.bm25
+        
+        with self._bm25_lock:
+            if not self._bm25_ready:
+                start_time = time.perf_counter()
+                self.bm25.clear()
+                offset = 0
+                while True:
+                    page = self.collection.get(include=["documents"], limit=5000, offset=offset)
+                    if not page['ids']:
+                        break
+                    self.bm25.add(page['ids'], page['documents'])
+                    offset += len(page['ids'])
+                self._bm25_ready = True
+                print(f"Đã dựng BM25 index cho {len(self.bm25)} chunks "
+                      f"({time.perf_counter() - start_time:.2f}s)")
+        return self.bm25
+    
+    def _update_lexical_index(self, chunk_ids: List[str] = (), contents: List[str] = (),
+                              removed_ids: List[str] = ()):
+        # Index chưa dựng thì bỏ qua: lần dựng đầu tiên sẽ đọc lại collection
+        if self.bm25 is None or not self._bm25_ready:
+            return
+        with self._bm25_lock:
+            self.bm25.remove(removed_ids)
+            self.bm25.add(chunk_ids, contents)
+    
+    def search_many(self, queries: List[str], k: int = 5,
+                    max_distance: Optional[float] = None,
+                    stop_at_distance: Optional[float] = None) -> List[List[Dict[str, any]]]:
+        """
+        Tìm kiếm nhiều query bằng một lần encode và một lần query Chroma
+        
+        Chỉ dùng vector search (distance luôn có giá trị cho max_distance /
+        stop_at_distance); dùng search() cho hybrid search.
+        
+        Args:
+            queries: Danh sách câu query
+            k: Số lượng kết quả cho mỗi query
+            max_distance: Bỏ các kết quả có distance lớn hơn ngưỡng này
+            stop_at_distance: Early exit - dừng ở query đầu tiên có kết quả
+                tốt nhất với distance nhỏ hơn ngưỡng, các query sau bị bỏ qua
             
-            return search_results
+        Returns:
+            List kết quả theo thứ tự queries (có thể ngắn hơn nếu early exit)
+        """
+        if not queries:
+            return []
+        
+        total = self.collection.count()
+        if total == 0:
+            return [[] for _ in queries]
+        
+        try:
+            query_embeddings = self.encode_queries(queries)
+            
+            results = self.collection.query(
+                query_embeddings=query_embeddings,
+                n_results=min(k, total)
+            )
+            
+            all_results = []
+            for i in range(len(queries)):
+                search_results = self._parse_query_results(results, i)
+                if max_distance is not None:
+                    search_results = [r for r in search_results if r['distance'] <= max_distance]
+                all_results.append(search_results)
+                
+                if (stop_at_distance is not None and search_results
+                        and search_results[0]['distance'] < stop_at_distance):
+                    break
+            
+            return all_results
             
         except Exception as e:
             print(f"Lỗi tìm kiếm: {e}")
-            return []
+            return [[] for _ in queries]
+    
+    @staticmethod
+    def _parse_query_results(results: Dict[str, any], index: int) -> List[Dict[str, any]]:
+        """Chuyển kết quả collection.query của query thứ index thành list dict"""
+        search_results = []
+        
+        if results['documents'] and results['documents'][index]:
+            for i in range(len(results['documents'][index])):
+                result = {
+                    'content': results['documents'][index][i],
+                    'metadata': results['metadatas'][index][i],
+                    'distance': results['distances'][index][i] if results.get('distances') else 0,
+                    'id': results['ids'][index][i]
+                }
+                search_results.append(result)
+        
+        return search_results
     
     def search_by_document(self, document_name: str, query: str = None, k: int = 10) -> List[Dict[str, any]]:
         """
@@ -251,10 +840,10 @@ class KnowledgeBase:
         try:
             if query:
                 # Tìm kiếm theo query trong document
-                query_embedding = self.embedding_model.encode([query])
+                query_embedding = self.encode_query(query)
                 
                 results = self.collection.query(
-                    query_embeddings=query_embedding.tolist(),
+                    query_embeddings=query_embedding[None, :],
                     n_results=k,
                     where={"document_name": document_name}
                 )
@@ -302,18 +891,21 @@ class KnowledgeBase:
         try:
             # Lấy tất cả IDs của document
             results = self.collection.get(
-                where={"document_name": document_name}
+                where={"document_name": document_name},
+                include=[]
             )
             
             if results['ids']:
                 # Xóa tất cả chunks của document
                 self.collection.delete(ids=results['ids'])
+                self._update_lexical_index(removed_ids=results['ids'])
                 
                 # Cập nhật metadata
                 if document_name in self.metadata['documents']:
                     self.metadata['documents'].remove(document_name)
+                self.metadata.get('versions', {}).pop(document_name, None)
                 
-                self.metadata['total_chunks'] -= len(results['ids'])
+                self.metadata['total_chunks'] = self.collection.count()
                 self.metadata['last_updated'] = datetime.now().isoformat()
                 
                 self.save_metadata()
@@ -337,7 +929,9 @@ class KnowledgeBase:
                 'total_chunks': collection_count,
                 'documents': self.metadata['documents'],
                 'last_updated': self.metadata['last_updated'],
-                'database_size': self._get_db_size()
+                'database_size': self._get_db_size(),
+                'vector_backend': self.vector_backend,
+                'vector_store': self.collection.get_stats()
             }
         except Exception:
             return {
@@ -363,18 +957,17 @@ class KnowledgeBase:
     def clear_all(self) -> bool:
         """Xóa toàn bộ knowledge base"""
         try:
-            # Xóa collection
-            self.client.delete_collection("app_guide_knowledge")
+            # Xóa rồi tạo lại collection
+            self.collection.reset()
             
-            # Tạo lại collection mới
-            self.collection = self.client.create_collection(
-                name="app_guide_knowledge",
-                metadata={"description": "Knowledge base for app guidance"}
-            )
+            if self.bm25 is not None:
+                self.bm25.clear()
+                self._bm25_ready = True
             
             # Reset metadata
             self.metadata = {
                 'documents': [],
+                'versions': {},
                 'total_chunks': 0,
                 'last_updated': None
             }
@@ -387,10 +980,45 @@ class KnowledgeBase:
             print(f"Lỗi xóa knowledge base: {e}")
             return False
     
+    def get_lexical_index_stats(self) -> Optional[Dict[str, any]]:
+        """Thống kê BM25 index (None nếu tắt hybrid search hoặc chưa dựng)"""
+        if self.bm25 is None or not self._bm25_ready:
+            return None
+        return self.bm25.get_stats()
+    
+    def get_query_cache_stats(self) -> Dict[str, any]:
+        """Thống kê cache embedding của query"""
+        return self.query_cache.get_stats()
+    
+    def get_batcher_stats(self) -> Optional[Dict[str, any]]:
+        """Thống kê batching encode query (None nếu không bật)"""
+        return self.query_batcher.get_stats() if self.query_batcher else None
+    
+    def close(self):
+        """Dừng các thread nền (batcher)"""
+        if self.query_batcher is not None:
+            self.query_batcher.close()
+    
     def get_document_list(self) -> List[str]:
         """Lấy danh sách tài liệu"""
         return self.metadata['documents'].copy()
     
     def is_empty(self) -> bool:
         """Kiểm tra knowledge base có trống không"""
-        return self.collection.count() == 0 
\ No newline at end of file
+        return self.collection.count() == 0
+
+def _content_hash(text: str) -> str:
+    """Hash ngắn của nội dung chunk (dùng làm ID ổn định)"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+def _file_hash(path: str) -> str:
+    """SHA-256 của file nguồn"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def document_name_from_path(path: str) -> str:
+    """Tên tài liệu = tên file kèm phần mở rộng (guide.pdf và guide.txt là hai tài liệu)"""
+    return os.path.basename(path)
@@ -5,18 +5,59 @@ Load Zizi Project TXT vào knowledge base để train AI Assistant
 """
 
 from knowledge_base import KnowledgeBase
+from api.config import (
+    KB_PERSIST_DIRECTORY,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_RUNTIME,
+    EMBEDDING_ONNX_DIRECTORY,
+    EMBEDDING_ONNX_QUANTIZE,
+    INGEST_BATCH_SIZE,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNK_TOKENIZER,
+    VECTOR_BACKEND,
+    VECTOR_PRECISION,
+    VECTOR_RESCORE_CANDIDATES
+)
+import argparse
 import os
 
-def load_zizi_txt():
-    """Load file txt Zizi vào knowledge base"""
+def print_ingest_progress(stats):
+    """In throughput từng stage của pipeline ingest"""
+    parts = []
+    for stage, values in stats.items():
+        rate = f"{values['per_second']}/s" if values['per_second'] else "-"
+        parts.append(f"{stage}: {values['items']} ({rate})")
+    print("   ⏳ " + " | ".join(parts))
+
+def load_zizi_txt(rebuild: bool = False):
+    """
+    Load file txt Zizi vào knowledge base
+    
+    Mặc định chỉ embed lại các đoạn mới/đã sửa; rebuild=True xóa toàn bộ và nạp lại.
+    """
     print("📚 Loading Zizi Project TXT into knowledge base...")
     
-    # Initialize knowledge base
-    kb = KnowledgeBase()
+    # Initialize knowledge base (cùng cấu hình chunking với API server / ingest_documents.py,
+    # nếu không chunk ID lệch và lần nạp sau phải embed lại toàn bộ)
+    kb = KnowledgeBase(
+        KB_PERSIST_DIRECTORY,
+        embedding_model_name=EMBEDDING_MODEL_NAME,
+        embedding_runtime=EMBEDDING_RUNTIME,
+        onnx_directory=EMBEDDING_ONNX_DIRECTORY,
+        onnx_quantize=EMBEDDING_ONNX_QUANTIZE,
+        ingest_batch_size=INGEST_BATCH_SIZE,
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        chunk_tokenizer=CHUNK_TOKENIZER,
+        vector_backend=VECTOR_BACKEND,
+        vector_precision=VECTOR_PRECISION,
+        vector_rescore_candidates=VECTOR_RESCORE_CANDIDATES
+    )
     
-    # Clear existing data first
-    print("🧹 Clearing existing knowledge base...")
-    kb.clear_all()
+    if rebuild:
+        print("🧹 Clearing existing knowledge base...")
+        kb.clear_all()
     
     # Load the Zizi txt file
     txt_file = "huong-dan-su-dung-zizi-project-day-du.txt"
@@ -24,7 +65,7 @@ def load_zizi_txt():
     if os.path.exists(txt_file):
         try:
             print(f"📄 Loading: {txt_file}")
-            success = kb.load_txt(txt_file)
+            success = kb.load_txt(txt_file, progress_callback=print_ingest_progress)
             
             if success:
                 print(f"✅ Successfully loaded: {txt_file}")
@@ -47,8 +88,9 @@ def load_zizi_txt():
                     "dashboard"
                 ]
                 
-                for query in test_queries:
-                    results = kb.search(query, k=2)
+                # Một lần encode + query cho tất cả câu test
+                all_results = kb.search_many(test_queries, k=2)
+                for query, results in zip(test_queries, all_results):
                     print(f"📋 Query '{query}': Found {len(results)} results")
                     if results:
                         preview = results[0]['content'][:100].replace('\n', ' ')
@@ -99,11 +141,15 @@ def test_ai_with_zizi_knowledge():
         print("Make sure API is properly set up")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load Zizi training data')
+    parser.add_argument('--rebuild', action='store_true', help='Xóa toàn bộ knowledge base rồi nạp lại')
+    args = parser.parse_args()
+    
     print("🚀 ZIZI PROJECT TRAINING SETUP")
     print("=" * 50)
     
-    # Load Zizi txt
-    success = load_zizi_txt()
+    # Load Zizi txt (incremental theo hash nội dung)
+    success = load_zizi_txt(rebuild=args.rebuild)
     
     if success:
         print(f"\n✅ Zizi knowledge loaded successfully!")
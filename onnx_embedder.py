@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Embedding model chạy bằng ONNX Runtime (CPU) thay cho PyTorch
+
+Export model sentence-transformers sang ONNX một lần (cần torch +
+transformers lúc export), tùy chọn lượng tử hóa động int8 cho các lớp
+MatMul. Khi chạy chỉ cần onnxruntime + tokenizer, không import torch.
+
+Ví dụ:
+    python onnx_embedder.py export                 # export + quantize + kiểm tra sai số
+    python onnx_embedder.py export --no-quantize
+    python onnx_embedder.py check
+"""
+
+import argparse
+import os
+import time
+from typing import List, Dict, Optional
+
+import numpy as np
+
+MODEL_FILENAME = "model.onnx"
+QUANTIZED_MODEL_FILENAME = "model_int8.onnx"
+
+# Câu mẫu để so sánh embedding ONNX với PyTorch
+CHECK_SENTENCES = [
+    "Làm thế nào để tạo chiến dịch KOC mới?",
+    "Hướng dẫn cài đặt và đăng nhập tài khoản ZiZi",
+    "Thanh toán cho KOC được thực hiện khi nào?",
+    "Xem báo cáo hiệu quả chiến dịch ở đâu",
+    "app chậm quá",
+    "How do I reset my password?",
+    "Quản lý người dùng và phân quyền trong dự án " * 20,
+]
+
+def resolve_model_id(model_name: str) -> str:
+    """Tên ngắn kiểu SentenceTransformer ("all-MiniLM-L6-v2") sang ID trên Hugging Face Hub"""
+    if "/" in model_name or os.path.isdir(model_name):
+        return model_name
+    return f"sentence-transformers/{model_name}"
+
+def model_directory(base_directory: str, model_name: str) -> str:
+    return os.path.join(base_directory, resolve_model_id(model_name).replace("/", "__"))
+
+def export_model(model_name: str, base_directory: str, quantize: bool = True, opset: int = 14) -> str:
+    """
+    Export model (transformer + tokenizer) sang ONNX, trả về path file .onnx sẽ dùng
+
+    Mean pooling và chuẩn hóa làm bằng numpy khi encode nên chỉ export phần
+    transformer (đầu ra last_hidden_state).
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    model_id = resolve_model_id(model_name)
+    directory = model_directory(base_directory, model_name)
+    os.makedirs(directory, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    tokenizer.save_pretrained(directory)
+    model = AutoModel.from_pretrained(model_id)
+    model.eval()
+
+    sample = tokenizer(["xin chào", "hướng dẫn tạo chiến dịch"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    path = os.path.join(directory, MODEL_FILENAME)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset
+        )
+
+    if not quantize:
+        return path
+
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantized_path = os.path.join(directory, QUANTIZED_MODEL_FILENAME)
+    quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+class OnnxEmbedder:
+    """
+    Thay thế SentenceTransformer.encode bằng ONNX Runtime
+
+    Pipeline giống sentence-transformers cho các model MiniLM/MPNet:
+    tokenize (truncation max_seq_length) → transformer → mean pooling
+    theo attention mask → chuẩn hóa L2. Model chưa export sẽ được export
+    ở lần khởi tạo đầu tiên.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", base_directory: str = "./onnx_models",
+                 quantize: bool = True, max_seq_length: int = 256, normalize: bool = True,
+                 batch_size: int = 32, threads: Optional[int] = None):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.max_seq_length = max_seq_length
+        self.normalize = normalize
+        self.batch_size = batch_size
+
+        directory = model_directory(base_directory, model_name)
+        self.model_path = os.path.join(directory, QUANTIZED_MODEL_FILENAME if quantize else MODEL_FILENAME)
+        if not os.path.exists(self.model_path):
+            print(f"📦 Export {model_name} sang ONNX ({'int8' if quantize else 'float32'})...")
+            export_model(model_name, base_directory, quantize=quantize)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            self.model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self._dimension = self.session.get_outputs()[0].shape[-1]
+
+    @property
+    def model_size_mb(self) -> float:
+        return round(os.path.getsize(self.model_path) / (1024 * 1024), 2)
+
+    def encode(self, sentences, batch_size: Optional[int] = None, **kwargs) -> np.ndarray:
+        """Encode giống SentenceTransformer.encode: str → vector, list → ma trận float32"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        batch_size = batch_size or self.batch_size
+
+        # Sắp theo độ dài để mỗi batch padding ít nhất, trả về đúng thứ tự ban đầu
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        embeddings = np.zeros((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = self._encode_batch([texts[i] for i in rows])
+
+        return embeddings[0] if single else embeddings
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np"
+        )
+        inputs = {name: encoded[name].astype(np.int64) for name in self._input_names}
+        hidden_states = self.session.run(None, inputs)[0]
+
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        embeddings = (hidden_states * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dimension
+
+def compare_embeddings(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Cosine giữa từng cặp embedding (PyTorch vs ONNX)"""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = (reference * candidate).sum(axis=1)
+    return {
+        'min_cosine': float(cosines.min()),
+        'mean_cosine': float(cosines.mean()),
+        'max_abs_diff': float(np.abs(reference - candidate).max())
+    }
+
+def check_model(model_name: str, base_directory: str, quantize: bool, min_cosine: float) -> bool:
+    """So embedding ONNX với SentenceTransformer trên câu mẫu, False nếu lệch quá min_cosine"""
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(model_name).encode(CHECK_SENTENCES)
+    candidate = OnnxEmbedder(model_name, base_directory, quantize=quantize).encode(CHECK_SENTENCES)
+    result = compare_embeddings(reference, candidate)
+
+    passed = result['min_cosine'] >= min_cosine
+    print(f"{'✅' if passed else '❌'} {model_name} ({'int8' if quantize else 'float32'}): "
+          f"min cosine {result['min_cosine']:.5f} (ngưỡng {min_cosine}), "
+          f"mean {result['mean_cosine']:.5f}, max |diff| {result['max_abs_diff']:.5f}")
+    return passed
+
+if __name__ == "__main__":
+    from api.config import (
+        EMBEDDING_MODEL_NAME,
+        EMBEDDING_ONNX_DIRECTORY,
+        EMBEDDING_ONNX_QUANTIZE,
+        EMBEDDING_ONNX_MIN_COSINE
+    )
+
+    parser = argparse.ArgumentParser(description='Export / kiểm tra embedding model ONNX')
+    parser.add_argument('command', choices=['export', 'check'])
+    parser.add_argument('--model', default=EMBEDDING_MODEL_NAME)
+    parser.add_argument('--directory', default=EMBEDDING_ONNX_DIRECTORY)
+    parser.add_argument('--no-quantize', action='store_true', help='Giữ trọng số float32')
+    parser.add_argument('--min-cosine', type=float, default=EMBEDDING_ONNX_MIN_COSINE)
+    args = parser.parse_args()
+
+    quantize = EMBEDDING_ONNX_QUANTIZE and not args.no_quantize
+    if args.command == 'export':
+        start_time = time.perf_counter()
+        path = export_model(args.model, args.directory, quantize=quantize)
+        print(f"📦 {path} ({os.path.getsize(path) / (1024 * 1024):.1f} MB, {time.perf_counter() - start_time:.1f}s)")
+
+    if not check_model(args.model, args.directory, quantize, args.min_cosine):
+        raise SystemExit(1)
@@ -1,14 +1,41 @@
-import fitz  # PyMuPDF
-import PyPDF2
+import io
+import multiprocessing
 import re
-from typing import List, Dict
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Iterable, Generator, Optional, Tuple
+
+# PyMuPDF (fitz) và PyPDF2 được import trong các hàm đọc PDF: chỉ ingest mới
+# cần, API server tìm kiếm không phải nạp chúng lúc khởi động
+
+# Khoảng trắng trong dòng / quanh ngắt dòng / nhiều dòng trống
+_INLINE_SPACE = re.compile(r'[^\S\n]+')
+_SPACE_AROUND_NEWLINE = re.compile(r' ?\n ?')
+_BLANK_LINES = re.compile(r'\n{3,}')
+# Ranh giới câu: sau dấu . ! ? và khoảng trắng
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+_WHITESPACE = re.compile(r'\s')
 
 class PDFProcessor:
     """Xử lý file PDF và trích xuất text"""
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 extract_workers: int = 1, pages_per_shard: int = 32,
+                 tokenizer_name: Optional[str] = None):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap phải nhỏ hơn chunk_size")
+        # Đơn vị: ký tự, hoặc token của tokenizer_name nếu có
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.tokenizer_name = tokenizer_name
+        # Đoạn (đoạn văn / câu / nhóm từ) tối đa unit_limit để chunk mới còn
+        # chỗ cho overlap chunk_overlap + separator đoạn văn đứng trước
+        self.unit_limit = max(1, chunk_size - chunk_overlap - self._separator_length("\n\n"))
+        # Số process đọc PDF song song (1 = đọc tuần tự trong process hiện tại)
+        self.extract_workers = max(1, extract_workers)
+        self.pages_per_shard = max(1, pages_per_shard)
     
     def extract_and_chunk_pdf(self, pdf_path: str) -> List[Dict[str, str]]:
         """
@@ -20,59 +47,156 @@ class PDFProcessor:
         Returns:
             List các dict chứa text chunks
         """
-        # Thử dùng PyMuPDF trước (tốt hơn cho layout phức tạp)
-        try:
-            text = self._extract_with_pymupdf(pdf_path)
-        except:
-            # Fallback sang PyPDF2
+        return list(self.iter_pdf_chunks(pdf_path))
+    
+    def iter_pdf_chunks(self, pdf_path: str) -> Generator[Dict[str, str], None, None]:
+        """Pipeline stream: trang PDF → làm sạch → chunk, yield từng chunk"""
+        return self.iter_chunks(self.iter_pdf_pages(pdf_path))
+    
+    def iter_txt_chunks(self, txt_path: str) -> Generator[Dict[str, str], None, None]:
+        """Pipeline stream: dòng TXT → làm sạch → chunk, yield từng chunk"""
+        return self.iter_chunks(self.iter_txt_lines(txt_path))
+    
+    def iter_pdf_pages(self, pdf_path: str) -> Generator[str, None, None]:
+        """
+        Yield text từng trang PDF theo thứ tự
+        
+        PyMuPDF đọc theo từng đoạn trang (shard); với extract_workers > 1
+        các shard chạy song song trên nhiều process. Trang nào PyMuPDF lỗi
+        thì chỉ riêng trang đó được đọc lại bằng PyPDF2.
+        
+        Process worker được tạo bằng "spawn" (fork một API server đang có
+        thread có thể treo ở lock bị copy), và chỉ tối đa 2 * extract_workers
+        shard được gửi đi cùng lúc nên text chờ yield không tăng theo số trang.
+        """
+        page_count = _get_page_count(pdf_path)
+        if page_count is None:
+            # PyMuPDF không mở được file: đọc toàn bộ bằng PyPDF2
             try:
-                text = self._extract_with_pypdf2(pdf_path)
+                yield from self._iter_pages_pypdf2(pdf_path)
             except Exception as e:
                 raise Exception(f"Không thể đọc PDF: {str(e)}")
+            return
         
-        # Làm sạch text
-        cleaned_text = self._clean_text(text)
+        shards = [
+            (start, min(start + self.pages_per_shard, page_count))
+            for start in range(0, page_count, self.pages_per_shard)
+        ]
+        fallback = _PyPDF2Pages(pdf_path)
         
-        # Chia thành chunks
-        chunks = self._create_chunks(cleaned_text)
+        if self.extract_workers > 1 and len(shards) > 1:
+            workers = min(self.extract_workers, len(shards))
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                pending = iter(shards)
+                in_flight = deque()
+                
+                def submit_next():
+                    for start, end in pending:
+                        in_flight.append((start, executor.submit(_extract_page_range, pdf_path, start, end)))
+                        return
+                
+                for _ in range(workers * 2):
+                    submit_next()
+                
+                # Yield đúng thứ tự trang; mỗi shard lấy ra thì gửi thêm một shard
+                try:
+                    while in_flight:
+                        start, future = in_flight.popleft()
+                        texts = future.result()
+                        submit_next()
+                        yield from self._with_fallback(texts, start, fallback)
+                finally:
+                    # Consumer dừng sớm / lỗi: bỏ các shard chưa chạy
+                    for _, future in in_flight:
+                        future.cancel()
+        else:
+            for start, end in shards:
+                texts = _extract_page_range(pdf_path, start, end)
+                yield from self._with_fallback(texts, start, fallback)
+    
+    def _with_fallback(self, texts: List[Optional[str]], start: int,
+                       fallback: "_PyPDF2Pages") -> Generator[str, None, None]:
+        """Yield text các trang của một shard, trang lỗi (None) đọc bằng PyPDF2"""
+        for offset, text in enumerate(texts):
+            if text is None:
+                try:
+                    text = fallback.get_text(start + offset)
+                except Exception as e:
+                    raise Exception(f"Không thể đọc trang {start + offset + 1} của PDF: {str(e)}")
+            yield text + "\n\n"  # Thêm ngắt trang
+    
+    def iter_txt_lines(self, txt_path: str) -> Generator[str, None, None]:
+        """Yield từng dòng của file TXT (không đọc cả file vào bộ nhớ)"""
+        with open(txt_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield line
+    
+    def _iter_pages_pypdf2(self, pdf_path: str, start_page: int = 0) -> Generator[str, None, None]:
+        import PyPDF2
         
-        return chunks
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for page_num in range(start_page, len(pdf_reader.pages)):
+                yield pdf_reader.pages[page_num].extract_text() + "\n\n"  # Thêm ngắt trang
     
     def _extract_with_pymupdf(self, pdf_path: str) -> str:
         """Trích xuất text bằng PyMuPDF"""
-        doc = fitz.open(pdf_path)
-        text = ""
-        
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text += page.get_text()
-            text += "\n\n"  # Thêm ngắt trang
-        
-        doc.close()
-        return text
+        page_count = _get_page_count(pdf_path) or 0
+        return "".join(
+            (text or "") + "\n\n" for text in _extract_page_range(pdf_path, 0, page_count)
+        )
     
     def _extract_with_pypdf2(self, pdf_path: str) -> str:
         """Trích xuất text bằng PyPDF2"""
-        text = ""
+        return "".join(self._iter_pages_pypdf2(pdf_path))
+    
+    def iter_chunks(self, blocks: Iterable[str]) -> Generator[Dict[str, str], None, None]:
+        """
+        Chunk text đến dạng stream (trang, dòng...)
         
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
+        Chỉ giữ đoạn văn đang đọc dở trong bộ nhớ: mỗi đoạn hoàn chỉnh
+        (ngăn cách bởi dòng trống) được làm sạch và đưa ngay vào bộ chunk.
+        """
+        return self._pack_paragraphs(self._iter_paragraphs(blocks))
+    
+    def _iter_paragraphs(self, blocks: Iterable[str]) -> Generator[str, None, None]:
+        """Tách stream text thành các đoạn văn đã làm sạch"""
+        lines = []   # Các dòng của đoạn văn đang đọc
+        carry = ""   # Phần dòng dở dang ở cuối block trước
+        
+        for block in blocks:
+            block_lines = (carry + block).split('\n')
+            carry = block_lines.pop()
             
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text()
-                text += "\n\n"  # Thêm ngắt trang
+            for line in block_lines:
+                line = self._clean_line(line)
+                if line:
+                    lines.append(line)
+                elif lines:
+                    # Dòng trống kết thúc một đoạn văn
+                    yield "\n".join(lines)
+                    lines = []
         
-        return text
+        carry = self._clean_line(carry)
+        if carry:
+            lines.append(carry)
+        if lines:
+            yield "\n".join(lines)
+    
+    def _clean_line(self, line: str) -> str:
+        """Làm sạch một dòng: bỏ null, gộp khoảng trắng (tương đương _clean_text cho một dòng)"""
+        return " ".join(line.replace('\x00', '').split())
     
     def _clean_text(self, text: str) -> str:
-        """Làm sạch text được trích xuất"""
+        """Làm sạch text được trích xuất (giữ nguyên ngắt dòng / ngắt đoạn)"""
         # Xóa ký tự đặc biệt không cần thiết
-        text = re.sub(r'\x00', '', text)  # Xóa null characters
+        text = text.replace('\x00', '')  # Xóa null characters
         
-        # Chuẩn hóa khoảng trắng
-        text = re.sub(r'\s+', ' ', text)  # Nhiều spaces thành 1 space
-        text = re.sub(r'\n\s*\n', '\n\n', text)  # Chuẩn hóa line breaks
+        # Chuẩn hóa khoảng trắng trong dòng, không gộp mất \n
+        text = _INLINE_SPACE.sub(' ', text)  # Nhiều spaces thành 1 space
+        text = _SPACE_AROUND_NEWLINE.sub('\n', text)
+        text = _BLANK_LINES.sub('\n\n', text)  # Chuẩn hóa line breaks
         
         # Xóa khoảng trắng đầu cuối
         text = text.strip()
@@ -81,115 +205,183 @@ class PDFProcessor:
     
     def _create_chunks(self, text: str) -> List[Dict[str, str]]:
         """Chia text thành các chunks nhỏ"""
-        chunks = []
-        
-        # Chia theo đoạn văn trước
-        paragraphs = text.split('\n\n')
+        return list(self.iter_chunks([text]))
+    
+    def _pack_paragraphs(self, paragraphs: Iterable[str]) -> Generator[Dict[str, str], None, None]:
+        """
+        Gộp các đoạn văn thành chunk <= chunk_size, yield ngay khi chunk đầy
         
-        current_chunk = ""
+        Làm việc trên các đoạn (đoạn văn / câu / nhóm từ) kèm độ dài tính sẵn
+        nên mỗi ký tự chỉ được xử lý một số lần cố định: O(n) thay vì nối
+        chuỗi lặp lại. Đoạn văn vừa một chunk (cùng overlap) không bị cắt
+        ngang; chunk mới bắt đầu bằng phần cuối (<= chunk_overlap, cắt tại
+        ranh giới từ) của chunk trước.
+        """
+        window = _ChunkWindow()
         chunk_id = 0
+        paragraph_separator = ("\n\n", self._separator_length("\n\n"))
+        inline_separator = (" ", self._separator_length(" "))
         
         for paragraph in paragraphs:
             paragraph = paragraph.strip()
             if not paragraph:
                 continue
             
-            # Kiểm tra nếu thêm đoạn này vào chunk hiện tại
-            test_chunk = current_chunk + "\n\n" + paragraph if current_chunk else paragraph
-            
-            if len(test_chunk) <= self.chunk_size:
-                current_chunk = test_chunk
+            paragraph_length = self._length(paragraph)
+            if paragraph_length <= self.unit_limit:
+                units = [(paragraph, paragraph_length)]
             else:
-                # Lưu chunk hiện tại (nếu có)
-                if current_chunk:
-                    chunks.append({
-                        'id': f"chunk_{chunk_id}",
-                        'content': current_chunk,
-                        'length': len(current_chunk)
-                    })
-                    chunk_id += 1
-                
-                # Bắt đầu chunk mới
-                if len(paragraph) <= self.chunk_size:
-                    current_chunk = paragraph
-                else:
-                    # Đoạn quá dài, chia nhỏ hơn
-                    sub_chunks = self._split_long_paragraph(paragraph)
-                    for sub_chunk in sub_chunks:
-                        chunks.append({
+                # Đoạn quá dài, chia theo câu (và theo từ nếu cần)
+                units = self._split_long_paragraph(paragraph)
+            
+            separator, separator_length = paragraph_separator
+            for unit, unit_length in units:
+                if not window.fits(separator_length, unit_length, self.chunk_size):
+                    if window.fresh:
+                        content = window.text()
+                        yield {
                             'id': f"chunk_{chunk_id}",
-                            'content': sub_chunk,
-                            'length': len(sub_chunk)
-                        })
+                            'content': content,
+                            'length': len(content)
+                        }
                         chunk_id += 1
-                    current_chunk = ""
+                        # Giữ phần cuối làm overlap cho chunk sau
+                        window.trim(self.chunk_overlap, self._tail_by_words)
+                    # Đoạn <= unit_limit nên luôn vừa cùng overlap; chỉ còn phòng khi
+                    # đếm token của chuỗi ghép lệch với tổng từng đoạn
+                    while not window.fits(separator_length, unit_length, self.chunk_size):
+                        window.pop_front()
+                
+                window.push(separator, separator_length, unit, unit_length)
+                separator, separator_length = inline_separator
         
         # Thêm chunk cuối cùng
-        if current_chunk:
-            chunks.append({
+        if window.fresh:
+            content = window.text()
+            yield {
                 'id': f"chunk_{chunk_id}",
-                'content': current_chunk,
-                'length': len(current_chunk)
-            })
-        
-        return chunks
+                'content': content,
+                'length': len(content)
+            }
     
-    def _split_long_paragraph(self, paragraph: str) -> List[str]:
-        """Chia đoạn văn dài thành các phần nhỏ hơn"""
-        chunks = []
-        sentences = re.split(r'[.!?]+', paragraph)
-        
-        current_chunk = ""
-        
-        for sentence in sentences:
+    def get_signature(self) -> str:
+        """Tham số chunking; đổi tham số thì tài liệu cần được chunk lại"""
+        unit = f"tokens:{self.tokenizer_name}" if self.tokenizer_name else "chars"
+        return f"{self.chunk_size}/{self.chunk_overlap}/{unit}"
+    
+    def _length(self, text: str) -> int:
+        """Độ dài theo ký tự, hoặc theo token nếu có tokenizer"""
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            return len(text)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    
+    def _separator_length(self, separator: str) -> int:
+        # Separator là khoảng trắng: 0 token khi đếm theo tokenizer
+        return 0 if self.tokenizer_name else len(separator)
+    
+    def _get_tokenizer(self):
+        if self.tokenizer_name is None:
+            return None
+        return _load_tokenizer(self.tokenizer_name)
+    
+    def _split_long_paragraph(self, paragraph: str) -> List[Tuple[str, int]]:
+        """Chia đoạn văn dài thành các câu (giữ dấu câu) kèm độ dài"""
+        units = []
+        for sentence in _SENTENCE_BOUNDARY.split(paragraph):
             sentence = sentence.strip()
             if not sentence:
                 continue
             
-            test_chunk = current_chunk + ". " + sentence if current_chunk else sentence
-            
-            if len(test_chunk) <= self.chunk_size:
-                current_chunk = test_chunk
+            sentence_length = self._length(sentence)
+            if sentence_length <= self.unit_limit:
+                units.append((sentence, sentence_length))
             else:
-                if current_chunk:
-                    chunks.append(current_chunk + ".")
-                
-                # Nếu câu vẫn quá dài, chia theo từ
-                if len(sentence) > self.chunk_size:
-                    word_chunks = self._split_by_words(sentence)
-                    chunks.extend(word_chunks)
-                    current_chunk = ""
-                else:
-                    current_chunk = sentence
-        
-        if current_chunk:
-            chunks.append(current_chunk + ".")
-        
-        return chunks
-    
-    def _split_by_words(self, text: str) -> List[str]:
-        """Chia text theo từ khi quá dài"""
-        words = text.split()
-        chunks = []
-        current_chunk = ""
-        
-        for word in words:
-            test_chunk = current_chunk + " " + word if current_chunk else word
+                # Câu vẫn quá dài, chia theo từ
+                units.extend(self._split_by_words(sentence))
+        return units
+    
+    def _split_by_words(self, text: str) -> List[Tuple[str, int]]:
+        """
+        Chia text quá dài thành các nhóm từ liền nhau
+        
+        Mỗi nhóm dài tối đa chunk_overlap (hoặc chunk_size nếu không có
+        overlap) để phần cuối chunk vẫn mang sang được chunk sau. Từ dài hơn
+        giới hạn bị cắt cứng.
+        """
+        limit = min(self.chunk_overlap or self.unit_limit, self.unit_limit)
+        
+        if self.tokenizer_name is None:
+            # Theo ký tự: cắt tại khoảng trắng cuối cùng trong cửa sổ limit
+            units = []
+            start, end = 0, len(text)
+            while start < end:
+                stop = start + limit
+                if stop < end:
+                    cut = max(text.rfind(' ', start, stop + 1), text.rfind('\n', start, stop + 1))
+                    if cut <= start:
+                        # Không có khoảng trắng trong limit: mảnh dài tới chunk_size
+                        # (không chèn khoảng trắng giả vào giữa từ dài)
+                        stop = min(start + self.chunk_size, end)
+                        cut = max(text.rfind(' ', start, stop + 1), text.rfind('\n', start, stop + 1))
+                    if cut > start:
+                        stop = cut
+                piece = text[start:stop].strip()
+                if piece:
+                    units.append((piece, len(piece)))
+                start = stop
+            return units
+        
+        # Theo token: gom từng từ cho tới khi đủ limit
+        units = []
+        words, words_length = [], 0
+        for word in text.split():
+            word_length = self._length(word)
+            if words and words_length + word_length > limit:
+                units.append((" ".join(words), words_length))
+                words, words_length = [], 0
             
-            if len(test_chunk) <= self.chunk_size:
-                current_chunk = test_chunk
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                current_chunk = word
+            if word_length <= limit:
+                words.append(word)
+                words_length += word_length
+                continue
+            
+            # Mỗi token dài ít nhất 1 ký tự nên mảnh limit ký tự luôn vừa
+            for start in range(0, len(word), limit):
+                piece = word[start:start + limit]
+                units.append((piece, self._length(piece)))
         
-        if current_chunk:
-            chunks.append(current_chunk)
+        if words:
+            units.append((" ".join(words), words_length))
+        return units
+    
+    def _tail_by_words(self, text: str, limit: int) -> Optional[Tuple[str, int]]:
+        """Phần cuối dài nhất của text (<= limit) bắt đầu tại ranh giới từ, None nếu không có"""
+        if limit <= 0:
+            return None
+        
+        if self.tokenizer_name is None:
+            if len(text) <= limit:
+                return text, len(text)
+            # Khoảng trắng đầu tiên từ vị trí len - limit - 1: phần sau nó là các từ trọn vẹn
+            match = _WHITESPACE.search(text, len(text) - limit - 1)
+            tail = text[match.end():] if match else ""
+            return (tail, len(tail)) if tail else None
         
-        return chunks
+        # Theo token: lấy từ cuối lên cho tới khi đủ limit
+        words, words_length = [], 0
+        for word in reversed(text.split()):
+            word_length = self._length(word)
+            if words_length + word_length > limit:
+                break
+            words.append(word)
+            words_length += word_length
+        return (" ".join(reversed(words)), words_length) if words else None
     
     def get_pdf_metadata(self, pdf_path: str) -> Dict[str, any]:
         """Lấy metadata của PDF"""
+        import fitz  # PyMuPDF
+        
         try:
             doc = fitz.open(pdf_path)
             metadata = doc.metadata
@@ -208,4 +400,140 @@ class PDFProcessor:
             return {'error': str(e)}
         finally:
             if 'doc' in locals():
-                doc.close() 
\ No newline at end of file
+                doc.close()
+
+class _ChunkWindow:
+    """Các đoạn (separator, text, độ dài) của chunk đang gom, độ dài cộng dồn"""
+    
+    def __init__(self):
+        self.parts = deque()  # (separator, text, độ dài separator, độ dài text)
+        self.total = 0   # Tổng độ dài separator + text của mọi đoạn
+        self.fresh = 0   # Số đoạn mới (không phải overlap) chưa được yield
+    
+    def length(self) -> int:
+        # Separator của đoạn đầu tiên không nằm trong chunk
+        return self.total - self.parts[0][2] if self.parts else 0
+    
+    def fits(self, separator_length: int, length: int, limit: int) -> bool:
+        return not self.parts or self.total - self.parts[0][2] + separator_length + length <= limit
+    
+    def push(self, separator: str, separator_length: int, text: str, length: int):
+        self.parts.append((separator, text, separator_length, length))
+        self.total += separator_length + length
+        self.fresh += 1
+    
+    def pop_front(self):
+        _, _, separator_length, length = self.parts.popleft()
+        self.total -= separator_length + length
+        if self.fresh > len(self.parts):
+            self.fresh = len(self.parts)
+    
+    def trim(self, max_length: int, tail=None):
+        """
+        Bỏ đoạn đầu cho tới khi còn <= max_length; phần còn lại là overlap
+
+        tail(text, limit) -> (text, độ dài) | None cắt phần cuối của đoạn vừa
+        bỏ để lấp chỗ trống còn lại, nên overlap vẫn gần max_length khi đoạn
+        cuối của chunk dài hơn max_length.
+        """
+        self.fresh = 0
+        popped = None
+        while self.parts and self.length() > max_length:
+            popped = self.parts[0]
+            self.pop_front()
+        if popped is None or tail is None:
+            return
+
+        # Separator của đoạn đầu hiện tại sẽ nằm giữa phần cắt và đoạn đó
+        budget = max_length - self.length() - (self.parts[0][2] if self.parts else 0)
+        piece = tail(popped[1], budget)
+        if piece is not None:
+            text, length = piece
+            self.parts.appendleft((popped[0], text, popped[2], length))
+            self.total += popped[2] + length
+    
+    def text(self) -> str:
+        parts = iter(self.parts)
+        first = next(parts)[1]
+        return first + "".join([separator + text for separator, text, _, _ in parts])
+
+class _PyPDF2Pages:
+    """Đọc từng trang bằng PyPDF2, chỉ mở file khi thực sự có trang lỗi"""
+    
+    def __init__(self, pdf_path: str):
+        self.pdf_path = pdf_path
+        self._reader = None
+    
+    def get_text(self, page_num: int) -> str:
+        if self._reader is None:
+            import PyPDF2
+            with open(self.pdf_path, 'rb') as file:
+                self._reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
+        return self._reader.pages[page_num].extract_text()
+
+@lru_cache(maxsize=4)
+def _load_tokenizer(tokenizer_name: str):
+    """Tokenizer HuggingFace (tải một lần mỗi process) để đo chunk theo token"""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(tokenizer_name)
+
+def _get_page_count(pdf_path: str) -> Optional[int]:
+    """Số trang theo PyMuPDF, None nếu PyMuPDF không mở được file"""
+    import fitz  # PyMuPDF
+    
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception:
+        return None
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[Optional[str]]:
+    """
+    Trích xuất text các trang [start, end) bằng PyMuPDF
+    
+    Chạy được trong process worker. Trang lỗi trả về None để caller
+    đọc lại riêng trang đó bằng PyPDF2.
+    """
+    import fitz  # PyMuPDF
+    
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception:
+        return [None] * (end - start)
+    
+    texts = []
+    try:
+        for page_num in range(start, end):
+            try:
+                texts.append(doc.load_page(page_num).get_text())
+            except Exception:
+                texts.append(None)
+    finally:
+        doc.close()
+    return texts
+
+def extract_document(path: str, chunk_size: int = 1000, chunk_overlap: int = 200,
+                     tokenizer_name: Optional[str] = None) -> Dict[str, any]:
+    """
+    Trích xuất + chunk một file PDF/TXT
+    
+    Hàm ở cấp module (picklable) để chạy được trong ProcessPoolExecutor;
+    bản thân file được đọc tuần tự (không lồng process pool trong worker).
+    """
+    processor = PDFProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                             tokenizer_name=tokenizer_name)
+    start_time = time.perf_counter()
+    
+    if path.lower().endswith('.pdf'):
+        chunks = list(processor.iter_pdf_chunks(path))
+    else:
+        chunks = list(processor.iter_txt_chunks(path))
+    
+    return {
+        'path': path,
+        'chunks': chunks,
+        'seconds': time.perf_counter() - start_time
+    }
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Đo thời gian khởi động API server
+
+1. Import: chạy `python -X importtime -c "import api_server_clean"` trong
+   process mới, cộng dồn thời gian theo package cấp cao nhất.
+2. Startup (--startup): chạy lifespan của app, chờ tới khi sẵn sàng và in
+   thời gian từng bước (nạp engine, encode giả, dựng BM25, ping Ollama).
+
+Ví dụ:
+    python profile_startup.py
+    python profile_startup.py --module knowledge_base --top 30
+    python profile_startup.py --startup
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+# Dòng -X importtime: "import time:  self [us] | cumulative | imported package"
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def profile_imports(module: str) -> Tuple[float, List[Tuple[str, float, float]]]:
+    """
+    Import module trong process mới với -X importtime
+
+    Returns:
+        (thời gian chạy process (s), list (package, cumulative s, self s) giảm dần)
+    """
+    start_time = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    wall_time = time.perf_counter() - start_time
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    # -X importtime in con trước cha; đảo lại để duyệt cây từ gốc. Thời gian
+    # của một package là cumulative ở các điểm vào package đó từ package khác
+    # (vd. torch được kéo vào bởi sentence_transformers vẫn được tính riêng)
+    cumulative: Dict[str, float] = {}
+    self_time: Dict[str, float] = {}
+    stack: List[Tuple[int, str]] = []
+    inside = False
+    for line in reversed(result.stderr.splitlines()):
+        match = _IMPORT_LINE.match(line)
+        if not match:
+            continue
+        depth = len(match.group(3))
+        if depth == 1:
+            # Bỏ các import của interpreter (site, encodings...) trước module cần đo
+            inside = match.group(4) == module
+        if not inside:
+            continue
+        package = match.group(4).split(".")[0]
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        if not stack or stack[-1][1] != package:
+            cumulative[package] = cumulative.get(package, 0.0) + int(match.group(2)) / 1e6
+        self_time[package] = self_time.get(package, 0.0) + int(match.group(1)) / 1e6
+        stack.append((depth, package))
+
+    packages = sorted(
+        ((package, seconds, self_time.get(package, 0.0)) for package, seconds in cumulative.items()),
+        key=lambda item: item[1],
+        reverse=True
+    )
+    return wall_time, packages
+
+async def profile_startup() -> Dict[str, float]:
+    """Chạy lifespan của API server và chờ tới khi /health/ready sẵn sàng"""
+    from api_server_clean import app, lifespan
+
+    async with lifespan(app):
+        await app.state.startup_task
+        return dict(app.state.startup)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Đo thời gian import / khởi động API server')
+    parser.add_argument('--module', default='api_server_clean', help='Module cần đo thời gian import')
+    parser.add_argument('--top', type=int, default=20, help='Số package hiển thị')
+    parser.add_argument('--startup', action='store_true', help='Đo cả các bước khởi động (nạp model, warmup)')
+    args = parser.parse_args()
+
+    wall_time, packages = profile_imports(args.module)
+    total = packages[0][1] if packages else 0.0
+    print(f"📦 import {args.module}: {total:.2f}s ({wall_time:.2f}s cả khởi động interpreter)\n")
+    print(f"{'package':<28} | {'cumulative s':>12} | {'self s':>8} | {'%':>5}")
+    for package, seconds, own in packages[:args.top]:
+        print(f"{package:<28} | {seconds:>12.3f} | {own:>8.3f} | {seconds / total * 100 if total else 0:>5.1f}")
+
+    if args.startup:
+        print("\n🚀 Startup:")
+        for step, value in asyncio.run(profile_startup()).items():
+            print(f"   {step}: {value}")
@@ -24,6 +24,14 @@ def main():
     print(f"👥 Workers: {args.workers}")
     print("=" * 50)
     
+    # Cache in-process không chia sẻ giữa các worker
+    from api.config import RESPONSE_CACHE_BACKEND, VECTOR_BACKEND
+    if args.workers > 1 and RESPONSE_CACHE_BACKEND == "memory":
+        print("⚠️ Mỗi worker có response cache riêng. Đặt RESPONSE_CACHE_BACKEND=sqlite để dùng chung.")
+    # Worker khác nạp lại KB khi metadata.json đổi; chỉ backend numpy nạp lại được vector
+    if args.workers > 1 and VECTOR_BACKEND != "numpy":
+        print("⚠️ Tài liệu upload qua một worker chỉ được worker khác thấy khi VECTOR_BACKEND=numpy.")
+    
     try:
         # Chạy server với cấu hình modular
         uvicorn.run(
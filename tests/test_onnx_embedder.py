@@ -0,0 +1,112 @@
+"""
+OnnxEmbedder: mean pooling + chuẩn hóa L2 so với bản tính bằng numpy, và
+(khi có model thật) cosine so với SentenceTransformer
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+from onnx import TensorProto, helper, numpy_helper
+
+from api.config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_ONNX_DIRECTORY,
+    EMBEDDING_ONNX_QUANTIZE,
+    EMBEDDING_ONNX_MIN_COSINE
+)
+from onnx_embedder import (
+    CHECK_SENTENCES,
+    MODEL_FILENAME,
+    QUANTIZED_MODEL_FILENAME,
+    OnnxEmbedder,
+    compare_embeddings,
+    model_directory
+)
+
+MODEL_NAME = "tiny-embedder"
+VOCABULARY = ["[PAD]", "[UNK]", "xin", "chào", "hướng", "dẫn", "tạo", "chiến", "dịch", "koc", "app", "chậm"]
+DIMENSION = 8
+
+@pytest.fixture
+def tiny_model(tmp_path):
+    """
+    Model giả: last_hidden_state = bảng embedding theo token (Gather), cùng
+    tokenizer WordLevel; vector của [PAD] khác 0 để lộ lỗi khi pooling bỏ sót mask
+    """
+    from transformers import PreTrainedTokenizerFast
+
+    directory = model_directory(str(tmp_path), MODEL_NAME)
+    os.makedirs(directory)
+
+    vocabulary = {token: i for i, token in enumerate(VOCABULARY)}
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocabulary, unk_token="[UNK]"))
+    tokenizer.normalizer = tokenizers.normalizers.Lowercase()
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    PreTrainedTokenizerFast(tokenizer_object=tokenizer, pad_token="[PAD]", unk_token="[UNK]").save_pretrained(directory)
+
+    table = np.random.default_rng(0).standard_normal((len(VOCABULARY), DIMENSION)).astype(np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["last_hidden_state"], axis=0)],
+        "tiny",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+         helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"])],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", DIMENSION])],
+        initializer=[numpy_helper.from_array(table, "table")]
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 14)])
+    model.ir_version = 8
+    onnx.save(model, os.path.join(directory, MODEL_FILENAME))
+    return str(tmp_path), table, vocabulary
+
+def _reference(texts, table, vocabulary, max_seq_length):
+    """Mean pooling trên các token thật (không padding) rồi chuẩn hóa L2"""
+    embeddings = []
+    for text in texts:
+        ids = [vocabulary.get(word, vocabulary["[UNK]"]) for word in text.lower().split()][:max_seq_length]
+        vector = table[ids].mean(axis=0)
+        embeddings.append(vector / np.linalg.norm(vector))
+    return np.array(embeddings, dtype=np.float32)
+
+def test_pooling_and_normalization_match_numpy(tiny_model):
+    base_directory, table, vocabulary = tiny_model
+    embedder = OnnxEmbedder(MODEL_NAME, base_directory, quantize=False, max_seq_length=4, batch_size=3)
+
+    # Batch theo độ dài: [4 (bị cắt từ 6), 4, 3] và [2, 1] token, đều có padding; "mới" ngoài vocabulary
+    texts = ["xin chào", "hướng dẫn tạo chiến dịch koc", "app", "chào app chậm", "tạo chiến dịch mới"]
+    embeddings = embedder.encode(texts)
+
+    assert embeddings.shape == (len(texts), DIMENSION)
+    assert embedder.get_sentence_embedding_dimension() == DIMENSION
+    np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1.0, rtol=1e-5)
+    np.testing.assert_allclose(embeddings, _reference(texts, table, vocabulary, 4), rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(embedder.encode(texts[1]), embeddings[1], rtol=1e-6)
+
+def test_without_normalization_keeps_mean(tiny_model):
+    base_directory, table, vocabulary = tiny_model
+    embedder = OnnxEmbedder(MODEL_NAME, base_directory, quantize=False, normalize=False)
+
+    embedding = embedder.encode("xin chào app")
+    np.testing.assert_allclose(embedding, table[[2, 3, 10]].mean(axis=0), rtol=1e-5, atol=1e-6)
+
+def test_real_model_matches_sentence_transformers():
+    """Model thật đã export (python onnx_embedder.py export) phải đạt EMBEDDING_ONNX_MIN_COSINE"""
+    filename = QUANTIZED_MODEL_FILENAME if EMBEDDING_ONNX_QUANTIZE else MODEL_FILENAME
+    if not os.path.exists(os.path.join(model_directory(EMBEDDING_ONNX_DIRECTORY, EMBEDDING_MODEL_NAME), filename)):
+        pytest.skip("Chưa export model ONNX (python onnx_embedder.py export)")
+    sentence_transformers = pytest.importorskip("sentence_transformers")
+    try:
+        reference_model = sentence_transformers.SentenceTransformer(EMBEDDING_MODEL_NAME)
+    except Exception as e:
+        pytest.skip(f"Không tải được {EMBEDDING_MODEL_NAME}: {e}")
+
+    reference = reference_model.encode(CHECK_SENTENCES)
+    embedder = OnnxEmbedder(EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_DIRECTORY, quantize=EMBEDDING_ONNX_QUANTIZE)
+    candidate = embedder.encode(CHECK_SENTENCES)
+    assert compare_embeddings(reference, candidate)['min_cosine'] >= EMBEDDING_ONNX_MIN_COSINE
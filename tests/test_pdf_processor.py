@@ -0,0 +1,74 @@
+"""
+Overlap giữa các chunk liền kề của PDFProcessor
+
+Chunk sau phải bắt đầu bằng phần cuối (~chunk_overlap ký tự, cắt tại ranh
+giới từ) của chunk trước, kể cả khi đoạn cuối của chunk dài hơn overlap.
+"""
+
+import random
+
+import pytest
+
+from pdf_processor import PDFProcessor
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Cắt tại ranh giới từ nên overlap có thể ngắn hơn một chút
+MIN_OVERLAP = CHUNK_OVERLAP - 20
+
+WORDS = ["zizi", "dự", "án", "hướng", "dẫn", "cài", "đặt", "tài", "khoản", "chiến",
+         "dịch", "koc", "báo", "cáo", "thanh", "toán", "người", "dùng", "quản", "lý"]
+
+
+def _sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 20))).capitalize() + "."
+
+
+def _paragraphs(kind: str, count: int, seed: int = 3) -> str:
+    rng = random.Random(seed)
+    paragraphs = []
+    for _ in range(count):
+        if kind == "medium":
+            # Đoạn văn 300-700 ký tự: trọn đoạn dài hơn overlap
+            sentences = []
+            while len(" ".join(sentences)) < rng.randint(300, 700):
+                sentences.append(_sentence(rng))
+            paragraphs.append(" ".join(sentences))
+        elif kind == "long":
+            # Đoạn văn dài hơn chunk_size, tách theo câu
+            paragraphs.append(" ".join(_sentence(rng) for _ in range(rng.randint(20, 40))))
+        else:
+            # Danh sách không dấu câu, tách theo từ
+            paragraphs.append("\n".join(" ".join(rng.choice(WORDS) for _ in range(8))
+                                        for _ in range(rng.randint(30, 60))))
+    return "\n\n".join(paragraphs)
+
+
+def _shared(previous: str, current: str) -> int:
+    """Độ dài phần cuối của previous trùng với phần đầu của current"""
+    for length in range(min(len(previous), len(current)), 0, -1):
+        if previous.endswith(current[:length]):
+            return length
+    return 0
+
+
+@pytest.mark.parametrize("kind", ["medium", "long", "list"])
+def test_adjacent_chunks_overlap(kind):
+    processor = PDFProcessor(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = [chunk["content"] for chunk in processor._create_chunks(_paragraphs(kind, 40))]
+
+    assert len(chunks) > 5
+    assert max(len(chunk) for chunk in chunks) <= CHUNK_SIZE
+    for previous, current in zip(chunks, chunks[1:]):
+        shared = _shared(previous, current)
+        assert MIN_OVERLAP <= shared <= CHUNK_OVERLAP, (shared, previous[-250:], current[:250])
+
+
+def test_overlap_starts_at_word_boundary():
+    processor = PDFProcessor(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = [chunk["content"] for chunk in processor._create_chunks(_paragraphs("long", 10))]
+
+    for previous, current in zip(chunks, chunks[1:]):
+        shared = _shared(previous, current)
+        # Ký tự đứng trước phần overlap trong chunk trước là khoảng trắng
+        assert previous[-shared - 1].isspace()
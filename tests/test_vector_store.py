@@ -0,0 +1,95 @@
+"""
+Recall@k của NumpyVectorStore theo từng precision so với exact search float32,
+và chuyển đổi precision khi process khác đang giữ quyền ghi
+
+Dữ liệu giả lập embedding thật (các cụm chủ đề, 384 chiều như
+all-MiniLM-L6-v2), query là vector trong kho cộng nhiễu.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from api.config import VECTOR_RESCORE_CANDIDATES
+from vector_store import NumpyVectorStore
+
+CHUNKS = 4000
+DIMENSION = 384
+QUERIES = 100
+K = 10
+RESCORE_CANDIDATES = 50
+
+# Recall@10 tối thiểu (đo được: float16 1.0, int8 0.99, có rescore 1.0)
+MIN_RECALL = {
+    ("float32", 0): 1.0,
+    ("float16", 0): 0.98,
+    ("float16", RESCORE_CANDIDATES): 0.99,
+    ("int8", 0): 0.95,
+    ("int8", RESCORE_CANDIDATES): 0.99,
+}
+
+@pytest.fixture(scope="module")
+def dataset():
+    rng = np.random.default_rng(7)
+    centers = rng.standard_normal((64, DIMENSION)).astype(np.float32)
+    vectors = centers[rng.integers(0, 64, CHUNKS)] + 0.8 * rng.standard_normal((CHUNKS, DIMENSION)).astype(np.float32)
+    queries = vectors[rng.integers(0, CHUNKS, QUERIES)] + 0.5 * rng.standard_normal((QUERIES, DIMENSION)).astype(np.float32)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(queries @ normalized.T), axis=1)[:, :K]
+    return vectors, queries, expected
+
+@pytest.mark.parametrize("precision,rescore_candidates", list(MIN_RECALL))
+def test_recall_at_k(tmp_path, dataset, precision, rescore_candidates):
+    vectors, queries, expected = dataset
+    store = NumpyVectorStore(str(tmp_path), precision=precision, rescore_candidates=rescore_candidates)
+    store.upsert([str(i) for i in range(CHUNKS)], vectors, [""] * CHUNKS, [{}] * CHUNKS)
+    store.flush()
+
+    found = store.query(queries, n_results=K)['ids']
+    recall = np.mean([len({int(i) for i in ids} & set(truth)) / K for ids, truth in zip(found, expected)])
+    assert recall >= MIN_RECALL[(precision, rescore_candidates)]
+
+def _array_mb(directory) -> float:
+    # records.json (id, nội dung, metadata) không phụ thuộc precision
+    size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".npy"))
+    return round(size / (1024 * 1024), 2)
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_default_settings_shrink_storage(tmp_path, dataset, precision):
+    """Với cấu hình mặc định, float16/int8 nhỏ hơn float32 ít nhất 2 lần cả trong RAM lẫn trên đĩa"""
+    vectors = dataset[0]
+    sizes = {}
+    for name in ("float32", precision):
+        directory = str(tmp_path / name)
+        store = NumpyVectorStore(directory, precision=name, rescore_candidates=VECTOR_RESCORE_CANDIDATES)
+        store.upsert([str(i) for i in range(CHUNKS)], vectors, [""] * CHUNKS, [{}] * CHUNKS)
+        store.flush()
+        stats = store.get_stats()
+        sizes[name] = (stats['index_mb'] + stats['rescore_mb'], _array_mb(directory))
+
+    assert sizes["float32"][0] >= 2 * sizes[precision][0]
+    assert sizes["float32"][1] >= 2 * sizes[precision][1]
+
+def test_conversion_waits_for_writer(tmp_path):
+    """Đổi precision khi process khác đang ghi: chờ nó commit rồi chuyển đổi bản mới, không raise"""
+    rng = np.random.default_rng(3)
+    writer = NumpyVectorStore(str(tmp_path))
+    writer.upsert(["a", "b"], rng.standard_normal((2, 16)), ["", ""], [{}, {}])
+    writer.flush()
+    # Giữ write.lock (flock theo từng file mở nên chặn được cả trong cùng process)
+    writer.upsert(["c"], rng.standard_normal((1, 16)), [""], [{}])
+
+    opened = []
+    thread = threading.Thread(target=lambda: opened.append(NumpyVectorStore(str(tmp_path), precision="int8")))
+    thread.start()
+    thread.join(0.3)
+    assert thread.is_alive()
+
+    writer.flush()
+    thread.join(10)
+    store = opened[0]
+    assert store.get_stats()['precision'] == "int8" and store._matrix.dtype == np.int8
+    assert store.count() == 3
@@ -0,0 +1,634 @@
+import json
+import os
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: không khóa giữa các process
+    fcntl = None
+
+COLLECTION_NAME = "app_guide_knowledge"
+COLLECTION_METADATA = {"description": "Knowledge base for app guidance"}
+
+VECTOR_PRECISIONS = ("float32", "float16", "int8")
+SCORE_BLOCK_ROWS = 1024  # Số hàng đổi sang float32 mỗi lần (vừa cache CPU) khi chấm điểm ma trận lượng tử hóa
+
+class VectorStoreLockedError(RuntimeError):
+    """Một process khác đang ghi vào cùng thư mục store"""
+    pass
+
+class VectorStore:
+    """
+    Interface lưu trữ vector cho KnowledgeBase
+
+    Mô phỏng phần API collection của Chroma mà KnowledgeBase dùng (get,
+    query, upsert, update, delete, count), nên các backend thay thế nhau
+    được mà không phải sửa logic ingest/search. Embedding truyền vào có thể
+    là list hoặc mảng numpy.
+    """
+
+    name = "base"
+    directory = None  # Thư mục dữ liệu của backend (metadata.json nằm cùng chỗ)
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ("documents", "metadatas"),
+            limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]],
+               documents: List[str], metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def update(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def reset(self):
+        """Xóa toàn bộ dữ liệu"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Ghi các thay đổi còn trong bộ nhớ xuống đĩa"""
+        pass
+
+    def refresh(self) -> bool:
+        """Nạp lại nếu process khác đã commit thay đổi, True nếu đã nạp lại"""
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'backend': self.name}
+
+class ChromaVectorStore(VectorStore):
+    """Backend Chroma (PersistentClient + HNSW)"""
+
+    name = "chroma"
+
+    def __init__(self, persist_directory: str, collection_name: str = COLLECTION_NAME):
+        import chromadb
+
+        self.collection_name = collection_name
+        self.directory = persist_directory
+        self.client = chromadb.PersistentClient(path=persist_directory)
+
+        try:
+            # Thử lấy collection có sẵn
+            self.collection = self.client.get_collection(collection_name)
+        except Exception:
+            try:
+                # Nếu không tồn tại, tạo mới
+                self.collection = self.client.create_collection(
+                    name=collection_name,
+                    metadata=COLLECTION_METADATA
+                )
+            except Exception:
+                # Nếu tạo mới thất bại, thử get_or_create
+                try:
+                    self.collection = self.client.get_or_create_collection(
+                        name=collection_name,
+                        metadata=COLLECTION_METADATA
+                    )
+                except Exception as final_error:
+                    print(f"Lỗi khởi tạo collection: {final_error}")
+                    raise final_error
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0):
+        kwargs = {'include': list(include)}
+        if ids is not None:
+            kwargs['ids'] = ids
+        if where is not None:
+            kwargs['where'] = where
+        if limit is not None:
+            kwargs['limit'] = limit
+        if offset:
+            kwargs['offset'] = offset
+        return self.collection.get(**kwargs)
+
+    def query(self, query_embeddings, n_results=10, where=None):
+        kwargs = {'query_embeddings': _as_lists(query_embeddings), 'n_results': n_results}
+        if where is not None:
+            kwargs['where'] = where
+        return self.collection.query(**kwargs)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(ids=ids, embeddings=_as_lists(embeddings), documents=documents, metadatas=metadatas)
+
+    def update(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def reset(self):
+        self.client.delete_collection(self.collection_name)
+        self.collection = self.client.create_collection(
+            name=self.collection_name,
+            metadata=COLLECTION_METADATA
+        )
+
+class NumpyVectorStore(VectorStore):
+    """
+    Backend tìm kiếm chính xác bằng NumPy
+
+    Embedding đã chuẩn hóa nằm liên tục trong một ma trận memory-mapped
+    (hàng [0, count) luôn dày đặc: xóa thì chuyển hàng cuối vào chỗ trống).
+    Top-k là một phép nhân ma trận + argpartition.
+    Distance = 2 - 2*cosine (bằng bình phương L2 giữa hai vector chuẩn hóa).
+    Nội dung và metadata nằm trong bộ nhớ, ghi xuống JSON khi flush().
+
+    Trên đĩa, mỗi lần flush() là một generation: các file mảng mới
+    (vectors-<n>.npy, ...) được ghi trước, rồi records.json (ghi số n) được
+    đổi tên vào chỗ cũ. Đó là điểm commit duy nhất, nên records và vector
+    luôn khớp nhau kể cả khi process chết giữa chừng. Các mảng mở theo kiểu
+    copy-on-write: thay đổi chưa flush không chạm vào file đã commit.
+
+    Chỉ một process được ghi: lần sửa đầu tiên giữ file khóa write.lock
+    (không chờ) tới lần flush() kế tiếp; process khác đang giữ thì raise
+    VectorStoreLockedError. Nếu process khác đã commit generation mới kể từ
+    lúc nạp, store được nạp lại trước khi sửa.
+
+    precision chọn kiểu lưu ma trận tìm kiếm:
+    - "float32": nguyên bản
+    - "float16": nhỏ hơn 2 lần
+    - "int8": nhỏ hơn ~4 lần, mỗi vector một scale float32 (v ≈ code * scale)
+
+    Với float16/int8, rescore_candidates > 0 giữ thêm bản float32 trong một
+    file mmap riêng: ma trận lượng tử hóa chọn ra rescore_candidates ứng viên,
+    rồi chỉ các hàng đó được đọc từ bản float32 để chấm lại điểm chính xác.
+    """
+
+    name = "numpy"
+
+    def __init__(self, directory: str, precision: str = "float32", rescore_candidates: int = 0):
+        if precision not in VECTOR_PRECISIONS:
+            raise ValueError(f"Vector precision không hợp lệ: {precision}")
+
+        self.directory = directory
+        self.precision = precision
+        self.rescore_candidates = rescore_candidates if precision != "float32" else 0
+        self.records_path = os.path.join(directory, "records.json")
+        self.lock_path = os.path.join(directory, "write.lock")
+        os.makedirs(directory, exist_ok=True)
+
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix: Optional[np.ndarray] = None  # Ma trận tìm kiếm (theo precision)
+        self._scales: Optional[np.ndarray] = None  # Scale từng hàng (chỉ int8)
+        self._full: Optional[np.ndarray] = None    # Bản float32 để rescore
+        self._columns: Dict[str, tuple] = {}  # Cache cột metadata đã mã hóa cho where
+        self._dirty = False
+        self._generation: Optional[int] = None  # None: store cũ (vectors.npy, không số)
+        self._records_stat: Optional[tuple] = None  # (inode, mtime) của records.json đã nạp
+        self._writer_lock = None
+
+        self._load()
+        if self._needs_conversion():
+            self._convert()
+
+    def _array_path(self, name: str, generation: Optional[int]) -> str:
+        suffix = f"-{generation}" if generation is not None else ""
+        return os.path.join(self.directory, f"{name}{suffix}.npy")
+
+    def _stat_records(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.records_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
+        """Nạp generation đã commit (records.json + các file mảng nó trỏ tới)"""
+        self._ids, self._documents, self._metadatas, self._rows = [], [], [], {}
+        self._matrix = self._scales = self._full = None
+        self._columns.clear()
+        self._generation = None
+        self._records_stat = self._stat_records()
+        if self._records_stat is None:
+            return
+
+        with open(self.records_path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        self._generation = records.get('generation')
+        vectors_path = self._array_path("vectors", self._generation)
+        if not records['ids'] or not os.path.exists(vectors_path):
+            return
+        self._ids = records['ids']
+        self._documents = records['documents']
+        self._metadatas = records['metadatas']
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self._matrix = np.lib.format.open_memmap(vectors_path, mode='c')
+        scales_path = self._array_path("scales", self._generation)
+        if self._matrix.dtype == np.int8 and os.path.exists(scales_path):
+            self._scales = np.lib.format.open_memmap(scales_path, mode='c')
+        full_path = self._array_path("vectors_full", self._generation)
+        if os.path.exists(full_path):
+            self._full = np.lib.format.open_memmap(full_path, mode='c')
+
+    def _acquire_writer(self, blocking: bool = False):
+        """
+        Giữ quyền ghi tới lần flush() kế tiếp
+
+        Process khác đang ghi thì raise VectorStoreLockedError, hoặc chờ nó
+        commit xong nếu blocking=True.
+        """
+        if self._writer_lock is not None:
+            return
+        lock_file = open(self.lock_path, 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if not blocking:
+                    lock_file.close()
+                    raise VectorStoreLockedError(
+                        f"Vector store {self.directory} đang được process khác ghi, thử lại sau khi nó xong"
+                    )
+                print(f"⏳ Vector store {self.directory} đang được process khác ghi, chờ...")
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+        self._writer_lock = lock_file
+
+        # Process khác có thể đã commit từ lúc nạp: sửa trên bản mới nhất
+        if not self._dirty and self._stat_records() != self._records_stat:
+            self._load()
+
+    def refresh(self) -> bool:
+        # Đang có thay đổi chưa flush thì giữ bản của mình (lần ghi sau sẽ nạp lại)
+        if self._dirty or self._writer_lock is not None or self._stat_records() == self._records_stat:
+            return False
+        self._load()
+        return True
+
+    def _release_writer(self):
+        if self._writer_lock is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._writer_lock, fcntl.LOCK_UN)
+        self._writer_lock.close()
+        self._writer_lock = None
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def _layout(self) -> List[tuple]:
+        """Các mảng của store: (thuộc tính, tên file, dtype, có chiều embedding)"""
+        layout = [('_matrix', "vectors", self.precision, True)]
+        if self.precision == "int8":
+            layout.append(('_scales', "scales", "float32", False))
+        if self.rescore_candidates:
+            layout.append(('_full', "vectors_full", "float32", True))
+        return layout
+
+    def _needs_conversion(self) -> bool:
+        """Store trên đĩa khác precision/rescore đang cấu hình"""
+        return self._matrix is not None and (
+            self._matrix.dtype != np.dtype(self.precision)
+            or (self._full is not None) != bool(self.rescore_candidates)
+        )
+
+    def _convert(self):
+        """
+        Ghi lại store theo precision/rescore hiện tại (khi đổi cấu hình)
+
+        Đọc toàn bộ vector vào RAM một lần; từ int8/float16 sang kiểu rộng hơn
+        mà không có bản float32 thì giữ nguyên sai số lượng tử hóa cũ.
+        Các worker cùng khởi động với cấu hình mới: một process chuyển đổi,
+        các process khác chờ khóa rồi nạp bản nó vừa commit.
+        """
+        self._acquire_writer(blocking=True)
+        if not self._needs_conversion():
+            print(f"✅ Vector store {self.directory} đã được process khác chuyển sang {self.precision}")
+            self._release_writer()
+            return
+        count = len(self._ids)
+        vectors = self._read_vectors(np.arange(count))
+        self._matrix = self._scales = self._full = None
+
+        self._ensure_capacity(count, vectors.shape[1])
+        self._write_vectors(np.arange(count), vectors)
+        self._dirty = True
+        self.flush()
+
+    def _ensure_capacity(self, rows: int, dimension: int):
+        """Mở rộng các mảng (gấp đôi, trong RAM tới lần flush) khi không đủ chỗ"""
+        if self._matrix is not None and self._matrix.shape[1] != dimension:
+            raise ValueError(f"Embedding dimension {dimension} khác với store ({self._matrix.shape[1]})")
+        if self._matrix is not None and self._matrix.shape[0] >= rows:
+            return
+
+        capacity = max(rows, 1024, 2 * (self._matrix.shape[0] if self._matrix is not None else 0))
+        count = len(self._ids)
+        for attribute, _, dtype, has_dimension in self._layout():
+            old = getattr(self, attribute)
+            shape = (capacity, dimension) if has_dimension else (capacity,)
+            array = np.zeros(shape, dtype=dtype)
+            if old is not None:
+                array[:count] = old[:count]
+            setattr(self, attribute, array)
+
+    def _write_vectors(self, rows: np.ndarray, vectors: np.ndarray):
+        """Ghi vector đã chuẩn hóa vào các hàng (lượng tử hóa theo precision)"""
+        if self.precision == "int8":
+            codes, scales = _quantize_int8(vectors)
+            self._matrix[rows] = codes
+            self._scales[rows] = scales
+        else:
+            self._matrix[rows] = vectors.astype(self._matrix.dtype, copy=False)
+        if self._full is not None:
+            self._full[rows] = vectors
+
+    def _read_vectors(self, rows) -> np.ndarray:
+        """Vector float32 của các hàng: bản gốc nếu có, ngược lại giải lượng tử hóa"""
+        if self._full is not None:
+            return np.asarray(self._full[rows], dtype=np.float32)
+        vectors = np.asarray(self._matrix[rows], dtype=np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if not ids:
+            return
+        self._acquire_writer()
+        vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        new_ids = [chunk_id for chunk_id in dict.fromkeys(ids) if chunk_id not in self._rows]
+        self._ensure_capacity(len(self._ids) + len(new_ids), vectors.shape[1])
+
+        rows = np.empty(len(ids), dtype=np.int64)
+        for i, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+            row = self._rows.get(chunk_id)
+            if row is None:
+                row = len(self._ids)
+                self._rows[chunk_id] = row
+                self._ids.append(chunk_id)
+                self._documents.append(document)
+                self._metadatas.append(dict(metadata or {}))
+            else:
+                self._documents[row] = document
+                self._metadatas[row] = dict(metadata or {})
+            rows[i] = row
+        self._write_vectors(rows, vectors)
+        self._columns.clear()
+        self._dirty = True
+
+    def update(self, ids, metadatas):
+        self._acquire_writer()
+        for chunk_id, metadata in zip(ids, metadatas):
+            row = self._rows.get(chunk_id)
+            if row is not None:
+                self._metadatas[row] = dict(metadata or {})
+        self._columns.clear()
+        self._dirty = True
+
+    def delete(self, ids):
+        self._acquire_writer()
+        arrays = [getattr(self, attribute) for attribute, _, _, _ in self._layout()]
+        for chunk_id in ids:
+            row = self._rows.pop(chunk_id, None)
+            if row is None:
+                continue
+            last = len(self._ids) - 1
+            if row != last:
+                # Chuyển hàng cuối vào chỗ trống để ma trận luôn liên tục
+                moved_id = self._ids[last]
+                for array in arrays:
+                    array[row] = array[last]
+                self._ids[row] = moved_id
+                self._documents[row] = self._documents[last]
+                self._metadatas[row] = self._metadatas[last]
+                self._rows[moved_id] = row
+            self._ids.pop()
+            self._documents.pop()
+            self._metadatas.pop()
+        self._columns.clear()
+        self._dirty = True
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0):
+        if ids is not None:
+            rows = [self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]
+        else:
+            rows = range(len(self._ids))
+        if where is not None:
+            mask = self._mask(where)
+            rows = [row for row in rows if mask[row]]
+        rows = list(rows)[offset:offset + limit if limit is not None else None]
+        return self._collect(rows, include)
+
+    def _similarities(self, queries: np.ndarray, candidate_rows: Optional[np.ndarray]) -> np.ndarray:
+        """Cosine (xấp xỉ nếu lượng tử hóa) giữa queries và các hàng ứng viên"""
+        count = len(self._ids)
+        if self.precision == "float32":
+            matrix = self._matrix[:count] if candidate_rows is None else self._matrix[candidate_rows]
+            return queries @ matrix.T
+
+        # Đổi sang float32 theo khối để BLAS chấm điểm mà không tạo bản sao cả ma trận
+        size = count if candidate_rows is None else len(candidate_rows)
+        similarities = np.empty((len(queries), size), dtype=np.float32)
+        for start in range(0, size, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, size)
+            rows = slice(start, end) if candidate_rows is None else candidate_rows[start:end]
+            block = similarities[:, start:end]
+            np.matmul(queries, self._matrix[rows].astype(np.float32).T, out=block)
+            if self._scales is not None:
+                block *= self._scales[rows]
+        return similarities
+
+    def query(self, query_embeddings, n_results=10, where=None):
+        queries = _normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        count = len(self._ids)
+
+        if where is not None:
+            candidate_rows = np.flatnonzero(self._mask(where))
+        else:
+            candidate_rows = None
+
+        result = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        size = count if candidate_rows is None else len(candidate_rows)
+        k = min(n_results, size)
+        if k == 0:
+            for key in result:
+                result[key] = [[] for _ in range(len(queries))]
+            return result
+
+        # Số ứng viên lấy từ ma trận tìm kiếm trước khi rescore bằng float32
+        pool = min(max(k, self.rescore_candidates), size) if self._full is not None else k
+        similarities = self._similarities(queries, candidate_rows)
+
+        for query, scores in zip(queries, similarities):
+            top = np.argpartition(-scores, pool - 1)[:pool] if pool < size else np.arange(size)
+            rows = top if candidate_rows is None else candidate_rows[top]
+            if self._full is not None:
+                order = np.argsort(rows)  # Đọc mmap theo thứ tự hàng
+                rows = rows[order]
+                scores = self._full[rows] @ query
+            else:
+                scores = scores[top]
+
+            best = np.argsort(-scores, kind="stable")[:k]
+            rows = rows[best]
+            result['ids'].append([self._ids[row] for row in rows])
+            result['documents'].append([self._documents[row] for row in rows])
+            result['metadatas'].append([self._metadatas[row] for row in rows])
+            result['distances'].append([float(2.0 - 2.0 * scores[i]) for i in best])
+        return result
+
+    def _column(self, field: str) -> tuple:
+        """Cột metadata dạng mã số nguyên: (codes, value -> code), tạo lại sau mỗi lần ghi"""
+        column = self._columns.get(field)
+        if column is None:
+            codes_by_value: Dict[Any, int] = {}
+            codes = np.fromiter(
+                (codes_by_value.setdefault(metadata.get(field), len(codes_by_value)) for metadata in self._metadatas),
+                dtype=np.int32,
+                count=len(self._metadatas)
+            )
+            column = (codes, codes_by_value)
+            self._columns[field] = column
+        return column
+
+    def _mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Bộ lọc metadata kiểu Chroma: {"field": value}, $eq/$ne/$in/$nin, $and/$or"""
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._mask(clause)
+                continue
+            if key == "$or":
+                any_mask = np.zeros(len(self._ids), dtype=bool)
+                for clause in condition:
+                    any_mask |= self._mask(clause)
+                mask &= any_mask
+                continue
+
+            codes, codes_by_value = self._column(key)
+            operators = condition if isinstance(condition, dict) else {"$eq": condition}
+            for operator, operand in operators.items():
+                values = operand if operator in ("$in", "$nin") else [operand]
+                matched = np.isin(codes, [codes_by_value[v] for v in values if v in codes_by_value])
+                if operator in ("$eq", "$in"):
+                    mask &= matched
+                elif operator in ("$ne", "$nin"):
+                    mask &= ~matched
+                else:
+                    raise ValueError(f"Toán tử where không hỗ trợ: {operator}")
+        return mask
+
+    def _collect(self, rows: List[int], include: Sequence[str]) -> Dict[str, Any]:
+        result = {'ids': [self._ids[row] for row in rows]}
+        if "documents" in include:
+            result['documents'] = [self._documents[row] for row in rows]
+        if "metadatas" in include:
+            result['metadatas'] = [self._metadatas[row] for row in rows]
+        if "embeddings" in include:
+            result['embeddings'] = self._read_vectors(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+        return result
+
+    def reset(self):
+        self._acquire_writer()
+        self._ids, self._documents, self._metadatas, self._rows = [], [], [], {}
+        self._matrix = self._scales = self._full = None
+        self._columns.clear()
+        self._dirty = True
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        count = len(self._ids)
+        index_bytes = self._matrix[:count].nbytes if self._matrix is not None else 0
+        if self._scales is not None:
+            index_bytes += self._scales[:count].nbytes
+        return {
+            'backend': self.name,
+            'precision': self.precision,
+            'rescore_candidates': self.rescore_candidates,
+            'index_mb': round(index_bytes / (1024 * 1024), 2),
+            'rescore_mb': round(self._full[:count].nbytes / (1024 * 1024), 2) if self._full is not None else 0
+        }
+
+    def flush(self):
+        """Commit một generation mới: ghi các mảng, rồi đổi tên records.json, rồi trả quyền ghi"""
+        if not self._dirty:
+            self._release_writer()
+            return
+
+        count = len(self._ids)
+        old_generation = self._generation
+        generation = (old_generation or 0) + 1
+        layout = self._layout() if count and self._matrix is not None else []
+        for attribute, name, _, _ in layout:
+            _write_atomic(self._array_path(name, generation),
+                          lambda f, array=getattr(self, attribute): np.save(f, array[:count]))
+        _write_atomic(self.records_path, lambda f: f.write(json.dumps({
+            'generation': generation,
+            'ids': self._ids,
+            'documents': self._documents,
+            'metadatas': self._metadatas
+        }, ensure_ascii=False).encode('utf-8')))
+
+        # Đã commit: mở lại mảng từ file mới (trả RAM về page cache), bỏ generation cũ
+        self._generation = generation
+        self._records_stat = self._stat_records()
+        for attribute, name, _, _ in layout:
+            setattr(self, attribute, np.lib.format.open_memmap(self._array_path(name, generation), mode='c'))
+        for name in ("vectors", "scales", "vectors_full"):
+            try:
+                os.remove(self._array_path(name, old_generation))
+            except OSError:
+                pass  # Không có, hoặc (Windows) process khác còn đang mmap
+        self._dirty = False
+        self._release_writer()
+
+def _write_atomic(path: str, write):
+    """Ghi file tạm + fsync rồi đổi tên vào path"""
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def _quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Lượng tử hóa đối xứng theo từng vector: code = round(v / scale), scale = max|v| / 127"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def _as_lists(embeddings) -> List[List[float]]:
+    return embeddings.tolist() if isinstance(embeddings, np.ndarray) else embeddings
+
+def create_vector_store(backend: str, persist_directory: str, precision: str = "float32",
+                        rescore_candidates: int = 0) -> VectorStore:
+    """
+    Tạo vector store theo tên backend ("chroma" hoặc "numpy")
+
+    precision/rescore_candidates chỉ áp dụng cho backend numpy.
+    """
+    if backend == "numpy":
+        return NumpyVectorStore(
+            os.path.join(persist_directory, "numpy_store"),
+            precision=precision,
+            rescore_candidates=rescore_candidates
+        )
+    if backend == "chroma":
+        return ChromaVectorStore(persist_directory)
+    raise ValueError(f"Vector backend không hợp lệ: {backend}")